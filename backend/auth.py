@@ -1,11 +1,14 @@
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import User
 from schemas import TokenData
 import os
@@ -16,6 +19,8 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
 
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
@@ -36,7 +41,81 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+class UserCache:
+    # Bounded LRU of authenticated users keyed by token subject (email), so
+    # repeated requests with the same token skip the user query. Entries
+    # expire after `ttl` seconds, which also bounds how long other workers
+    # can serve a user changed elsewhere; changes made through this process's
+    # ORM invalidate immediately (see the listeners below).
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, User]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, subject: str) -> Optional[User]:
+        entry = self.entries.get(subject)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self.entries[subject]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(subject)
+        self.hits += 1
+        return user
+
+    def put(self, subject: str, user: User):
+        self.entries[subject] = (time.monotonic() + self.ttl, user)
+        self.entries.move_to_end(subject)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, subject: str):
+        if self.entries.pop(subject, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+user_cache = UserCache()
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    # Also drops the old subject when the email itself changed
+    old_emails = inspect(target).attrs.email.history.deleted or ()
+    for email in {target.email, *old_emails}:
+        if email:
+            user_cache.invalidate(email)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    return await authenticate_token(token, db)
+
+async def authenticate_token(token: str, db: AsyncSession) -> User:
+    # Shared by HTTP routes (get_current_user) and WebSocket endpoints
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -46,12 +125,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         role: str = payload.get("role")
+        user_id: Optional[str] = payload.get("uid")
         if email is None:
             raise credentials_exception
         token_data = TokenData(email=email, role=role)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = user_cache.get(token_data.email)
+    if user is not None:
+        return user
+    # Tokens issued with the user ID are looked up by primary key
+    if user_id is not None:
+        user = await db.get(User, user_id)
+        if user is not None and user.email != token_data.email:
+            user = None
+    else:
+        user = await db.scalar(select(User).where(User.email == token_data.email))
     if user is None:
         raise credentials_exception
+    user_cache.put(token_data.email, user)
     return user
@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Backend benchmarks. Runs the app in-process against a throwaway SQLite
+# database unless POSTGRES_URL is already set.
+
+def setup_database():
+    if "POSTGRES_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        os.environ["POSTGRES_URL"] = f"sqlite:///{path}"
+        print(f"Using temporary database {path}")
+
+def make_client():
+    from fastapi.testclient import TestClient
+    import main
+    return TestClient(main.app)
+
+def login(client, role="driver"):
+    email = f"bench_{role}_{time.time_ns()}@example.com"
+    res = client.post("/auth/register", json={"email": email, "password": "password123", "name": "Bench", "role": role})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+def sample(i):
+    return {"fatigue_score": float(i % 100), "emotion": "neutral", "drowsy_status": i % 10 == 0}
+
+def bench_ingest(args):
+    setup_database()
+    client = make_client()
+    headers = login(client)
+
+    start = time.perf_counter()
+    for i in range(args.rows):
+        client.post("/logs/upload", json=sample(i), headers=headers).raise_for_status()
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in range(0, args.rows, args.batch_size):
+        logs = [sample(i) for i in range(offset, min(offset + args.batch_size, args.rows))]
+        client.post("/logs/upload/batch", json={"logs": logs}, headers=headers).raise_for_status()
+    batch_s = time.perf_counter() - start
+
+    print(f"Log ingestion ({args.rows} rows, batch size {args.batch_size})")
+    print(f"  /logs/upload       : {args.rows / single_s:10.0f} rows/s")
+    print(f"  /logs/upload/batch : {args.rows / batch_s:10.0f} rows/s ({single_s / batch_s:.1f}x)")
+
+class FakeWebSocket:
+    # Stand-in client socket: records delivery latency, optionally slow
+    def __init__(self, latencies, delay=0.0):
+        self.latencies = latencies
+        self.delay = delay
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        sent_at = float(message.split(",", 1)[0])
+        self.latencies.append(time.perf_counter() - sent_at)
+
+async def _fanout(args):
+    from realtime import ConnectionManager
+    manager = ConnectionManager()
+    latencies = []
+    drivers = [f"driver-{i}" for i in range(args.drivers)]
+    for i in range(args.sockets):
+        slow = i < args.slow
+        ws = FakeWebSocket([] if slow else latencies, delay=1.0 if slow else 0.0)
+        await manager.connect(ws, [drivers[i % args.drivers]])
+
+    start = time.perf_counter()
+    for n in range(args.messages):
+        for driver_id in drivers:
+            await manager.broadcast(f"{time.perf_counter()},{driver_id},{n}", driver_id=driver_id)
+        await asyncio.sleep(args.interval)
+    expected = (args.sockets - args.slow) * args.messages
+    while len(latencies) < expected and time.perf_counter() - start < 30:
+        await asyncio.sleep(0.01)
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+    print(f"WebSocket fan-out ({args.sockets} sockets, {args.drivers} drivers, {args.slow} slow, {args.messages} rounds)")
+    print(f"  delivered : {len(latencies)}/{expected}")
+    print(f"  latency   : p50 {pct(50):.2f} ms, p95 {pct(95):.2f} ms, p99 {pct(99):.2f} ms")
+    print(f"  evicted   : {manager.evicted}")
+
+def bench_fanout(args):
+    # In-process sockets: measures the manager's routing/queueing cost, not the network
+    asyncio.run(_fanout(args))
+
+class AsgiWebSocket:
+    # Minimal ASGI WebSocket client driving the app's /ws/live-status
+    # endpoint directly, on the same event loop as the HTTP requests
+    def __init__(self, app, latencies):
+        self.app = app
+        self.latencies = latencies
+        self.incoming = asyncio.Queue()
+        self.received = 0
+
+    async def run(self):
+        scope = {"type": "websocket", "path": "/ws/live-status", "raw_path": b"/ws/live-status",
+                 "query_string": b"", "headers": [], "scheme": "ws", "server": ("bench", 80),
+                 "client": ("bench", 0), "subprotocols": [], "asgi": {"version": "3.0"}}
+        await self.incoming.put({"type": "websocket.connect"})
+        await self.app(scope, self.incoming.get, self.send)
+
+    async def send(self, event):
+        if event["type"] == "websocket.send":
+            sent_at = json.loads(event["text"])["timestamp"]
+            self.latencies.append((datetime.now() - datetime.fromisoformat(sent_at)).total_seconds())
+            self.received += 1
+
+    async def close(self):
+        await self.incoming.put({"type": "websocket.disconnect", "code": 1000})
+
+async def _mixed(args):
+    import httpx
+    import main
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        headers = []
+        for _ in range(args.drivers):
+            res = await client.post("/auth/register", json={"email": f"bench_{time.time_ns()}@example.com",
+                                    "password": "password123", "name": "Bench", "role": "driver"})
+            res.raise_for_status()
+            headers.append({"Authorization": f"Bearer {res.json()['access_token']}"})
+
+        ws_latencies = []
+        sockets = [AsgiWebSocket(main.app, ws_latencies) for _ in range(args.sockets)]
+        ws_tasks = [asyncio.create_task(ws.run()) for ws in sockets]
+        await asyncio.sleep(0.1)
+
+        upload_latencies = []
+        history_latencies = []
+        deadline = time.perf_counter() + args.duration
+
+        async def uploader(h):
+            i = 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                (await client.post("/logs/upload", json=sample(i), headers=h)).raise_for_status()
+                upload_latencies.append(time.perf_counter() - start)
+                i += 1
+
+        async def reader(h):
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                (await client.get("/logs/history", headers=h)).raise_for_status()
+                history_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.1)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(uploader(headers[i % len(headers)]) for i in range(args.concurrency)),
+                             *(reader(h) for h in headers[:args.readers]))
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.2)
+        for ws in sockets:
+            await ws.close()
+        await asyncio.gather(*ws_tasks, return_exceptions=True)
+
+    def pct(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float("nan")
+
+    requests = len(upload_latencies) + len(history_latencies)
+    print(f"Mixed load ({args.concurrency} uploaders, {args.readers} history readers, {args.sockets} WebSockets, {args.duration:.0f}s)")
+    print(f"  requests/s    : {requests / elapsed:10.0f} ({len(upload_latencies)} uploads, {len(history_latencies)} history)")
+    print(f"  upload        : p50 {pct(upload_latencies, 50):.1f} ms, p99 {pct(upload_latencies, 99):.1f} ms")
+    print(f"  history       : p50 {pct(history_latencies, 50):.1f} ms, p99 {pct(history_latencies, 99):.1f} ms")
+    print(f"  ws delivered  : {len(ws_latencies)}, {len(ws_latencies) / elapsed:.0f} msg/s")
+    print(f"  ws latency    : p50 {pct(ws_latencies, 50):.1f} ms, p99 {pct(ws_latencies, 99):.1f} ms")
+
+def bench_mixed(args):
+    # HTTP and WebSocket clients share the app's event loop, so any blocking
+    # database call shows up directly as WebSocket latency
+    setup_database()
+    for name in ("httpx", "realtime"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    asyncio.run(_mixed(args))
+
+def bench_history(args):
+    # Seeds --rows logs spread over --drivers drivers at 1 Hz, then times the
+    # /logs/history queries directly against the database
+    import random
+    from sqlalchemy import insert, select, func, text
+    setup_database()
+    import history
+    import migrate
+    from database import engine
+    from models import Log, User
+
+    migrate.upgrade(engine)
+    with engine.begin() as conn:
+        drivers = [r[0] for r in conn.execute(select(User.id).where(User.email.like("bench_history_%")))]
+        existing = conn.execute(select(func.count()).select_from(Log)).scalar()
+        if len(drivers) < args.drivers:
+            new = [{"email": f"bench_history_{time.time_ns()}_{i}@example.com", "name": "Bench", "role": "driver"}
+                   for i in range(args.drivers - len(drivers))]
+            conn.execute(insert(User), new)
+            drivers = [r[0] for r in conn.execute(select(User.id).where(User.email.like("bench_history_%")))]
+    drivers = drivers[:args.drivers]
+
+    start_ts = datetime(2025, 1, 1)
+    if existing < args.rows:
+        print(f"Seeding {args.rows - existing} logs...")
+        seed_start = time.perf_counter()
+        chunk = 50000
+        with engine.begin() as conn:
+            for offset in range(existing, args.rows, chunk):
+                conn.execute(insert(Log), [
+                    {"driver_id": drivers[i % len(drivers)],
+                     "timestamp": start_ts + timedelta(seconds=i // len(drivers)),
+                     "fatigue_score": float(i % 100), "emotion": "neutral", "drowsy_status": i % 10 == 0}
+                    for i in range(offset, min(offset + chunk, args.rows))
+                ])
+        print(f"  {args.rows - existing} rows in {time.perf_counter() - seed_start:.0f}s")
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                conn.execute(text("ANALYZE"))
+
+    if args.no_driver_index:
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_logs_driver_timestamp"))
+
+    span = timedelta(seconds=args.rows // len(drivers))
+    rng = random.Random(0)
+    fields = ("timestamp", "fatigue_score", "drowsy_status")
+
+    def run(name, make_query):
+        latencies = []
+        with engine.connect() as conn:
+            for _ in range(args.queries):
+                query = make_query()
+                start = time.perf_counter()
+                conn.execute(query).all()
+                latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000
+        print(f"  {name:<28}: p50 {pct(50):7.2f} ms, p99 {pct(99):7.2f} ms")
+
+    def random_time():
+        return start_ts + span * rng.random()
+
+    print(f"History queries ({args.rows} rows, {len(drivers)} drivers, page size {args.limit}, {args.queries} queries each)")
+    run("driver latest page", lambda: history.page_query(
+        fields, rng.choice(drivers), None, None, None, True, args.limit))
+    run("driver 1h range", lambda: history.page_query(
+        fields, rng.choice(drivers), (t := random_time()), t + timedelta(hours=1), None, False, args.limit))
+    run("driver deep cursor page", lambda: history.page_query(
+        fields, rng.choice(drivers), None, None, (random_time(), 0), False, args.limit))
+    run("all drivers latest page", lambda: history.page_query(
+        fields, None, None, None, None, True, args.limit))
+
+    if args.no_driver_index:
+        with engine.begin() as conn:
+            migrate.driver_index(conn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DriveBy.AI backend benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("ingest", help="Single-row vs batch log upload throughput")
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--batch-size", type=int, default=100)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("fanout", help="WebSocket fan-out latency with topic routing")
+    p.add_argument("--sockets", type=int, default=1000)
+    p.add_argument("--drivers", type=int, default=100)
+    p.add_argument("--slow", type=int, default=10, help="Clients that take 1s per message")
+    p.add_argument("--messages", type=int, default=100, help="Messages per driver")
+    p.add_argument("--interval", type=float, default=0.01)
+    p.set_defaults(func=bench_fanout)
+
+    p = sub.add_parser("mixed", help="Requests/s and WebSocket latency under concurrent uploads")
+    p.add_argument("--concurrency", type=int, default=20, help="Concurrent /logs/upload clients")
+    p.add_argument("--readers", type=int, default=2, help="Concurrent /logs/history clients")
+    p.add_argument("--sockets", type=int, default=50)
+    p.add_argument("--drivers", type=int, default=5)
+    p.add_argument("--duration", type=float, default=10.0)
+    p.set_defaults(func=bench_mixed)
+
+    p = sub.add_parser("history", help="History query latency on a large logs table")
+    p.add_argument("--rows", type=int, default=10_000_000)
+    p.add_argument("--drivers", type=int, default=100)
+    p.add_argument("--limit", type=int, default=100, help="Page size")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--no-driver-index", action="store_true", help="Drop the (driver_id, timestamp) index for comparison")
+    p.set_defaults(func=bench_history)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
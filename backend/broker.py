@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub bus behind ConnectionManager.broadcast. Every backend worker
+# publishes live-status messages to the bus and receives all of them back,
+# then fans them out to its own WebSocket clients. This way, a log posted
+# to one worker reaches dashboards connected to any other worker or replica.
+#
+#   BROKER_URL unset / memory://       single process (default)
+#   redis://host:6379/0                Redis pub/sub (needs the redis package)
+#   unix:///tmp/driveby.sock           local hub started with `python broker.py <url>`
+#   tcp://host:7000                    same hub over TCP, for several nodes
+
+Deliver = Callable[[str, str], Awaitable[None]]
+
+
+class Broker(ABC):
+    def __init__(self):
+        self.deliver: Optional[Deliver] = None
+
+    def attach(self, deliver: Deliver):
+        self.deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, topic: str, message: str):
+        ...
+
+
+class InProcessBroker(Broker):
+    async def publish(self, topic: str, message: str):
+        await self.deliver(topic, message)
+
+
+class RedisBroker(Broker):
+    # The pubsub connection is re-subscribed with backoff if it drops, like
+    # SocketBroker; publishes go through the client's own connection pool.
+    CHANNEL_PREFIX = "driveby:live:"
+
+    def __init__(self, url: str, max_backoff: float = 10.0):
+        super().__init__()
+        self.url = url
+        self.max_backoff = max_backoff
+        self.redis = None
+        self.listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("BROKER_URL is a redis:// URL but the 'redis' package is not installed")
+        self.redis = aioredis.from_url(self.url)
+        self.listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        backoff = 0.5
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(self.CHANNEL_PREFIX + "*")
+                backoff = 0.5
+                logger.info(f"Subscribed to broker {self.url}")
+                async for item in pubsub.listen():
+                    if item["type"] != "pmessage":
+                        continue
+                    topic = item["channel"].decode()[len(self.CHANNEL_PREFIX):]
+                    await self.deliver(topic, item["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Broker connection error: {e}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(backoff)
+            backoff = min(self.max_backoff, backoff * 2)
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+        if self.redis:
+            await self.redis.aclose()
+
+    async def publish(self, topic: str, message: str):
+        if self.redis is None:
+            # Not started (e.g. scripts using the app without its lifespan)
+            await self.deliver(topic, message)
+            return
+        await self.redis.publish(self.CHANNEL_PREFIX + topic, message)
+
+
+async def open_connection(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return await asyncio.open_unix_connection(parsed.path)
+    return await asyncio.open_connection(parsed.hostname, parsed.port)
+
+
+class SocketBroker(Broker):
+    # Client of the hub below. Frames are newline-delimited JSON
+    # {"topic": ..., "message": ...}; the hub echoes every frame to every
+    # worker, including the sender. While the hub is unreachable, messages
+    # are delivered locally, so a single worker keeps working.
+    def __init__(self, url: str, max_backoff: float = 10.0):
+        super().__init__()
+        self.url = url
+        self.max_backoff = max_backoff
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        backoff = 0.5
+        while True:
+            try:
+                reader, writer = await open_connection(self.url)
+                self.writer = writer
+                backoff = 0.5
+                logger.info(f"Connected to broker {self.url}")
+                while line := await reader.readline():
+                    frame = json.loads(line)
+                    await self.deliver(frame["topic"], frame["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Broker connection error: {e}")
+            self.writer = None
+            await asyncio.sleep(backoff)
+            backoff = min(self.max_backoff, backoff * 2)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.writer:
+            self.writer.close()
+
+    async def publish(self, topic: str, message: str):
+        writer = self.writer
+        if writer is None or writer.is_closing():
+            await self.deliver(topic, message)
+            return
+        writer.write((json.dumps({"topic": topic, "message": message}) + "\n").encode())
+        await writer.drain()
+
+
+def create_broker(url: Optional[str] = None) -> Broker:
+    if not url or url.startswith("memory://"):
+        return InProcessBroker()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBroker(url)
+    if url.startswith(("unix://", "tcp://")):
+        return SocketBroker(url)
+    raise ValueError(f"Unsupported BROKER_URL: {url}")
+
+
+async def serve_hub(url: str):
+    # Minimal relay: every frame received from one worker is written to all
+    parsed = urlparse(url)
+    clients: set[asyncio.StreamWriter] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        clients.add(writer)
+        logger.info(f"Worker connected. Total: {len(clients)}")
+        try:
+            while line := await reader.readline():
+                for client in list(clients):
+                    try:
+                        client.write(line)
+                    except Exception:
+                        clients.discard(client)
+                await asyncio.gather(*(c.drain() for c in list(clients)), return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+            logger.info(f"Worker disconnected. Total: {len(clients)}")
+
+    if parsed.scheme == "unix":
+        if os.path.exists(parsed.path):
+            os.remove(parsed.path)
+        server = await asyncio.start_unix_server(handle, parsed.path)
+    else:
+        server = await asyncio.start_server(handle, parsed.hostname, parsed.port)
+    logger.info(f"Broker hub listening on {url}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve_hub(sys.argv[1] if len(sys.argv) > 1 else "unix:///tmp/driveby.sock"))
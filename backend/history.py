@@ -0,0 +1,124 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Log
+
+# Keyset pagination over the logs table. Rows are ordered by (timestamp, id)
+# -- id only breaks ties between samples with the same timestamp -- within a
+# driver (driver_id = ?) or across all drivers, and a page continues from the
+# key of the previous page's last row, so every page costs the same however
+# deep it is. Per-driver pages walk the (driver_id, timestamp) index.
+
+FIELDS = ("id", "driver_id", "timestamp", "fatigue_score", "emotion", "drowsy_status")
+KEY_FIELDS = ("timestamp", "id")
+MAX_LIMIT = 5000
+EXPORT_PAGE_SIZE = 1000
+
+
+class HistoryQueryError(ValueError):
+    pass
+
+
+def parse_fields(fields: Optional[str]) -> tuple[str, ...]:
+    if not fields:
+        return FIELDS
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in selected if f not in FIELDS]
+    if unknown or not selected:
+        raise HistoryQueryError(f"Unknown fields: {', '.join(unknown) or fields}. Allowed: {', '.join(FIELDS)}")
+    return selected
+
+
+def encode_cursor(row) -> str:
+    key = [row.timestamp.isoformat(), row.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, log_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(timestamp), log_id
+    except (ValueError, TypeError):
+        raise HistoryQueryError("Invalid cursor")
+
+
+def page_query(fields: tuple[str, ...], driver_id: Optional[str], since: Optional[datetime],
+               until: Optional[datetime], after: Optional[tuple], descending: bool, limit: int):
+    # Key columns are always selected so the next cursor can be built
+    columns = list(dict.fromkeys(fields + KEY_FIELDS))
+    key = tuple_(*(getattr(Log, f) for f in KEY_FIELDS))
+    query = select(*(getattr(Log, f) for f in columns))
+    if driver_id is not None:
+        query = query.where(Log.driver_id == driver_id)
+    if since is not None:
+        query = query.where(Log.timestamp >= since)
+    if until is not None:
+        query = query.where(Log.timestamp < until)
+    if after is not None:
+        query = query.where(key < tuple_(*after) if descending else key > tuple_(*after))
+    order = [getattr(Log, f).desc() if descending else getattr(Log, f) for f in KEY_FIELDS]
+    return query.order_by(*order).limit(limit)
+
+
+async def fetch_page(db: AsyncSession, fields, driver_id, since, until, after, descending, limit):
+    # Returns (rows, next_cursor); next_cursor is None on the last page
+    rows = (await db.execute(page_query(fields, driver_id, since, until, after, descending, limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def row_to_dict(row, fields) -> dict:
+    record = {f: getattr(row, f) for f in fields}
+    if "timestamp" in record:
+        record["timestamp"] = record["timestamp"].isoformat()
+    return record
+
+
+async def export_rows(session_factory, fields, driver_id, since, until, after, descending,
+                      limit: Optional[int]) -> AsyncIterator:
+    # Walks the whole range page by page with its own session, since the
+    # response body is streamed after the request's session has closed
+    remaining = limit
+    async with session_factory() as db:
+        while remaining is None or remaining > 0:
+            size = EXPORT_PAGE_SIZE if remaining is None else min(EXPORT_PAGE_SIZE, remaining)
+            rows = (await db.execute(page_query(fields, driver_id, since, until, after, descending, size))).all()
+            for row in rows:
+                yield row
+            if len(rows) < size:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+            last = rows[-1]
+            after = (last.timestamp, last.id)
+
+
+async def ndjson_stream(rows: AsyncIterator, fields) -> AsyncIterator[str]:
+    chunk = []
+    async for row in rows:
+        chunk.append(json.dumps(row_to_dict(row, fields)) + "\n")
+        if len(chunk) >= EXPORT_PAGE_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    yield "".join(chunk)
+
+
+async def csv_stream(rows: AsyncIterator, fields) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for row in rows:
+        writer.writerow(row_to_dict(row, fields).values())
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
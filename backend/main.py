@@ -1,14 +1,27 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from database import engine, Base, get_db
-from models import User, Log
-from schemas import UserCreate, UserLogin, LogCreate, LogResponse, Token
-from auth import get_password_hash, verify_password, create_access_token, get_current_user
-from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, async_engine, AsyncSessionLocal, Base, get_async_db
+from models import User, Log, Event
+from schemas import (UserCreate, UserLogin, LogCreate, LogResponse, LogBatch, LogBatchResult, Token, AnalyticsSummary,
+                     EventBatch, EventResponse, EventKind)
+from auth import get_password_hash, verify_password, create_access_token, get_current_user, authenticate_token, user_cache
+from realtime import ConnectionManager
+from broker import create_broker
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 import uvicorn
 import json
 import logging
+import os
+from typing import Literal, Optional
+import history
+import migrate
+import rollups
+import telemetry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,8 +29,19 @@ logger = logging.getLogger(__name__)
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+if pending_migrations := migrate.pending(engine):
+    logger.warning(f"Database schema is out of date ({', '.join(pending_migrations)}); run `python migrate.py upgrade`")
 
-app = FastAPI(title="DriveBy.AI", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    await telemetry_writer.start()
+    yield
+    await telemetry_writer.stop()
+    await manager.stop()
+    await async_engine.dispose()
+
+app = FastAPI(title="DriveBy.AI", version="1.0.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -26,46 +50,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# WebSocket Manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"Client connected. Total: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            logger.info(f"Client disconnected. Total: {len(self.active_connections)}")
-
-    async def broadcast(self, message: str):
-        to_remove = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                logger.error(f"Failed to send message: {e}")
-                to_remove.append(connection)
-        
-        for conn in to_remove:
-            self.disconnect(conn)
-
-manager = ConnectionManager() # Global instance
+# WebSocket Manager; BROKER_URL shares live status across workers/replicas
+manager = ConnectionManager(broker=create_broker(os.getenv("BROKER_URL"))) # Global instance
+
+# Batched writer for the /ws/telemetry uplink
+telemetry_writer = telemetry.TelemetryWriter(AsyncSessionLocal)
+
+def to_utc_naive(ts: datetime) -> datetime:
+    # Log timestamps are stored as naive UTC (datetime.utcnow)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
 
 # Routes
+# All routes use the async session (database.get_async_db) so no query blocks
+# WebSocket traffic; password hashing is CPU-bound and runs in the threadpool.
 
 @app.post("/auth/register", response_model=Token)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await run_in_threadpool(get_password_hash, user.password)
     new_user = User(
         email=user.email,
         name=user.name,
@@ -73,64 +83,259 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         role=user.role
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
-    access_token = create_access_token(data={"sub": new_user.email, "role": new_user.role})
+    access_token = create_access_token(data={"sub": new_user.email, "role": new_user.role, "uid": new_user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/auth/login", response_model=Token)
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
+    if not db_user or not await run_in_threadpool(verify_password, user.password, db_user.password_hash):
         raise HTTPException(status_code=400, detail="Invalid credentials")
     
-    access_token = create_access_token(data={"sub": db_user.email, "role": db_user.role})
+    access_token = create_access_token(data={"sub": db_user.email, "role": db_user.role, "uid": db_user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/logs/upload", response_model=LogResponse)
-async def upload_log(log: LogCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def upload_log(log: LogCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     if current_user.role != "driver":
         raise HTTPException(status_code=403, detail="Only drivers can upload logs")
     
     new_log = Log(
         driver_id=current_user.id,
+        timestamp=datetime.utcnow(),
         fatigue_score=log.fatigue_score,
         emotion=log.emotion,
         drowsy_status=log.drowsy_status
     )
     db.add(new_log)
-    db.commit()
-    db.refresh(new_log)
+    await rollups.record(db, [{
+        "driver_id": new_log.driver_id,
+        "timestamp": new_log.timestamp,
+        "fatigue_score": new_log.fatigue_score,
+        "emotion": new_log.emotion,
+        "drowsy_status": new_log.drowsy_status,
+    }])
+    await db.commit()
     
     # Broadcast to websocket
     await manager.broadcast(json.dumps({
+        "driver_id": current_user.id,
         "fatigue_score": log.fatigue_score,
         "emotion": log.emotion,
         "drowsy_status": log.drowsy_status,
         "timestamp": datetime.now().isoformat()
-    }))
+    }), driver_id=current_user.id)
     
     return new_log
 
+@app.post("/logs/upload/batch", response_model=LogBatchResult)
+async def upload_log_batch(batch: LogBatch, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # One auth check, one multi-row INSERT and one commit for the whole batch
+    if current_user.role != "driver":
+        raise HTTPException(status_code=403, detail="Only drivers can upload logs")
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "driver_id": current_user.id,
+            "timestamp": to_utc_naive(sample.timestamp) if sample.timestamp else now,
+            "fatigue_score": sample.fatigue_score,
+            "emotion": sample.emotion,
+            "drowsy_status": sample.drowsy_status,
+            "duration": sample.duration,
+            "drowsy_seconds": sample.drowsy_seconds,
+        }
+        for sample in batch.logs
+    ]
+    await db.execute(insert(Log), rows)
+    await rollups.record(db, rows)
+    await db.commit()
+
+    # Broadcast a single aggregate: latest sample (same fields as /logs/upload) + batch summary
+    latest = batch.logs[max(range(len(rows)), key=lambda i: rows[i]["timestamp"])]
+    await manager.broadcast(json.dumps({
+        "driver_id": current_user.id,
+        "fatigue_score": latest.fatigue_score,
+        "emotion": latest.emotion,
+        "drowsy_status": latest.drowsy_status,
+        "timestamp": datetime.now().isoformat(),
+        "count": len(rows),
+        "max_fatigue_score": max(s.fatigue_score for s in batch.logs),
+        "drowsy_any": any(s.drowsy_status for s in batch.logs),
+    }), driver_id=current_user.id)
+
+    return {"inserted": len(rows)}
+
 @app.get("/logs/history", response_model=list[LogResponse])
-def get_history(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Drivers see their own logs, Family sees all (or specific driver if implemented)
+async def get_history(
+    request: Request,
+    driver_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=history.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "asc",
+    fields: Optional[str] = None,
+    format: Literal["json", "ndjson", "csv"] = "json",
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Drivers see their own logs, Family sees all (or ?driver_id=...).
+    # JSON returns one page; the next page's cursor is in the X-Next-Cursor
+    # header. ndjson/csv stream the whole range (up to ?limit= if given).
+    if current_user.role == "driver":
+        driver_id = current_user.id
+    try:
+        selected = history.parse_fields(fields)
+        after = history.decode_cursor(cursor) if cursor else None
+    except history.HistoryQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    since = to_utc_naive(since) if since else None
+    until = to_utc_naive(until) if until else None
+    descending = order == "desc"
+
+    if format != "json":
+        export_limit = limit if "limit" in request.query_params else None
+        rows = history.export_rows(AsyncSessionLocal, selected, driver_id, since, until, after, descending, export_limit)
+        if format == "csv":
+            return StreamingResponse(history.csv_stream(rows, selected), media_type="text/csv",
+                                     headers={"Content-Disposition": 'attachment; filename="logs.csv"'})
+        return StreamingResponse(history.ndjson_stream(rows, selected), media_type="application/x-ndjson")
+
+    rows, next_cursor = await history.fetch_page(db, selected, driver_id, since, until, after, descending, limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse([history.row_to_dict(row, selected) for row in rows], headers=headers)
+
+@app.post("/events/batch", response_model=LogBatchResult)
+async def upload_events(batch: EventBatch, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # Stored and pushed to live dashboards as soon as they arrive
+    if current_user.role != "driver":
+        raise HTTPException(status_code=403, detail="Only drivers can upload events")
+
+    rows = [
+        dict(event.model_dump(), driver_id=current_user.id, timestamp=to_utc_naive(event.timestamp))
+        for event in batch.events
+    ]
+    await db.execute(insert(Event), rows)
+    await db.commit()
+
+    for row in rows:
+        await manager.broadcast(json.dumps(dict(row, type="event", timestamp=row["timestamp"].isoformat())),
+                                driver_id=current_user.id)
+    return {"inserted": len(rows)}
+
+@app.get("/events", response_model=list[EventResponse])
+async def get_events(
+    driver_id: Optional[str] = None,
+    kind: Optional[EventKind] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=history.MAX_LIMIT),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Newest first. Drivers see their own events, Family sees all (or ?driver_id=...)
     if current_user.role == "driver":
-        return db.query(Log).filter(Log.driver_id == current_user.id).all()
+        driver_id = current_user.id
+    query = select(Event)
+    if driver_id is not None:
+        query = query.where(Event.driver_id == driver_id)
+    if kind is not None:
+        query = query.where(Event.kind == kind)
+    if since is not None:
+        query = query.where(Event.timestamp >= to_utc_naive(since))
+    if until is not None:
+        query = query.where(Event.timestamp < to_utc_naive(until))
+    return (await db.scalars(query.order_by(Event.timestamp.desc(), Event.id.desc()).limit(limit))).all()
+
+@app.get("/analytics/summary", response_model=AnalyticsSummary)
+async def analytics_summary(
+    driver_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    resolution: Literal["auto", "minute", "hour"] = "auto",
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Served from the minute/hour rollups, never from raw logs. Defaults to
+    # the last 7 days; "auto" picks minutes up to one day, hours beyond.
+    if current_user.role == "driver":
+        driver_id = current_user.id
+    until = to_utc_naive(until) if until else datetime.utcnow()
+    since = to_utc_naive(since) if since else until - timedelta(days=7)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if resolution == "auto":
+        period = rollups.choose_period(since, until)
     else:
-        return db.query(Log).all()
+        period = rollups.MINUTE if resolution == "minute" else rollups.HOUR
+
+    rows = await db.scalars(rollups.summary_query(period, rollups.bucket_start(since, period), until, driver_id))
+    points = rollups.merge_buckets(rows)
+    return {
+        "resolution": "minute" if period == rollups.MINUTE else "hour",
+        "since": since,
+        "until": until,
+        "totals": rollups.totals(points),
+        "points": points,
+    }
+
+@app.get("/metrics")
+def metrics():
+    # Per-worker counters
+    return {"auth_cache": user_cache.stats(), "telemetry": telemetry_writer.stats()}
 
 @app.websocket("/ws/live-status")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, drivers: Optional[str] = None):
+    # ?drivers=id1,id2 limits updates to those drivers; without it the client gets every driver
+    driver_ids = [d for d in drivers.split(",") if d] if drivers else None
+    await manager.connect(websocket, driver_ids)
     try:
         while True:
             data = await websocket.receive_text()
-            # Broadcast received data (from driver) to all connected clients (family)
-            await manager.broadcast(data)
+            # Subscription changes, or data (from driver) relayed to all-driver clients (family)
+            await manager.handle_client_message(websocket, data)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+@app.websocket("/ws/telemetry")
+async def telemetry_uplink(websocket: WebSocket, token: Optional[str] = None):
+    # Driver uplink: binary frames (see telemetry.py), authenticated with the
+    # usual bearer token in the Authorization header (or ?token=)
+    header = websocket.headers.get("authorization", "")
+    token = header[7:] if header.lower().startswith("bearer ") else token
+    try:
+        if not token:
+            raise HTTPException(status_code=401)
+        async with AsyncSessionLocal() as db:
+            user = await authenticate_token(token, db)
+    except HTTPException:
+        await websocket.close(code=1008) # Policy violation
+        return
+    if user.role != "driver":
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        try:
+            if message.get("bytes") is None:
+                raise telemetry.TelemetryFrameError("Expected a binary frame")
+            rows = telemetry.decode_frame(message["bytes"], user.id)
+        except telemetry.TelemetryFrameError as e:
+            logger.warning(f"Rejecting telemetry from {user.id}: {e}")
+            await websocket.close(code=1003) # Unsupported data
+            return
+        if not rows:
+            continue
+        telemetry_writer.add(rows)
+        # One live update per frame: the newest sample
+        await manager.broadcast(json.dumps(telemetry.live_message(rows[-1])), driver_id=user.id)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,285 @@
+import argparse
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, inspect, select, text
+from database import engine, Base
+from models import Log, LogRollup
+import rollups
+
+# Schema upgrades for existing databases. New databases get the current
+# schema from Base.metadata.create_all; each migration below checks whether
+# the database still needs it, so `upgrade` is safe to run on every deploy.
+#
+#   python migrate.py status
+#   python migrate.py upgrade
+#   python migrate.py partition --period month --ahead 3    (Postgres only)
+#   python migrate.py retention --keep-days 180
+
+LOG_COLUMNS = "driver_id, timestamp, fatigue_score, emotion, drowsy_status"
+
+
+def _rename_table(conn, old: str, new: str):
+    # Postgres keeps the primary key's name (e.g. logs_pkey), which would
+    # clash with the key of the table created in its place
+    pk_name = inspect(conn).get_pk_constraint(old).get("name")
+    conn.execute(text(f"ALTER TABLE {old} RENAME TO {new}"))
+    if conn.dialect.name == "postgresql" and pk_name:
+        conn.execute(text(f"ALTER TABLE {new} RENAME CONSTRAINT {pk_name} TO {new}_pkey"))
+
+
+def _log_id_is_string(inspector) -> bool:
+    id_column = next(c for c in inspector.get_columns("logs") if c["name"] == "id")
+    return "CHAR" in str(id_column["type"]).upper() or "TEXT" in str(id_column["type"]).upper()
+
+
+def compact_log_ids_needed(conn) -> bool:
+    inspector = inspect(conn)
+    return inspector.has_table("logs") and _log_id_is_string(inspector)
+
+
+def compact_log_ids(conn):
+    # UUID string ids -> integer ids. Rebuilds the table in timestamp order;
+    # the old ids were never referenced by other tables.
+    for index in inspect(conn).get_indexes("logs"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+    _rename_table(conn, "logs", "logs_old")
+    Log.__table__.create(conn)
+    conn.execute(text(f"INSERT INTO logs ({LOG_COLUMNS}) SELECT {LOG_COLUMNS} FROM logs_old ORDER BY timestamp"))
+    conn.execute(text("DROP TABLE logs_old"))
+
+
+def driver_index_needed(conn) -> bool:
+    inspector = inspect(conn)
+    if not inspector.has_table("logs"):
+        return False
+    return "ix_logs_driver_timestamp" not in {i["name"] for i in inspector.get_indexes("logs")}
+
+
+def driver_index(conn):
+    for index in Log.__table__.indexes:
+        if index.name == "ix_logs_driver_timestamp":
+            index.create(conn)
+
+
+def _rollup_gaps(conn) -> dict:
+    # driver_id -> first log timestamp, for drivers whose first log predates
+    # their first minute rollup: logs ingested before rollups were maintained,
+    # including when the server ran (and rolled up new logs) before `upgrade`
+    inspector = inspect(conn)
+    if not inspector.has_table("logs"):
+        return {}
+    first_logs = dict(conn.execute(
+        select(Log.driver_id, func.min(Log.timestamp))
+        .where(Log.driver_id.is_not(None), Log.timestamp.is_not(None))
+        .group_by(Log.driver_id)
+    ).all())
+    if not inspector.has_table("log_rollups"):
+        return first_logs
+    first_buckets = dict(conn.execute(
+        select(LogRollup.driver_id, func.min(LogRollup.bucket))
+        .where(LogRollup.period == rollups.MINUTE)
+        .group_by(LogRollup.driver_id)
+    ).all())
+    return {
+        driver_id: first for driver_id, first in first_logs.items()
+        if driver_id not in first_buckets or rollups.bucket_start(first, rollups.MINUTE) < first_buckets[driver_id]
+    }
+
+
+SUMMARY_COLUMNS = ("duration", "drowsy_seconds") # Nullable FLOAT columns of heartbeat logs
+
+
+def _missing_summary_columns(conn) -> list[str]:
+    inspector = inspect(conn)
+    if not inspector.has_table("logs"):
+        return []
+    existing = {c["name"] for c in inspector.get_columns("logs")}
+    return [name for name in SUMMARY_COLUMNS if name not in existing]
+
+
+def log_summary_columns_needed(conn) -> bool:
+    return bool(_missing_summary_columns(conn))
+
+
+def log_summary_columns(conn):
+    for name in _missing_summary_columns(conn):
+        conn.execute(text(f"ALTER TABLE logs ADD COLUMN {name} FLOAT"))
+
+
+def rollup_backfill_needed(conn) -> bool:
+    return bool(_rollup_gaps(conn))
+
+
+def rollup_backfill(conn, chunk: int = 50000):
+    # Rebuilds each affected driver's rollups from the raw logs. Buckets from
+    # the hour of the driver's first log on are dropped and recomputed, so logs
+    # already rolled up on ingest are not counted twice; older buckets (whose
+    # logs retention has deleted) are kept.
+    columns = (Log.id, Log.driver_id, Log.timestamp, Log.fatigue_score, Log.emotion, Log.drowsy_status,
+               Log.duration, Log.drowsy_seconds)
+    stmt = rollups.upsert_statement(conn.dialect.name)
+    for driver_id, first in _rollup_gaps(conn).items():
+        conn.execute(delete(LogRollup).where(
+            LogRollup.driver_id == driver_id, LogRollup.bucket >= rollups.bucket_start(first, rollups.HOUR)
+        ))
+        last_id = None
+        while True:
+            query = select(*columns).where(Log.driver_id == driver_id).order_by(Log.id).limit(chunk)
+            if last_id is not None:
+                query = query.where(Log.id > last_id)
+            rows = [row._asdict() for row in conn.execute(query)]
+            if not rows:
+                break
+            conn.execute(stmt, rollups.aggregate(r for r in rows if r["timestamp"] is not None))
+            last_id = rows[-1]["id"]
+
+
+MIGRATIONS = [
+    ("compact integer log ids", compact_log_ids_needed, compact_log_ids),
+    ("(driver_id, timestamp) index on logs", driver_index_needed, driver_index),
+    ("heartbeat summary columns on logs", log_summary_columns_needed, log_summary_columns),
+    ("backfill log rollups", rollup_backfill_needed, rollup_backfill),
+]
+
+
+def pending(bind=engine) -> list[str]:
+    with bind.connect() as conn:
+        return [name for name, needed, _ in MIGRATIONS if needed(conn)]
+
+
+def upgrade(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    for name, needed, apply in MIGRATIONS:
+        with bind.begin() as conn:
+            if needed(conn):
+                print(f"Applying: {name}")
+                apply(conn)
+    if bind.dialect.name == "sqlite":
+        with bind.connect() as conn:
+            conn.execute(text("ANALYZE"))
+
+
+# Time partitioning (Postgres). `partition` converts logs into a table
+# partitioned by month or week on timestamp and creates upcoming partitions;
+# `retention` then drops whole partitions instead of deleting rows. On SQLite
+# retention deletes old rows in batches using the timestamp index.
+
+def _period_start(ts: datetime, period: str) -> datetime:
+    ts = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        return ts - timedelta(days=ts.weekday())
+    return ts.replace(day=1)
+
+
+def _next_period(start: datetime, period: str) -> datetime:
+    if period == "week":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def _partition_name(start: datetime, period: str) -> str:
+    return f"logs_{start:%Y_%m_%d}" if period == "week" else f"logs_{start:%Y_%m}"
+
+
+def is_partitioned(conn) -> bool:
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'logs'"
+    )).first())
+
+
+def ensure_partitions(conn, period: str, start: datetime, end: datetime):
+    current = _period_start(start, period)
+    while current < end:
+        upper = _next_period(current, period)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {_partition_name(current, period)} PARTITION OF logs "
+            f"FOR VALUES FROM ('{current.isoformat()}') TO ('{upper.isoformat()}')"
+        ))
+        current = upper
+
+
+def partition(conn, period: str, ahead: int):
+    if not is_partitioned(conn):
+        # The partition key must be part of the primary key
+        _rename_table(conn, "logs", "logs_unpartitioned")
+        for index in inspect(conn).get_indexes("logs_unpartitioned"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+        conn.execute(text(
+            "CREATE TABLE logs (LIKE logs_unpartitioned INCLUDING DEFAULTS, PRIMARY KEY (id, timestamp)) "
+            "PARTITION BY RANGE (timestamp)"
+        ))
+        conn.execute(text("ALTER TABLE logs ALTER COLUMN timestamp SET NOT NULL"))
+        for index in Log.__table__.indexes:
+            index.create(conn)
+        conn.execute(text("CREATE TABLE logs_default PARTITION OF logs DEFAULT"))
+        oldest = conn.execute(text("SELECT min(timestamp) FROM logs_unpartitioned")).scalar()
+        now = datetime.utcnow()
+        ensure_partitions(conn, period, oldest or now, now)
+        conn.execute(text("INSERT INTO logs SELECT * FROM logs_unpartitioned"))
+        conn.execute(text("ALTER SEQUENCE IF EXISTS logs_id_seq OWNED BY logs.id"))
+        conn.execute(text("DROP TABLE logs_unpartitioned"))
+    end = datetime.utcnow()
+    for _ in range(ahead + 1):
+        end = _next_period(_period_start(end, period), period)
+    ensure_partitions(conn, period, datetime.utcnow(), end)
+
+
+def retention(conn, keep_days: int, batch_size: int = 50000) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=keep_days)
+    if conn.dialect.name == "postgresql" and is_partitioned(conn):
+        dropped = 0
+        rows = conn.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'logs'"
+        )).all()
+        for name, bound in rows:
+            if "TO (" not in bound:
+                continue # DEFAULT partition
+            upper = datetime.fromisoformat(bound.split("TO ('", 1)[1].split("'", 1)[0])
+            if upper <= cutoff:
+                conn.execute(text(f"DROP TABLE {name}"))
+                print(f"Dropped partition {name}")
+                dropped += 1
+        return dropped
+    deleted = 0
+    while True:
+        result = conn.execute(text(
+            "DELETE FROM logs WHERE id IN (SELECT id FROM logs WHERE timestamp < :cutoff LIMIT :n)"
+        ), {"cutoff": cutoff, "n": batch_size})
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            break
+    print(f"Deleted {deleted} logs older than {cutoff:%Y-%m-%d}")
+    return deleted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DriveBy.AI database migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="List migrations the database still needs")
+    sub.add_parser("upgrade", help="Create missing tables and apply pending migrations")
+    p = sub.add_parser("partition", help="Partition logs by time and create upcoming partitions (Postgres)")
+    p.add_argument("--period", choices=["month", "week"], default="month")
+    p.add_argument("--ahead", type=int, default=3, help="Future partitions to create")
+    p = sub.add_parser("retention", help="Remove logs older than --keep-days")
+    p.add_argument("--keep-days", type=int, required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == "status":
+        names = pending()
+        print("\n".join(f"pending: {n}" for n in names) or "Up to date")
+    elif args.command == "upgrade":
+        upgrade()
+        print("Up to date")
+    elif args.command == "partition":
+        if engine.dialect.name != "postgresql":
+            sys.exit("Partitioning requires Postgres; use `retention` on SQLite")
+        with engine.begin() as conn:
+            partition(conn, args.period, args.ahead)
+    elif args.command == "retention":
+        with engine.begin() as conn:
+            retention(conn, args.keep_days)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
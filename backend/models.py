@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DateTime, Float
+from sqlalchemy import BigInteger, Column, String, Integer, Boolean, ForeignKey, DateTime, Float, Index
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from datetime import datetime
@@ -16,10 +16,70 @@ class User(Base):
 
 class Log(Base):
     __tablename__ = "logs"
+    # Per-driver history walks (driver_id, timestamp, id) in index order;
+    # see migrate.py for upgrading older databases
+    __table_args__ = (
+        Index("ix_logs_driver_timestamp", "driver_id", "timestamp", "id"),
+    )
 
-    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    # 8-byte integer key instead of a 36-char UUID string (INTEGER PRIMARY KEY, i.e. the rowid, on SQLite)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
     driver_id = Column(String, ForeignKey("users.id"))
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     fatigue_score = Column(Float)
     emotion = Column(String)
     drowsy_status = Column(Boolean)
+    duration = Column(Float) # Seconds a summary sample covers (event-mode heartbeats); NULL = one 1 Hz sample
+    drowsy_seconds = Column(Float) # Drowsy time within `duration`; NULL = all of it if drowsy_status
+
+class LogRollup(Base):
+    # Per driver, per minute/hour bucket and per emotion; mean fatigue is
+    # fatigue_sum / samples after summing rows across emotions. Maintained
+    # on ingest by rollups.py.
+    __tablename__ = "log_rollups"
+
+    driver_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    period = Column(Integer, primary_key=True)  # bucket length in seconds: 60 | 3600
+    bucket = Column(DateTime, primary_key=True)
+    emotion = Column(String, primary_key=True)
+    samples = Column(Integer, nullable=False, default=0)
+    fatigue_sum = Column(Float, nullable=False, default=0.0)
+    fatigue_max = Column(Float, nullable=False, default=0.0)
+    drowsy_seconds = Column(Float, nullable=False, default=0.0)
+
+class TelemetrySample(Base):
+    # High-rate driver metrics from the /ws/telemetry uplink
+    __tablename__ = "telemetry"
+    __table_args__ = (
+        Index("ix_telemetry_driver_timestamp", "driver_id", "timestamp"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    driver_id = Column(String, ForeignKey("users.id"))
+    timestamp = Column(DateTime)
+    ear = Column(Float)
+    mar = Column(Float)
+    pitch = Column(Float)
+    yaw = Column(Float)
+    roll = Column(Float)
+    perclos = Column(Float)
+    fatigue_score = Column(Float)
+    flags = Column(Integer)
+    emotion = Column(String)
+
+class Event(Base):
+    # Fatigue episodes reported by the driver engine: a "start" row when a
+    # condition turns on and an "end" row with its duration and peak
+    __tablename__ = "events"
+    __table_args__ = (
+        Index("ix_events_driver_timestamp", "driver_id", "timestamp"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    driver_id = Column(String, ForeignKey("users.id"))
+    kind = Column(String)  # eye_closure | yawn | head_tilt | alert
+    phase = Column(String)  # start | end
+    timestamp = Column(DateTime, index=True)
+    duration = Column(Float, nullable=True)  # seconds, end events only
+    peak = Column(Float, nullable=True)
+    score = Column(Float, nullable=True)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+from fastapi import WebSocket
+from broker import Broker, InProcessBroker
+
+logger = logging.getLogger(__name__)
+
+ALL_DRIVERS = "*" # Topic for clients that did not subscribe to specific drivers
+
+
+class Subscriber:
+    # One WebSocket with its own bounded send queue and sender task, so a slow
+    # client only ever delays itself.
+    def __init__(self, websocket: WebSocket, topics: set[str], queue_size: int, send_timeout: float):
+        self.websocket = websocket
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.send_timeout = send_timeout
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self, manager: "ConnectionManager"):
+        try:
+            while True:
+                message = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to send message: {e}")
+            manager.disconnect(self.websocket)
+
+
+class ConnectionManager:
+    # Topic-routed fan-out: topics are driver IDs. Publishing only touches the
+    # subscribers of that driver (plus wildcard clients) and never awaits a
+    # socket; each subscriber drains its own queue. A subscriber whose queue
+    # fills up is evicted as a slow consumer.
+    # Messages go through a Broker so every worker/replica sees every message;
+    # each manager then delivers to its own local sockets.
+    def __init__(self, queue_size: int = 64, send_timeout: float = 5.0, broker: Optional[Broker] = None):
+        self.broker = broker or InProcessBroker()
+        self.broker.attach(self.deliver)
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.subscribers: dict[WebSocket, Subscriber] = {}
+        self.topics: dict[str, set[Subscriber]] = {}
+        self.evicted = 0
+
+    async def start(self):
+        await self.broker.start()
+
+    async def stop(self):
+        await self.broker.stop()
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.subscribers)
+
+    async def connect(self, websocket: WebSocket, driver_ids: Optional[list[str]] = None):
+        await websocket.accept()
+        subscriber = Subscriber(websocket, set(), self.queue_size, self.send_timeout)
+        self.subscribers[websocket] = subscriber
+        self.subscribe(websocket, driver_ids or [ALL_DRIVERS])
+        subscriber.task = asyncio.create_task(subscriber.run(self))
+        logger.info(f"Client connected. Total: {len(self.subscribers)}")
+
+    def subscribe(self, websocket: WebSocket, driver_ids: list[str]):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return
+        # Subscribing to specific drivers replaces the wildcard
+        if driver_ids and ALL_DRIVERS not in driver_ids and ALL_DRIVERS in subscriber.topics:
+            self.unsubscribe(websocket, [ALL_DRIVERS])
+        for topic in driver_ids:
+            subscriber.topics.add(topic)
+            self.topics.setdefault(topic, set()).add(subscriber)
+
+    def unsubscribe(self, websocket: WebSocket, driver_ids: list[str]):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is None:
+            return
+        for topic in driver_ids:
+            subscriber.topics.discard(topic)
+            members = self.topics.get(topic)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self.topics[topic]
+
+    def disconnect(self, websocket: WebSocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        for topic in list(subscriber.topics):
+            members = self.topics.get(topic)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self.topics[topic]
+        if subscriber.task and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+        logger.info(f"Client disconnected. Total: {len(self.subscribers)}")
+
+    async def broadcast(self, message: str, driver_id: Optional[str] = None):
+        await self.broker.publish(driver_id or ALL_DRIVERS, message)
+
+    async def deliver(self, topic: str, message: str):
+        # Local fan-out of a message received from the broker
+        targets = set(self.topics.get(ALL_DRIVERS, ()))
+        if topic != ALL_DRIVERS:
+            targets |= self.topics.get(topic, set())
+        slow = []
+        for subscriber in targets:
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                slow.append(subscriber)
+        for subscriber in slow:
+            logger.warning("Evicting slow WebSocket consumer")
+            self.evicted += 1
+            self.disconnect(subscriber.websocket)
+            asyncio.create_task(self._close(subscriber.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013) # Try again later
+        except Exception:
+            pass
+
+    async def handle_client_message(self, websocket: WebSocket, data: str):
+        # {"subscribe": [...]} / {"unsubscribe": [...]} manage topics; anything
+        # else is relayed to wildcard subscribers as before
+        try:
+            message = json.loads(data)
+        except ValueError:
+            message = None
+        if isinstance(message, dict) and ("subscribe" in message or "unsubscribe" in message):
+            self.subscribe(websocket, [str(d) for d in message.get("subscribe", [])])
+            self.unsubscribe(websocket, [str(d) for d in message.get("unsubscribe", [])])
+            return
+        await self.broadcast(data)
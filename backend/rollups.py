@@ -0,0 +1,126 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import case, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import LogRollup
+
+# Incremental rollups of driver logs. Every ingested batch is pre-aggregated
+# per (driver, period, bucket, emotion) and added onto the existing rollup
+# rows with a single upsert, in the same transaction as the raw logs.
+
+MINUTE = 60
+HOUR = 3600
+PERIODS = (MINUTE, HOUR)
+LOG_INTERVAL_SECONDS = 1.0 # DriverMonitor sends one log per second
+
+
+def bucket_start(ts: datetime, period: int) -> datetime:
+    if period == HOUR:
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(second=0, microsecond=0)
+
+
+def aggregate(rows: Iterable[dict]) -> list[dict]:
+    # rows: dicts with driver_id, timestamp, fatigue_score, emotion, drowsy_status
+    # and optionally duration/drowsy_seconds. A row covering `duration` seconds
+    # (a heartbeat summarizing a window) counts as that many 1 Hz samples, and
+    # adds its own drowsy_seconds when given rather than the whole span.
+    buckets: dict[tuple, dict] = {}
+    for row in rows:
+        seconds = row.get("duration") or LOG_INTERVAL_SECONDS
+        weight = max(1, round(seconds / LOG_INTERVAL_SECONDS))
+        for period in PERIODS:
+            key = (row["driver_id"], period, bucket_start(row["timestamp"], period), row["emotion"])
+            acc = buckets.get(key)
+            if acc is None:
+                acc = buckets[key] = {
+                    "driver_id": key[0], "period": period, "bucket": key[2], "emotion": key[3],
+                    "samples": 0, "fatigue_sum": 0.0, "fatigue_max": row["fatigue_score"], "drowsy_seconds": 0.0,
+                }
+            acc["samples"] += weight
+            acc["fatigue_sum"] += row["fatigue_score"] * weight
+            acc["fatigue_max"] = max(acc["fatigue_max"], row["fatigue_score"])
+            if row.get("drowsy_seconds") is not None:
+                acc["drowsy_seconds"] += row["drowsy_seconds"]
+            elif row["drowsy_status"]:
+                acc["drowsy_seconds"] += seconds
+    return list(buckets.values())
+
+
+def upsert_statement(dialect_name: str):
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    table = LogRollup.__table__
+    stmt = dialect.insert(table)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.driver_id, table.c.period, table.c.bucket, table.c.emotion],
+        set_={
+            "samples": table.c.samples + excluded.samples,
+            "fatigue_sum": table.c.fatigue_sum + excluded.fatigue_sum,
+            "fatigue_max": case((excluded.fatigue_max > table.c.fatigue_max, excluded.fatigue_max),
+                                else_=table.c.fatigue_max),
+            "drowsy_seconds": table.c.drowsy_seconds + excluded.drowsy_seconds,
+        },
+    )
+
+
+async def record(db, rows: list[dict]):
+    # Call before committing the logs themselves
+    aggregated = aggregate(rows)
+    if aggregated:
+        await db.execute(upsert_statement(db.bind.dialect.name), aggregated)
+
+
+def choose_period(since: datetime, until: datetime) -> int:
+    # Minute buckets up to a day, hourly beyond: at most ~1440 points per driver
+    # for a day, and ~700 for a month
+    return MINUTE if (until - since).total_seconds() <= 86400 else HOUR
+
+
+def summary_query(period: int, since: datetime, until: datetime, driver_id: Optional[str]):
+    query = select(LogRollup).where(
+        LogRollup.period == period, LogRollup.bucket >= since, LogRollup.bucket < until
+    )
+    if driver_id is not None:
+        query = query.where(LogRollup.driver_id == driver_id)
+    return query.order_by(LogRollup.driver_id, LogRollup.bucket)
+
+
+def merge_buckets(rollups: Iterable[LogRollup]) -> list[dict]:
+    # Folds the per-emotion rows of each (driver, bucket) into one point
+    merged: dict[tuple, dict] = {}
+    for r in rollups:
+        point = merged.get((r.driver_id, r.bucket))
+        if point is None:
+            point = merged[(r.driver_id, r.bucket)] = {
+                "driver_id": r.driver_id, "bucket": r.bucket, "samples": 0,
+                "fatigue_sum": 0.0, "max_fatigue_score": r.fatigue_max, "drowsy_seconds": 0.0,
+                "emotions": defaultdict(int),
+            }
+        point["samples"] += r.samples
+        point["fatigue_sum"] += r.fatigue_sum
+        point["max_fatigue_score"] = max(point["max_fatigue_score"], r.fatigue_max)
+        point["drowsy_seconds"] += r.drowsy_seconds
+        point["emotions"][r.emotion] += r.samples
+    points = []
+    for point in merged.values():
+        point["mean_fatigue_score"] = point.pop("fatigue_sum") / point["samples"] if point["samples"] else 0.0
+        point["emotions"] = dict(point["emotions"])
+        points.append(point)
+    return points
+
+
+def totals(points: list[dict]) -> dict:
+    samples = sum(p["samples"] for p in points)
+    emotions: dict[str, int] = defaultdict(int)
+    for p in points:
+        for emotion, count in p["emotions"].items():
+            emotions[emotion] += count
+    return {
+        "samples": samples,
+        "mean_fatigue_score": sum(p["mean_fatigue_score"] * p["samples"] for p in points) / samples if samples else 0.0,
+        "max_fatigue_score": max((p["max_fatigue_score"] for p in points), default=0.0),
+        "drowsy_seconds": sum(p["drowsy_seconds"] for p in points),
+        "emotions": dict(emotions),
+    }
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Literal, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -31,9 +31,61 @@ class LogCreate(LogBase):
     pass
 
 class LogResponse(LogBase):
-    id: str
+    id: int
     driver_id: str
     timestamp: datetime
 
     class Config:
         from_attributes = True
+
+class LogSample(LogBase):
+    # Client-side capture time; defaults to the server's receive time
+    timestamp: Optional[datetime] = None
+    # Seconds summarized by this sample (heartbeat logs); omitted for 1 Hz samples
+    duration: Optional[float] = Field(None, gt=0, le=3600)
+    # Seconds of that span the driver was drowsy; drowsy_status only says "at any point"
+    drowsy_seconds: Optional[float] = Field(None, ge=0, le=3600)
+
+class LogBatch(BaseModel):
+    logs: list[LogSample] = Field(..., min_length=1, max_length=1000)
+
+class LogBatchResult(BaseModel):
+    inserted: int
+
+EventKind = Literal["eye_closure", "yawn", "head_tilt", "alert"]
+
+class EventBase(BaseModel):
+    kind: EventKind
+    phase: Literal["start", "end"]
+    timestamp: datetime
+    duration: Optional[float] = None
+    peak: Optional[float] = None
+    score: Optional[float] = None
+
+class EventBatch(BaseModel):
+    events: list[EventBase] = Field(..., min_length=1, max_length=1000)
+
+class EventResponse(EventBase):
+    id: int
+    driver_id: str
+
+    class Config:
+        from_attributes = True
+
+class RollupStats(BaseModel):
+    samples: int
+    mean_fatigue_score: float
+    max_fatigue_score: float
+    drowsy_seconds: float
+    emotions: dict[str, int]
+
+class RollupPoint(RollupStats):
+    driver_id: str
+    bucket: datetime
+
+class AnalyticsSummary(BaseModel):
+    resolution: Literal["minute", "hour"]
+    since: datetime
+    until: datetime
+    totals: RollupStats
+    points: list[RollupPoint]
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import struct
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import insert
+from models import TelemetrySample
+
+logger = logging.getLogger(__name__)
+
+# Binary telemetry frames sent by the driver engine over /ws/telemetry.
+# Keep in sync with driver_ai/telemetry.py.
+#
+#   header  version u8, kind u8, count u16
+#   sample  timestamp f64 (unix seconds), ear, mar, pitch, yaw, roll,
+#           perclos, fatigue_score f32, flags u8, emotion u8
+
+VERSION = 1
+KIND_SAMPLES = 1
+HEADER = struct.Struct("<BBH")
+SAMPLE = struct.Struct("<d7fBB")
+EMOTIONS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+FLAG_DROWSY, FLAG_YAWN, FLAG_HEAD_TILT, FLAG_ALERT = 1, 2, 4, 8
+
+
+class TelemetryFrameError(ValueError):
+    pass
+
+
+def decode_frame(data: bytes, driver_id: str) -> list[dict]:
+    if len(data) < HEADER.size:
+        raise TelemetryFrameError("Frame too short")
+    version, kind, count = HEADER.unpack_from(data)
+    if version != VERSION or kind != KIND_SAMPLES:
+        raise TelemetryFrameError(f"Unsupported frame version {version} kind {kind}")
+    if len(data) != HEADER.size + count * SAMPLE.size:
+        raise TelemetryFrameError(f"Frame length {len(data)} does not match {count} samples")
+    rows = []
+    for ts, ear, mar, pitch, yaw, roll, perclos, score, flags, emotion in SAMPLE.iter_unpack(data[HEADER.size:]):
+        rows.append({
+            "driver_id": driver_id,
+            # Stored as naive UTC like Log.timestamp
+            "timestamp": datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None),
+            "ear": ear, "mar": mar, "pitch": pitch, "yaw": yaw, "roll": roll,
+            "perclos": perclos, "fatigue_score": score, "flags": flags,
+            "emotion": EMOTIONS[emotion] if emotion < len(EMOTIONS) else "unknown",
+        })
+    return rows
+
+
+def live_message(row: dict) -> dict:
+    # Same fields as the /logs/upload broadcast, plus the raw metrics
+    return {
+        "type": "telemetry",
+        "driver_id": row["driver_id"],
+        "fatigue_score": row["fatigue_score"],
+        "emotion": row["emotion"],
+        "drowsy_status": bool(row["flags"] & FLAG_DROWSY),
+        "alert": bool(row["flags"] & FLAG_ALERT),
+        "timestamp": row["timestamp"].isoformat(),
+        "ear": row["ear"], "mar": row["mar"],
+        "pitch": row["pitch"], "yaw": row["yaw"], "roll": row["roll"],
+        "perclos": row["perclos"],
+    }
+
+
+class TelemetryWriter:
+    # Buffers decoded samples from all uplinks of this worker and writes them
+    # with one multi-row INSERT per `interval` (or as soon as `max_rows` are
+    # waiting). Beyond `max_pending` the oldest samples are dropped.
+    def __init__(self, session_factory, interval: float = 1.0, max_rows: int = 5000, max_pending: int = 100000):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.pending: list[dict] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def add(self, rows: list[dict]):
+        self.pending.extend(rows)
+        if len(self.pending) > self.max_pending:
+            overflow = len(self.pending) - self.max_pending
+            del self.pending[:overflow]
+            self.dropped += overflow
+        if len(self.pending) >= self.max_rows:
+            self.wakeup.set()
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Telemetry flush failed, dropping {len(self.pending)} samples: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Telemetry flush failed: {e}")
+
+    async def flush(self):
+        while self.pending:
+            batch, self.pending = self.pending[:self.max_rows], self.pending[self.max_rows:]
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(TelemetrySample), batch)
+                    await db.commit()
+            except Exception:
+                # Keep the batch for the next attempt
+                self.pending[:0] = batch
+                raise
+            self.written += len(batch)
+
+    def stats(self) -> dict:
+        return {"pending": len(self.pending), "written": self.written, "dropped": self.dropped}
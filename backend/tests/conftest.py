@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+# Backend modules import each other by bare name (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Base  # noqa: E402
+import models  # noqa: E402,F401  (registers the tables on Base)
+
+
+@pytest.fixture
+def engine():
+    # Fresh in-memory SQLite database per test
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+import migrate
+import rollups
+from models import Log, LogRollup
+
+T0 = datetime(2026, 10, 1, 8, 0, 0)
+
+
+def make_logs(driver_id, start, count, **overrides):
+    rows = []
+    for i in range(count):
+        row = {
+            "driver_id": driver_id,
+            "timestamp": start + timedelta(seconds=i),
+            "fatigue_score": float(i % 90),
+            "emotion": "sad" if i % 3 else "happy",
+            "drowsy_status": i % 2 == 0,
+            "duration": None,
+            "drowsy_seconds": None,
+        }
+        row.update(overrides)
+        rows.append(row)
+    return rows
+
+
+def ingest(conn, rows, rollup=True):
+    # What the upload routes do: raw logs plus, since rollups exist, the upsert
+    conn.execute(insert(Log), rows)
+    if rollup:
+        conn.execute(rollups.upsert_statement(conn.dialect.name), rollups.aggregate(rows))
+
+
+def rollup_table(conn):
+    return {
+        (r.driver_id, r.period, r.bucket, r.emotion): (r.samples, r.fatigue_sum, r.fatigue_max, r.drowsy_seconds)
+        for r in conn.execute(select(LogRollup))
+    }
+
+
+def expected(rows):
+    return {
+        (r["driver_id"], r["period"], r["bucket"], r["emotion"]):
+            (r["samples"], r["fatigue_sum"], r["fatigue_max"], r["drowsy_seconds"])
+        for r in rollups.aggregate(rows)
+    }
+
+
+def test_upsert_merges_into_existing_buckets(engine):
+    first = make_logs("d1", T0, 20, emotion="sad", fatigue_score=10.0, drowsy_status=True)
+    second = make_logs("d1", T0 + timedelta(seconds=20), 20, emotion="sad", fatigue_score=70.0, drowsy_status=False)
+    with engine.begin() as conn:
+        ingest(conn, first)
+        ingest(conn, second)
+        table = rollup_table(conn)
+
+    # Same minute and hour bucket: one row per period, sums added, max kept
+    assert table == {
+        ("d1", rollups.MINUTE, T0, "sad"): (40, 20 * 10.0 + 20 * 70.0, 70.0, 20.0),
+        ("d1", rollups.HOUR, T0, "sad"): (40, 20 * 10.0 + 20 * 70.0, 70.0, 20.0),
+    }
+    assert table == expected(first + second)
+
+
+def test_duration_weights_samples_score_and_drowsy_time():
+    heartbeat = {"driver_id": "d1", "timestamp": T0, "fatigue_score": 55.0, "emotion": "sad",
+                 "drowsy_status": True, "duration": 30.0}
+    sample = dict(heartbeat, fatigue_score=10.0, duration=None)
+    minute = {r["period"]: r for r in rollups.aggregate([heartbeat, sample])}[rollups.MINUTE]
+
+    assert minute["samples"] == 31
+    assert minute["fatigue_sum"] == 55.0 * 30 + 10.0
+    assert minute["fatigue_max"] == 55.0
+    assert minute["drowsy_seconds"] == 30.0 + rollups.LOG_INTERVAL_SECONDS
+
+
+def test_drowsy_seconds_replace_the_whole_span():
+    # A heartbeat with a 1 s eye closure in a 30 s window is not 30 drowsy seconds
+    heartbeat = {"driver_id": "d1", "timestamp": T0, "fatigue_score": 20.0, "emotion": "sad",
+                 "drowsy_status": True, "duration": 30.0, "drowsy_seconds": 1.0}
+    minute = {r["period"]: r for r in rollups.aggregate([heartbeat])}[rollups.MINUTE]
+
+    assert minute["samples"] == 30
+    assert minute["drowsy_seconds"] == 1.0
+
+
+def test_backfill_after_partial_ingest_counts_each_log_once(engine):
+    # Logs from before rollups existed, then the server ran (rolling up new
+    # logs, some in the same hour) before `migrate.py upgrade`
+    old = make_logs("d1", T0, 500) + make_logs("d2", T0, 200)
+    new = make_logs("d1", T0 + timedelta(minutes=5), 300) + make_logs("d2", T0 + timedelta(hours=2), 100)
+    with engine.begin() as conn:
+        ingest(conn, old, rollup=False)
+        ingest(conn, new)
+        assert migrate.rollup_backfill_needed(conn)
+
+    migrate.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert not migrate.rollup_backfill_needed(conn)
+        assert rollup_table(conn) == expected(old + new)
+
+
+def test_backfill_only_rebuilds_drivers_with_gaps(engine):
+    complete = make_logs("d1", T0, 120)
+    missing = make_logs("d2", T0, 120)
+    with engine.begin() as conn:
+        ingest(conn, complete)
+        ingest(conn, missing, rollup=False)
+        assert set(migrate._rollup_gaps(conn)) == {"d2"}
+
+    migrate.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert rollup_table(conn) == expected(complete + missing)
+
+
+def test_backfill_is_a_no_op_when_rollups_are_complete(engine):
+    rows = make_logs("d1", T0, 300) + make_logs("d2", T0 + timedelta(hours=1), 90, duration=30.0, drowsy_seconds=2.5)
+    with engine.begin() as conn:
+        ingest(conn, rows)
+        assert not migrate.rollup_backfill_needed(conn)
+        before = rollup_table(conn)
+
+    migrate.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert migrate.pending(engine) == []
+        assert rollup_table(conn) == before == expected(rows)
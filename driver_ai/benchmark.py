@@ -0,0 +1,413 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+import cv2
+import numpy as np
+import replay
+from pipeline import AllocationStats, FramePool, reuse_buffer
+from utils import (LandmarkBuffer, NUM_LANDMARKS, LEFT_EYE_INDICES, RIGHT_EYE_INDICES, HEAD_POSE_INDICES,
+                   MODEL_POINTS, DIST_COEFFS, get_camera_matrix, calculate_ear, calculate_mar,
+                   get_head_pose, rotation_to_angles, compute_metrics_batch)
+
+# Micro-benchmarks for the driver_ai hot path. They use synthetic Face Mesh
+# output so they run on headless boxes without a camera or model weights.
+
+def make_fake_face(rng, num_landmarks=NUM_LANDMARKS):
+    # Mimics mediapipe's NormalizedLandmarkList (objects with .x/.y/.z)
+    points = rng.uniform(0.3, 0.7, size=(num_landmarks, 3))
+    return SimpleNamespace(landmark=[SimpleNamespace(x=float(x), y=float(y), z=float(z)) for x, y, z in points])
+
+def time_per_call(fn, iterations):
+    fn() # Warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6 # us
+
+def _legacy_landmarks(face, frame_w, frame_h):
+    # Pre-LandmarkBuffer path: box loop in DriverMonitor + list comprehension in FatigueEngine
+    x_min, y_min = frame_w, frame_h
+    x_max, y_max = 0, 0
+    for lm in face.landmark:
+        x, y = int(lm.x * frame_w), int(lm.y * frame_h)
+        if x < x_min: x_min = x
+        if x > x_max: x_max = x
+        if y < y_min: y_min = y
+        if y > y_max: y_max = y
+    face_box = (x_min, y_min, x_max - x_min, y_max - y_min)
+    landmarks = np.array([(lm.x * frame_w, lm.y * frame_h) for lm in face.landmark])
+    return face_box, landmarks
+
+def bench_landmarks(args):
+    rng = np.random.default_rng(0)
+    face = make_fake_face(rng)
+    frame_w, frame_h = args.width, args.height
+    buffer = LandmarkBuffer()
+
+    def _vectorized():
+        landmarks = buffer.update(face, frame_w, frame_h)
+        return buffer.face_box(frame_w, frame_h), landmarks
+
+    legacy_box, legacy_lms = _legacy_landmarks(face, frame_w, frame_h)
+    new_box, new_lms = _vectorized()
+    assert legacy_box == new_box, (legacy_box, new_box)
+    assert np.allclose(legacy_lms, new_lms, atol=1e-2)
+
+    legacy_us = time_per_call(lambda: _legacy_landmarks(face, frame_w, frame_h), args.iterations)
+    new_us = time_per_call(_vectorized, args.iterations)
+    print(f"Landmark extraction ({NUM_LANDMARKS} points, {frame_w}x{frame_h}, {args.iterations} frames)")
+    print(f"  legacy loops   : {legacy_us:8.1f} us/frame")
+    print(f"  LandmarkBuffer : {new_us:8.1f} us/frame")
+    print(f"  saved          : {legacy_us - new_us:8.1f} us/frame ({legacy_us / new_us:.1f}x)")
+
+def make_fake_trip(rng, num_frames, frame_w, frame_h, num_landmarks=NUM_LANDMARKS):
+    # (N, 478, 2) pixel landmarks: a jittering face in the middle of the frame
+    # whose head pose points are a projection of the 3D model, so solvePnP
+    # converges the way it does on real faces
+    base = rng.uniform(0.35, 0.65, size=(num_landmarks, 2))
+    jitter = rng.normal(0.0, 0.005, size=(num_frames, num_landmarks, 2))
+    trip = ((base + jitter) * (frame_w, frame_h)).astype(np.float32)
+
+    camera_matrix = get_camera_matrix(frame_h, frame_w)
+    translation = np.array([0.0, 0.0, 2000.0])
+    for i in range(num_frames):
+        rotation = np.array([0.1 * np.sin(i / 50), 0.2 * np.cos(i / 70), 0.05]) + rng.normal(0.0, 0.01, 3)
+        points, _ = cv2.projectPoints(MODEL_POINTS, rotation, translation, camera_matrix, DIST_COEFFS)
+        trip[i, HEAD_POSE_INDICES] = points[:, 0]
+    return trip
+
+def _scalar_metrics(landmarks, size):
+    # One frame at a time, as FatigueEngine.process_landmarks does it
+    ear = (calculate_ear(landmarks[LEFT_EYE_INDICES]) + calculate_ear(landmarks[RIGHT_EYE_INDICES])) / 2.0
+    mar = calculate_mar(landmarks[13], landmarks[14], landmarks[61], landmarks[291])
+    rot_vec, _, _, _ = get_head_pose(landmarks, size)
+    return (ear, mar) + rotation_to_angles(rot_vec)
+
+def bench_kernels(args):
+    rng = np.random.default_rng(0)
+    size = (args.height, args.width, 3)
+    trip = make_fake_trip(rng, args.frames, args.width, args.height)
+
+    metrics = compute_metrics_batch(trip[:50], size)
+    for i in range(50):
+        expected = _scalar_metrics(trip[i], size)
+        actual = [metrics[k][i] for k in ("ear", "mar", "pitch", "yaw", "roll")]
+        assert np.allclose(expected, actual, atol=1e-4), (i, expected, actual)
+
+    start = time.perf_counter()
+    for frame in trip:
+        _scalar_metrics(frame, size)
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compute_metrics_batch(trip, size)
+    batch_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compute_metrics_batch(trip, size, head_pose=False)
+    batch_no_pose_s = time.perf_counter() - start
+
+    print(f"EAR/MAR/head pose kernels ({args.frames} frames, {args.width}x{args.height})")
+    print(f"  per-frame calls     : {args.frames / scalar_s:10.0f} frames/s")
+    print(f"  batched             : {args.frames / batch_s:10.0f} frames/s ({scalar_s / batch_s:.1f}x)")
+    print(f"  batched, no pose    : {args.frames / batch_no_pose_s:10.0f} frames/s")
+
+def bench_replay(args):
+    replay.run(args)
+
+STARTUP_MILESTONES = ["import", "face_mesh", "emotion", "audio", "all"]
+
+def _startup_child(mode):
+    # Runs in a fresh interpreter; prints seconds since the child started
+    t0 = time.perf_counter()
+    if mode == "serial":
+        import pygame, requests, fer # What detection.py used to import at module load
+    import detection
+    from warmup import ModelLoader, load_face_mesh, load_emotion_model, load_alert_sound
+    times = {"import": time.perf_counter() - t0}
+    loader = ModelLoader(parallel=mode == "parallel")
+    loader.load("face_mesh", load_face_mesh)
+    loader.load("emotion", load_emotion_model)
+    loader.load("audio", load_alert_sound)
+    loader.wait_all()
+    times.update({name: times["import"] + seconds for name, seconds in loader.times.items()})
+    times["all"] = time.perf_counter() - t0
+    print(json.dumps(times))
+
+def bench_startup(args):
+    # Cold start in fresh interpreters: eager imports + serial model loads
+    # (the old DriverMonitor) vs lazy imports + parallel warm-up.
+    # "face_mesh" is when frames start flowing through the fatigue path.
+    if args.child:
+        return _startup_child(args.child)
+    results = {}
+    for mode in ("serial", "parallel"):
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run([sys.executable, __file__, "startup", "--child", mode], capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{mode} startup failed:\n{proc.stderr[-2000:]}")
+                return
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        results[mode] = {m: float(np.median([r[m] for r in runs])) for m in STARTUP_MILESTONES}
+
+    print(f"Startup, median of {args.repeat} cold runs (seconds after the engine process started)")
+    print(f"  {'milestone':<10} {'serial':>8} {'parallel':>9}")
+    for milestone in STARTUP_MILESTONES:
+        print(f"  {milestone:<10} {results['serial'][milestone]:8.2f} {results['parallel'][milestone]:9.2f}")
+
+class SyntheticCapture:
+    # cv2.VideoCapture stand-in: read(image) fills `image` in place when it fits, like OpenCV
+    def __init__(self, frames, width, height):
+        self.frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+        self.remaining = frames
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        if self.remaining <= 0:
+            return False, None
+        self.remaining -= 1
+        if image is None or image.shape != self.frame.shape:
+            return True, self.frame.copy()
+        np.copyto(image, self.frame)
+        return True, image
+
+    def release(self):
+        pass
+
+def _frame_loop(cap, pooled, trace=False):
+    # Capture -> RGB for Face Mesh -> face crop for emotion, as DriverMonitor
+    # does before and after buffer reuse. trace: measure transient bytes per frame.
+    stats = AllocationStats()
+    pool = FramePool(size=2, stats=stats)
+    buffers = {}
+    crop = np.empty((64, 64, 3), np.uint8)
+    times, transient = [], []
+    while True:
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        if pooled:
+            success, image = pool.read(cap)
+        else:
+            success, image = cap.read()
+            if success:
+                stats.allocated("frame")
+        if not success:
+            break
+        frame_h, frame_w, _ = image.shape
+        x, y, w, h = frame_w // 3, frame_h // 4, frame_w // 3, frame_h // 2
+        if pooled:
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=reuse_buffer(buffers, "rgb", image.shape, stats))
+            cv2.resize(image[y:y+h, x:x+w], (64, 64), dst=crop)
+            pool.release(image)
+        else:
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            stats.allocated("rgb")
+            image[y:y+h, x:x+w].copy()
+            stats.allocated("crop")
+        times.append((time.perf_counter() - t0) * 1000.0)
+        if trace:
+            transient.append(tracemalloc.get_traced_memory()[1] - base)
+        stats.frame()
+    stats.close()
+    return times, transient, stats
+
+def bench_frames(args):
+    def open_capture():
+        return cv2.VideoCapture(args.input) if args.input else SyntheticCapture(args.frames, args.width, args.height)
+
+    source = args.input or f"synthetic {args.width}x{args.height}"
+    print(f"Frame loop buffers ({source}, up to {args.frames} frames)")
+    print(f"  {'':<16} {'p50 ms':>7} {'p99 ms':>7} {'KB/frame':>9} {'buffers/frame':>14} {'GC/1k frames':>13}")
+    for label, pooled in (("per-frame copies", False), ("pooled buffers", True)):
+        cap = open_capture()
+        times, _, stats = _frame_loop(_limit(cap, args.frames), pooled)
+        cap.release()
+        tracemalloc.start() # NumPy reports its data buffers to tracemalloc
+        cap = open_capture()
+        _, transient, _ = _frame_loop(_limit(cap, args.frames), pooled, trace=True)
+        cap.release()
+        tracemalloc.stop()
+        frames = max(stats.frames, 1)
+        print(f"  {label:<16} {np.percentile(times, 50):7.2f} {np.percentile(times, 99):7.2f} "
+              f"{np.mean(transient) / 1024:9.0f} {sum(stats.buffers.values()) / frames:14.3f} "
+              f"{sum(stats.gc_collections) * 1000 / frames:13.1f}")
+
+class _limit:
+    # Caps a capture at n frames
+    def __init__(self, cap, n):
+        self.cap = cap
+        self.remaining = n
+
+    def read(self, image=None):
+        if self.remaining <= 0:
+            return False, None
+        self.remaining -= 1
+        return self.cap.read(image) if image is not None else self.cap.read()
+
+def _rss_mb():
+    # Resident set size of this process
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Peak, not current
+    except ImportError:
+        return float("nan")
+
+def _emotion_child(spec, crops_path, batch):
+    # spec: "fer-haar" (FER as before: Haar detection inside each crop),
+    # "fer" (FER classifier on the crop) or "onnx:<model path>"
+    crops = list(np.load(crops_path)["crops"])
+    rss_before = _rss_mb()
+    t0 = time.perf_counter()
+    from emotion_model import EmotionModel
+    name, _, model_path = spec.partition(":")
+    model = EmotionModel("fer" if name == "fer-haar" else name, model_path or None)
+    if model.backend is None:
+        raise SystemExit(1)
+    if name == "fer-haar":
+        classify = lambda crop: model.backend.top_emotion(crop)
+    else:
+        classify = lambda crop: model.backend.classify([crop])[0]
+    model.warm_up()
+    load_s = time.perf_counter() - t0
+
+    labels, latencies = [], []
+    for crop in crops:
+        t1 = time.perf_counter()
+        labels.append(classify(crop)[0])
+        latencies.append((time.perf_counter() - t1) * 1000.0)
+    batch_ms = None
+    if name != "fer-haar":
+        t1 = time.perf_counter()
+        for i in range(0, len(crops), batch):
+            model.predict_batch(crops[i:i + batch])
+        batch_ms = (time.perf_counter() - t1) * 1000.0 / len(crops)
+    print(json.dumps({"labels": labels, "load_s": load_s, "p50_ms": float(np.percentile(latencies, 50)),
+                      "p95_ms": float(np.percentile(latencies, 95)), "batch_ms": batch_ms,
+                      "rss_mb": _rss_mb(), "rss_delta_mb": _rss_mb() - rss_before}))
+
+def bench_emotion(args):
+    # Same face crops through each backend, each in a fresh process so load
+    # time and resident memory are not shared. Without ground-truth labels,
+    # accuracy is reported as top-1 agreement with the FER classifier.
+    if args.child:
+        return _emotion_child(args.child, args.crops, args.batch)
+    if args.input:
+        from emotion_export import collect_face_crops
+        crops = collect_face_crops(args.input, args.max_crops, args.every)
+        print(f"{len(crops)} MediaPipe face crops from {args.input}")
+    else:
+        rng = np.random.default_rng(0)
+        crops = [rng.integers(0, 256, (160, 140, 3), dtype=np.uint8) for _ in range(args.max_crops)]
+        print(f"No --input: {len(crops)} random crops (latency and memory only; agreement is meaningless)")
+    if not crops:
+        print("No faces found")
+        return
+    # One square size for all crops so they fit one array; every backend sees the same pixels
+    size = max(max(c.shape[0], c.shape[1]) for c in crops)
+    padded = np.zeros((len(crops), size, size, 3), np.uint8)
+    for i, crop in enumerate(crops):
+        padded[i] = cv2.resize(crop, (size, size))
+
+    specs = ["fer-haar", "fer"] + [f"onnx:{path}" for path in args.onnx]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        crops_path = os.path.join(tmp, "crops.npz")
+        np.savez(crops_path, crops=padded)
+        for spec in specs:
+            proc = subprocess.run([sys.executable, __file__, "emotion", "--child", spec, "--crops", crops_path,
+                                   "--batch", str(args.batch)], capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"  {spec}: failed to run\n{(proc.stderr or proc.stdout)[-500:]}")
+                continue
+            results[spec] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    reference = results.get("fer", {}).get("labels")
+    print(f"  {'backend':<36} {'load s':>7} {'p50 ms':>7} {'p95 ms':>7} {'batch ms':>9} {'RSS MB':>7} {'+MB':>6} {'agree':>6}")
+    for spec, r in results.items():
+        agree = f"{np.mean([a == b for a, b in zip(r['labels'], reference)]):6.1%}" if reference else "     -"
+        batch_ms = f"{r['batch_ms']:9.2f}" if r["batch_ms"] is not None else "        -"
+        print(f"  {spec:<36} {r['load_s']:7.2f} {r['p50_ms']:7.2f} {r['p95_ms']:7.2f} {batch_ms} "
+              f"{r['rss_mb']:7.0f} {r['rss_delta_mb']:6.0f} {agree}")
+    print(f"  (batch ms: per crop, in batches of {args.batch}; agree: top-1 label equal to fer)")
+
+def bench_suite(args):
+    # Everything that runs without hardware; add --input to include a recorded clip
+    bench_landmarks(argparse.Namespace(iterations=2000, width=args.width, height=args.height))
+    bench_kernels(argparse.Namespace(frames=5000, width=args.width, height=args.height))
+    bench_frames(argparse.Namespace(input=None, frames=500, width=args.width, height=args.height))
+    if args.input:
+        replay.run(argparse.Namespace(input=args.input, output=None, dump_landmarks=None, cache_dir=None, max_frames=None, roi=False,
+                                      no_emotion=args.no_emotion, emotion_every=1, emotion_backend="fer", emotion_model=None))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DriveBy.AI driver_ai benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("landmarks", help="Per-frame landmark conversion and face box")
+    p.add_argument("--iterations", type=int, default=2000)
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.set_defaults(func=bench_landmarks)
+
+    p = sub.add_parser("kernels", help="Batched EAR/MAR/head pose vs per-frame calls")
+    p.add_argument("--frames", type=int, default=5000)
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.set_defaults(func=bench_kernels)
+
+    p = sub.add_parser("replay", help="Headless replay of a video or landmark dump")
+    replay.add_arguments(p)
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("startup", help="Cold-start time: serial vs lazy/parallel model loading (needs the models installed)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--child", choices=["serial", "parallel"], help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("emotion", help="Emotion backends on the same face crops: latency, memory, agreement with FER")
+    p.add_argument("--input", help="Video to cut MediaPipe face crops from (random crops if omitted)")
+    p.add_argument("--onnx", nargs="*", default=[], metavar="MODEL", help="ONNX models to compare (e.g. fp32 and int8)")
+    p.add_argument("--max-crops", type=int, default=300)
+    p.add_argument("--every", type=int, default=3, help="Use every Nth frame of --input")
+    p.add_argument("--batch", type=int, default=16)
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    p.add_argument("--crops", help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_emotion)
+
+    p = sub.add_parser("frames", help="Capture/RGB/crop with fresh arrays vs pooled buffers: time, bytes, GC")
+    p.add_argument("--input", help="Video to read (synthetic frames if omitted)")
+    p.add_argument("--frames", type=int, default=500)
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.set_defaults(func=bench_frames)
+
+    p = sub.add_parser("suite", help="Run all benchmarks")
+    p.add_argument("--input", help="Optional video or landmark dump to replay")
+    p.add_argument("--no-emotion", action="store_true")
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.set_defaults(func=bench_suite)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,75 +1,150 @@
 
 import cv2
-import mediapipe as mp
 import time
 import threading
-import pygame
-import numpy as np
-import requests
 import json
 import os
-from fatigue_engine import FatigueEngine
-from emotion_model import EmotionModel
-from utils import calculate_ear # optional if needed directly
+from fatigue_engine import FatigueEngine, composite_score, ALERT_THRESHOLD
+from emotion_model import AsyncEmotionWorker
+from utils import LandmarkBuffer
+from landmark_cache import LandmarkCacheWriter, live_key
+from pipeline import DropOldestQueue, StageTimer, CaptureThread, FramePool, AllocationStats, reuse_buffer
+from warmup import ModelLoader, load_face_mesh, load_emotion_model, load_alert_sound
+from uploader import LogUploader
+from telemetry import TelemetryUplink
+from events import EventDetector
+from metrics import MetricsServer, MetricsDumper
+from stream import MjpegStreamer
 
 class DriverMonitor:
-    def __init__(self, camera_index=0):
+    def __init__(self, camera_index=0, pipelined=False, emotion_every=10, record_dir=None, roi=False, telemetry_hz=0, events=False,
+                 metrics_port=0, metrics_dump=None, metrics_interval=10.0, emotion_backend="fer", emotion_model_path=None,
+                 headless=False, hud_fps=0, stream_port=0, stream_fps=10.0):
         print("DriverMonitor: Initializing...")
-        self.cap = cv2.VideoCapture(camera_index)
+        # Pipeline
+        self.pipelined = pipelined
+        self.stage_timer = StageTimer()
+        self.queues = {}
+        # Frames are read into recycled buffers and stages share views of
+        # them; scratch arrays (RGB, ROI crops) are reused across frames
+        self.alloc_stats = AllocationStats(self.stage_timer)
+        self.frame_pool = FramePool(size=6 if pipelined else 2, stats=self.alloc_stats)
+        self.buffers = {}
+        
+        # Rendering: headless=True never opens a window; hud_fps > 0 redraws
+        # the HUD at most that often, independent of the inference rate; the
+        # optional MJPEG stream gets HUD frames at up to stream_fps
+        self.headless = headless
+        self.hud_period = 1.0 / hud_fps if hud_fps > 0 else 0.0
+        self.last_render = 0.0
+        self.streamer = None
+        if stream_port:
+            self.streamer = MjpegStreamer(stream_port, fps=stream_fps)
+            self.streamer.start()
         
-        print("DriverMonitor: Loading MediaPipe...")
-        # MediaPipe Face Mesh
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        # Models load in the background (see warmup.py) while the camera opens.
+        # Frames are processed as soon as Face Mesh is ready; emotion reads
+        # "neutral" until FER is. roi=True tracks the face and only processes a downscaled crop.
+        self.roi_tracker = None
+        self.face_mesh = None
+        self.emotion_model = None
+        self.emotion_worker = None
+        self.alert_sound = None
+        # Emotion runs off the hot path; emotion_every=0 keeps it inline
+        if emotion_every > 0:
+            self.emotion_worker = AsyncEmotionWorker(None, every_n_frames=emotion_every, timer=self.stage_timer)
+            self.emotion_worker.start()
+        self.loader = ModelLoader()
+        print(f"DriverMonitor: Loading MediaPipe, emotion ({emotion_backend}) and audio in the background...")
+        self.loader.load("face_mesh", lambda: load_face_mesh(roi, self.stage_timer, self.alloc_stats), on_ready=self._set_face_mesh(roi))
+        self.loader.load("emotion", lambda: load_emotion_model(emotion_backend, emotion_model_path),
+                         on_ready=self._set_emotion_model)
+        self.loader.load("audio", load_alert_sound, on_ready=lambda sound: setattr(self, "alert_sound", sound))
+        
+        self.cap = cv2.VideoCapture(camera_index)
+        self.loader.mark("camera")
         
-        # Models
         self.fatigue_engine = FatigueEngine()
-        self.emotion_model = EmotionModel()
+        self.landmark_buffer = LandmarkBuffer()
         
         # State
         self.running = True
+        self.fatal_error = None # Raised by run() once the loops have shut down
         self.alert_active = False
         self.current_log = {}
+        self.prev_log_time = 0
         
-        # Audio
-        try:
-            pygame.mixer.init()
-            # Generate a beep sound
-            self.alert_sound = self._generate_beep()
-        except Exception as e:
-            print(f"Warning: Audio initialization failed: {e}")
-            self.alert_sound = None
+        # Landmark recording for offline threshold tuning (opened on first frame)
+        self.record_dir = record_dir
+        self.landmark_writer = None
         
         # API config
         self.API_URL = os.getenv("API_URL", "http://localhost:8000")
         self.auth_token = None # Needs login
+        self.credentials = None # Kept to log in again when the access token expires
+        self.auth_lock = threading.Lock()
+        self.uploader = LogUploader(self.API_URL, spool_path=os.getenv("UPLOAD_SPOOL", "upload_spool.jsonl"),
+                                    timer=self.stage_timer, reauth=self.refresh_token)
+        self.uploader.start()
         
-    def _generate_beep(self):
-        sample_rate = 44100
-        duration = 1.0
-        frequency = 440.0
+        # events=True: report start/end events plus a heartbeat log instead of a log every second
+        self.event_detector = None
+        self.event_uploader = None
+        if events:
+            self.event_detector = EventDetector()
+            self.event_uploader = LogUploader(self.API_URL, spool_path=os.getenv("EVENT_SPOOL", "event_spool.jsonl"),
+                                              path="/events/batch", key="events", single_path=None,
+                                              timer=self.stage_timer, stage="upload_events", reauth=self.refresh_token)
+            self.event_uploader.start()
         
-        t = np.linspace(0, duration, int(sample_rate * duration), False)
-        # Generate sine wave
-        tone = np.sin(frequency * t * 2 * np.pi)
-        # Normalize to 16-bit range
-        audio = (tone * 32767).astype(np.int16)
-        # Stereo
-        audio = np.column_stack((audio, audio))
+        # High-rate binary telemetry over a WebSocket, on top of the 1 Hz logs
+        self.telemetry = None
+        self.telemetry_period = 1.0 / telemetry_hz if telemetry_hz > 0 else None
+        self.prev_telemetry_time = 0
+        if self.telemetry_period:
+            self.telemetry = TelemetryUplink(self.API_URL)
+            self.telemetry.start()
         
-        return pygame.sndarray.make_sound(audio)
+        # Local metrics: Prometheus endpoint and/or periodic JSON dump
+        self.metrics_server = None
+        self.metrics_dumper = None
+        if metrics_port:
+            self.metrics_server = MetricsServer(self.collect_metrics, metrics_port)
+            self.metrics_server.start()
+        if metrics_dump:
+            self.metrics_dumper = MetricsDumper(self.collect_metrics, metrics_dump, metrics_interval)
+            self.metrics_dumper.start()
+        
+    def _set_face_mesh(self, roi):
+        def _ready(model):
+            if roi:
+                self.roi_tracker = model
+            else:
+                self.face_mesh = model
+        return _ready
+
+    def _set_emotion_model(self, model):
+        self.emotion_model = model
+        if self.emotion_worker:
+            self.emotion_worker.model = model
+
+    def startup_report(self):
+        times = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(self.loader.times.items(), key=lambda item: item[1]))
+        print(f"DriverMonitor: Startup ({times})")
 
     def login(self, email, password):
+        import requests
         try:
             print(f"DriverMonitor: Logging in as {email}...")
-            res = requests.post(f"{self.API_URL}/auth/login", json={"email": email, "password": password})
+            res = requests.post(f"{self.API_URL}/auth/login", json={"email": email, "password": password}, timeout=10)
             if res.status_code == 200:
+                self.credentials = (email, password)
                 self.auth_token = res.json()["access_token"]
+                self.uploader.set_token(self.auth_token)
+                if self.event_uploader:
+                    self.event_uploader.set_token(self.auth_token)
+                if self.telemetry:
+                    self.telemetry.set_token(self.auth_token)
                 print("Logged in successfully.")
                 return True
             else:
@@ -79,110 +154,382 @@ class DriverMonitor:
             print(f"Login connection error: {e}")
             return False
 
+    def refresh_token(self, stale_token):
+        # LogUploader reauth callback (uploader thread): access tokens expire
+        # after 15 minutes, so log in again with the stored credentials
+        with self.auth_lock:
+            if self.auth_token and self.auth_token != stale_token:
+                return self.auth_token # Another uploader already renewed it
+            if self.credentials is None:
+                return None
+            print("DriverMonitor: Access token expired, logging in again...")
+            return self.auth_token if self.login(*self.credentials) else None
+
+    def check_models(self):
+        # Face Mesh is required: without it no frame is ever scored, so a failed
+        # load stops the monitor. Emotion and audio failures only degrade it.
+        error = self.loader.errors.get("face_mesh")
+        if error is not None:
+            raise RuntimeError(f"Face Mesh failed to load: {error}") from error
+
     def send_log(self, data):
+        # Queued for the background uploader (batched, spooled while offline)
         if not self.auth_token: return
+        self.uploader.submit(data)
+
+    def send_events(self, fatigue_data, final_score, emotion):
+        # fatigue_data is None on frames without a face: open episodes time
+        # out and a due heartbeat still goes out
+        now = time.time()
+        if fatigue_data is None:
+            events = self.event_detector.no_face(now)
+        else:
+            events = self.event_detector.update(now, fatigue_data, final_score, emotion, self.alert_active)
+        for event in events:
+            self.event_uploader.submit(event, urgent=True)
+        heartbeat = self.event_detector.heartbeat(now)
+        if heartbeat:
+            self.send_log(heartbeat)
+
+    def process_frame(self, image, timestamp=None):
+        # Inference stage: landmarks, fatigue, emotion, alert decision and log.
+        # timestamp: capture time (perf_counter clock). Returns None when no face is found.
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        frame_h, frame_w, _ = image.shape
+        if self.face_mesh is None and self.roi_tracker is None:
+            self.check_models()
+            return None # Face Mesh still loading
+        image.flags.writeable = False
+        if self.roi_tracker:
+            face_landmarks, region = self.roi_tracker.process(image)
+            faces = [(face_landmarks, region)] if face_landmarks is not None else []
+        else:
+            t0 = time.perf_counter()
+            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=reuse_buffer(self.buffers, "rgb", image.shape, self.alloc_stats))
+            t1 = time.perf_counter()
+            results = self.face_mesh.process(image_rgb)
+            t2 = time.perf_counter()
+            self.stage_timer.record("color", t1 - t0)
+            self.stage_timer.record("face_mesh", t2 - t1)
+            faces = [(lms, (0, 0, frame_w, frame_h)) for lms in results.multi_face_landmarks or []]
+        image.flags.writeable = True
         
-        def _send():
-            try:
-                headers = {"Authorization": f"Bearer {self.auth_token}"}
-                requests.post(f"{self.API_URL}/logs/upload", json=data, headers=headers)
-            except Exception as e:
-                pass # Silent fail for logs
+        face_box = None
+        result = None
+        landmarks = None
+
+        if faces:
+            for face_landmarks, region in faces:
+                # Single landmark conversion shared by face box and fatigue engine
+                t0 = time.perf_counter()
+                x0, y0, region_w, region_h = region
+                landmarks = self.landmark_buffer.update(face_landmarks, region_w, region_h, (x0, y0))
+                face_box = self.landmark_buffer.face_box(frame_w, frame_h)
+                if self.roi_tracker:
+                    self.roi_tracker.update(face_box)
+
+                # Fatigue Engine
+                fatigue_data = self.fatigue_engine.process_landmarks(landmarks, (frame_h, frame_w, 3), timestamp)
+                t1 = time.perf_counter()
+                
+                # Emotion Engine ("neutral" while FER is loading)
+                if self.emotion_worker:
+                    self.emotion_worker.submit(image, face_box)
+                    emotion, emotion_score = self.emotion_worker.latest()
+                elif self.emotion_model:
+                    emotion, emotion_score = self.emotion_model.predict(image, face_box)
+                else:
+                    emotion, emotion_score = "neutral", 0.0
+                t2 = time.perf_counter()
+                self.stage_timer.record("fatigue", t1 - t0)
+                self.stage_timer.record("emotion", t2 - t1)
+                
+                # Composite Logic
+                final_score = composite_score(fatigue_data, emotion)
+                
+                # Alert
+                if final_score > ALERT_THRESHOLD:
+                    self.alert_active = True
+                    if self.alert_sound and not self.alert_sound.get_num_channels():
+                        self.alert_sound.play()
+                else:
+                    self.alert_active = False
+
+                # Prepare Log
+                log_data = {
+                    "fatigue_score": float(final_score),
+                    "emotion": emotion,
+                    "drowsy_status": fatigue_data["drowsy"] # Only report eyes for "Eye Status"
+                }
+                self.current_log = log_data
                 
-        threading.Thread(target=_send).start()
+                # Send Log (throttled), or events + heartbeat
+                if self.event_detector:
+                    self.send_events(fatigue_data, final_score, emotion)
+                elif time.time() - self.prev_log_time > 1.0:
+                    self.send_log(log_data)
+                    self.prev_log_time = time.time()
+
+                now = time.time()
+                if self.telemetry and now - self.prev_telemetry_time >= self.telemetry_period:
+                    self.telemetry.submit(now, fatigue_data, final_score, emotion, self.alert_active)
+                    self.prev_telemetry_time = now
+
+                result = {
+                    "face_box": face_box,
+                    "fatigue": fatigue_data,
+                    "emotion": emotion,
+                    "emotion_score": emotion_score,
+                    "final_score": final_score,
+                    "alert": self.alert_active,
+                }
+
+        if self.event_detector and result is None:
+            self.send_events(None, None, None)
+
+        if self.record_dir:
+            self._record_landmarks(image.shape, landmarks)
+
+        if result is not None and "live" not in self.loader.times:
+            self.loader.mark("live") # First fatigue result
+            self.startup_report()
+        return result
+
+    def _record_landmarks(self, frame_shape, landmarks):
+        if self.landmark_writer is None:
+            self.landmark_writer = LandmarkCacheWriter(self.record_dir, live_key(), frame_shape, source="live")
+            print(f"DriverMonitor: Recording landmarks to {self.landmark_writer.path}")
+        self.landmark_writer.append(time.time(), landmarks)
+
+    def draw_hud(self, image, result):
+        # Render stage: overlays only, no model work
+        if result is None:
+            if not self.loader.ready("face_mesh"):
+                cv2.putText(image, "Loading models...", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            return
+        frame_h, frame_w, _ = image.shape
+        fatigue_data = result["fatigue"]
+
+        if result["alert"]:
+            cv2.rectangle(image, (0, 0), (frame_w, frame_h), (0, 0, 255), 10)
+            cv2.putText(image, "DROWSINESS ALERT!", (50, frame_h // 2), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
+
+        # Visualization
+        cv2.putText(image, f"Score: {result['final_score']:.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        emotion = result["emotion"] if self.loader.ready("emotion") else "loading..."
+        cv2.putText(image, f"Emotion: {emotion}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+        cv2.putText(image, f"EAR: {fatigue_data['ear']:.2f}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+        cv2.putText(image, f"MAR: {fatigue_data['mar']:.2f}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+
+    def render(self, image, result, overlay=None):
+        # Render stage: HUD, window and stream. Returns the key pressed, or None
+        # when skipped (headless unless the stream wants a frame, or between HUD ticks).
+        if self.headless and not (self.streamer and self.streamer.wants_frame()):
+            return None
+        t0 = time.perf_counter()
+        if t0 - self.last_render < self.hud_period:
+            return None
+        self.last_render = t0
+        self.draw_hud(image, result)
+        if overlay:
+            overlay(image)
+        if self.streamer:
+            self.streamer.submit(image)
+        key = None
+        if not self.headless:
+            cv2.imshow('DriveBy.AI Monitor', image)
+            key = cv2.waitKey(1) & 0xFF
+        self.stage_timer.record("render", time.perf_counter() - t0)
+        return key
+
+    def get_stage_stats(self):
+        return self.stage_timer.snapshot()
+
+    def collect_metrics(self):
+        # Snapshot for metrics.py (safe to call from any thread)
+        stages = self.stage_timer.snapshot()
+        for stage, stats in stages.items():
+            stats.update(self.stage_timer.percentiles(stage))
+        queues = dict(self.queues)
+        if self.emotion_worker:
+            queues["emotion"] = self.emotion_worker.pending
+        uploaders = {"logs": self.uploader}
+        if self.event_uploader:
+            uploaders["events"] = self.event_uploader
+        snapshot = {
+            "stages": stages,
+            "histograms": self.stage_timer.histogram_snapshot(),
+            "fps": {stage: self.stage_timer.rate(stage) for stage in ("capture", "inference", "render")},
+            "queue_depth": {name: len(q) for name, q in queues.items()},
+            "dropped_frames": {name: q.dropped for name, q in queues.items()},
+            "upload_backlog": {name: u.backlog() for name, u in uploaders.items()},
+            "uploaded": {name: u.sent for name, u in uploaders.items()},
+            "upload_dropped": {name: u.dropped for name, u in uploaders.items()},
+            "startup_seconds": dict(self.loader.times),
+            "buffer_allocations": dict(self.alloc_stats.buffers),
+            "gc_collections": {str(g): n for g, n in enumerate(self.alloc_stats.gc_collections)},
+            "allocations_per_frame": self.alloc_stats.per_frame(),
+        }
+        if self.telemetry:
+            snapshot["upload_backlog"]["telemetry"] = self.telemetry.backlog()
+            snapshot["uploaded"]["telemetry"] = self.telemetry.sent
+            snapshot["upload_dropped"]["telemetry"] = self.telemetry.dropped
+        return snapshot
+
+    def allocation_report(self):
+        stats = self.alloc_stats
+        per_frame = stats.per_frame()
+        gc_pause = self.stage_timer.percentiles("gc_pause")
+        pause = f", GC pause p99 {gc_pause['p99_ms']:.1f} ms" if gc_pause else ""
+        print(f"DriverMonitor: {stats.frames} frames, {sum(stats.buffers.values())} image buffer allocations "
+              f"({per_frame['buffers']:.3f}/frame), GC collections {stats.gc_collections}{pause}")
+
+    def shutdown(self):
+        self.running = False
+        self.allocation_report()
+        self.alloc_stats.close()
+        if self.emotion_worker:
+            self.emotion_worker.stop()
+        if self.landmark_writer:
+            self.landmark_writer.close()
+        self.uploader.stop()
+        if self.event_detector:
+            for event in self.event_detector.close(time.time()):
+                self.event_uploader.submit(event)
+            self.event_uploader.stop()
+        if self.telemetry:
+            self.telemetry.stop()
+        if self.metrics_dumper:
+            self.metrics_dumper.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.streamer:
+            self.streamer.stop()
+        self.cap.release()
+        if not self.headless:
+            cv2.destroyAllWindows()
 
     def run(self):
+        if self.pipelined:
+            return self.run_pipelined()
+
         print("DriverMonitor: Starting run loop...")
-        prev_time = 0
         
         if not self.cap.isOpened():
             print("DriverMonitor Error: Camera not opened.")
             return
 
         consecutive_failures = 0
-        while self.running and self.cap.isOpened():
-            success, image = self.cap.read()
-            if not success:
-                print("Ignoring empty camera frame.")
-                consecutive_failures += 1
-                if consecutive_failures > 10:
-                    print("Camera failure limit reached. Exiting.")
+        try:
+            while self.running and self.cap.isOpened():
+                t0 = time.perf_counter()
+                success, image = self.frame_pool.read(self.cap)
+                if not success:
+                    print("Ignoring empty camera frame.")
+                    consecutive_failures += 1
+                    if consecutive_failures > 10:
+                        print("Camera failure limit reached. Exiting.")
+                        break
+                    continue
+                consecutive_failures = 0
+                captured_at = time.perf_counter()
+                self.stage_timer.record("capture", captured_at - t0)
+                self.loader.mark("first_frame")
+
+                result = self.process_frame(image, captured_at)
+                self.stage_timer.record("inference", time.perf_counter() - captured_at)
+                key = self.render(image, result)
+                self.frame_pool.release(image)
+                self.alloc_stats.frame()
+                if key == 27:
                     break
-                continue
-            consecutive_failures = 0
+        except KeyboardInterrupt:
+            print("DriverMonitor: Interrupted.")
+        finally:
+            self.shutdown()
 
-            # Performance optimization
-            image.flags.writeable = False
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            results = self.face_mesh.process(image_rgb)
-            image.flags.writeable = True
-
-            frame_h, frame_w, _ = image.shape
-            
-            face_box = None
-
-            if results.multi_face_landmarks:
-                for face_landmarks in results.multi_face_landmarks:
-                    # Calculate Face Box for Emotion
-                    x_min, y_min = frame_w, frame_h
-                    x_max, y_max = 0, 0
-                    for lm in face_landmarks.landmark:
-                        x, y = int(lm.x * frame_w), int(lm.y * frame_h)
-                        if x < x_min: x_min = x
-                        if x > x_max: x_max = x
-                        if y < y_min: y_min = y
-                        if y > y_max: y_max = y
-                    face_box = (x_min, y_min, x_max - x_min, y_max - y_min)
-
-                    # Fatigue Engine
-                    fatigue_data = self.fatigue_engine.process_landmarks(face_landmarks, (frame_h, frame_w, 3))
-                    
-                    # Emotion Engine
-                    emotion, emotion_score = self.emotion_model.predict(image, face_box)
-                    
-                    # Composite Logic
-                    total_score = fatigue_data["fatigue_partial_score"]
-                    if emotion in ["nervous", "fear", "sad", "angry"]:
-                        total_score += 10
-                    
-                    final_score = min(100, total_score)
-                    
-                    # Alert
-                    if final_score > 80:
-                        self.alert_active = True
-                        if self.alert_sound and not pygame.mixer.get_busy():
-                            self.alert_sound.play()
-                        cv2.rectangle(image, (0, 0), (frame_w, frame_h), (0, 0, 255), 10)
-                        cv2.putText(image, "DROWSINESS ALERT!", (50, frame_h // 2), 
-                                    cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
-                    else:
-                        self.alert_active = False
-
-                    # Prepare Log
-                    log_data = {
-                        "fatigue_score": float(final_score),
-                        "emotion": emotion,
-                        "drowsy_status": fatigue_data["drowsy"] # Only report eyes for "Eye Status"
-                    }
-                    self.current_log = log_data
-                    
-                    # Send Log (throttled)
-                    if time.time() - prev_time > 1.0:
-                        self.send_log(log_data)
-                        prev_time = time.time()
-
-                    # Visualization
-                    cv2.putText(image, f"Score: {final_score:.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    cv2.putText(image, f"Emotion: {emotion}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-                    cv2.putText(image, f"EAR: {fatigue_data['ear']:.2f}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-                    cv2.putText(image, f"MAR: {fatigue_data['mar']:.2f}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+    def run_pipelined(self):
+        # Capture -> inference -> render, each on its own thread and linked by
+        # drop-oldest queues, so FPS is bounded by the slowest stage rather
+        # than the sum of all stages and stale frames are never processed.
+        print("DriverMonitor: Starting pipelined run loop...")
 
-            cv2.imshow('DriveBy.AI Monitor', image)
-            if cv2.waitKey(5) & 0xFF == 27:
-                break
-        
-        self.cap.release()
-        cv2.destroyAllWindows()
+        if not self.cap.isOpened():
+            print("DriverMonitor Error: Camera not opened.")
+            return
+
+        # Frames dropped by a queue go straight back to the pool (image is item[2] in both)
+        recycle = lambda item: self.frame_pool.release(item[2])
+        frame_queue = DropOldestQueue(maxsize=1, on_drop=recycle)
+        render_queue = DropOldestQueue(maxsize=2, on_drop=recycle)
+        self.queues = {"capture": frame_queue, "render": render_queue}
+        capture = CaptureThread(self.cap, frame_queue, self.stage_timer, pool=self.frame_pool)
+
+        def _inference_loop():
+            try:
+                while self.running:
+                    item = frame_queue.get(timeout=0.5)
+                    if item is None:
+                        if frame_queue.closed:
+                            break
+                        continue
+                    frame_id, captured_at, image = item
+                    self.loader.mark("first_frame")
+                    t0 = time.perf_counter()
+                    result = self.process_frame(image, captured_at)
+                    done = time.perf_counter()
+                    self.stage_timer.record("inference", done - t0)
+                    self.stage_timer.record("glass_to_alert", done - captured_at)
+                    render_queue.put((frame_id, captured_at, image, result))
+            except Exception as e:
+                # Re-raised on the main thread after shutdown (e.g. Face Mesh failed to load)
+                self.fatal_error = e
+                self.running = False
+            finally:
+                render_queue.close()
+
+        inference = threading.Thread(target=_inference_loop, daemon=True)
+        capture.start()
+        inference.start()
+
+        def _latency_overlay(image):
+            latency = self.stage_timer.snapshot().get("glass_to_alert")
+            if latency:
+                cv2.putText(image, f"Latency: {latency['avg_ms']:.0f} ms", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+        # Rendering stays on the main thread (required by most HighGUI backends)
+        try:
+            while self.running:
+                item = render_queue.get(timeout=0.5)
+                if item is None:
+                    if render_queue.closed:
+                        break
+                    if not self.headless and cv2.waitKey(1) & 0xFF == 27:
+                        break
+                    continue
+                frame_id, captured_at, image, result = item
+                key = self.render(image, result, _latency_overlay)
+                self.frame_pool.release(image)
+                self.alloc_stats.frame()
+                # Every frame that reaches this stage, drawn or not (headless, between HUD ticks)
+                self.stage_timer.record("end_to_end", time.perf_counter() - captured_at)
+                if key == 27:
+                    break
+        except KeyboardInterrupt:
+            print("DriverMonitor: Interrupted.")
+
+        self.running = False
+        capture.stop()
+        frame_queue.close()
+        capture.join(timeout=1.0)
+        inference.join(timeout=1.0)
+        print(f"DriverMonitor: Dropped frames (capture/render): {frame_queue.dropped}/{render_queue.dropped}")
+
+        self.shutdown()
+        if self.fatal_error is not None:
+            raise self.fatal_error
 
 if __name__ == "__main__":
     monitor = DriverMonitor()
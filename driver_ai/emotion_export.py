@@ -0,0 +1,124 @@
+import argparse
+import os
+import tempfile
+import cv2
+from emotion_model import LABELS, MODEL_DIR, preprocess
+
+# Builds the model for the ONNX emotion backend from FER's bundled Keras
+# network, so the engine can classify emotions without TensorFlow:
+#
+#   python emotion_export.py --calibrate clip.mp4
+#
+# 1. Keras -> ONNX float32 via tf2onnx (export time only: needs fer,
+#    tensorflow and tf2onnx, none of which the engine needs afterwards).
+# 2. Static int8 quantization (QDQ, per-channel int8 weights, uint8
+#    activations) with activation ranges calibrated on MediaPipe face crops
+#    from a clip. Without --calibrate, weights-only dynamic quantization.
+#
+# Compare the result against FER with `python benchmark.py emotion`.
+
+
+def collect_face_crops(path, max_crops=500, every=5):
+    # BGR face crops cut from the MediaPipe face box, every Nth frame of a clip
+    from face_tracker import create_face_mesh
+    from utils import LandmarkBuffer
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {path}")
+    face_mesh = create_face_mesh()
+    landmark_buffer = LandmarkBuffer()
+    crops = []
+    frame_idx = 0
+    try:
+        while len(crops) < max_crops:
+            success, image = cap.read()
+            if not success:
+                break
+            frame_idx += 1
+            if (frame_idx - 1) % every:
+                continue
+            results = face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            if not results.multi_face_landmarks:
+                continue
+            frame_h, frame_w, _ = image.shape
+            landmark_buffer.update(results.multi_face_landmarks[0], frame_w, frame_h)
+            x, y, w, h = landmark_buffer.face_box(frame_w, frame_h)
+            x0, y0 = max(0, x), max(0, y)
+            crop = image[y0:min(frame_h, y + h), x0:min(frame_w, x + w)]
+            if crop.size:
+                crops.append(crop.copy())
+    finally:
+        cap.release()
+        face_mesh.close()
+    return crops
+
+
+def export_float(output):
+    try:
+        import tensorflow as tf
+        import tf2onnx
+        from fer import FER
+    except ImportError as e:
+        raise RuntimeError(f"Exporting needs fer, tensorflow and tf2onnx ({e})")
+    model = FER(mtcnn=False)._FER__emotion_classifier
+    if model.output_shape[-1] != len(LABELS):
+        raise RuntimeError(f"FER model has {model.output_shape[-1]} outputs, expected {len(LABELS)}")
+    h, w = model.input_shape[1:3]
+    spec = [tf.TensorSpec((None, h, w, 1), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=output)
+    print(f"Float model written to {output} (input {h}x{w})")
+    return output
+
+
+def quantize(float_path, output, crops=None):
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    import onnxruntime as ort
+    model_input = ort.InferenceSession(float_path, providers=["CPUExecutionProvider"]).get_inputs()[0]
+    channels_first = model_input.shape[1] == 1
+    size = tuple(model_input.shape[2:4]) if channels_first else tuple(model_input.shape[1:3])
+
+    class CropReader(CalibrationDataReader):
+        def __init__(self):
+            self.crops = iter(crops)
+
+        def get_next(self):
+            crop = next(self.crops, None)
+            if crop is None:
+                return None
+            batch = preprocess([crop], size)
+            return {model_input.name: batch[:, None] if channels_first else batch[..., None]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference and graph fusions first, so quantization sees the final graph
+        prepared = os.path.join(tmp, "prepared.onnx")
+        quant_pre_process(float_path, prepared, skip_symbolic_shape=True) # Only the batch dimension is dynamic
+        if not crops:
+            print("No calibration crops: quantizing weights only (dynamic)")
+            quantize_dynamic(prepared, output, weight_type=QuantType.QInt8)
+            return output
+        quantize_static(prepared, output, CropReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    print(f"int8 model written to {output} (calibrated on {len(crops)} face crops)")
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export FER's emotion network to an int8 ONNX model")
+    parser.add_argument("--calibrate", metavar="VIDEO", help="Clip with a visible driver for activation calibration")
+    parser.add_argument("--max-crops", type=int, default=500)
+    parser.add_argument("--float-output", default=os.path.join(MODEL_DIR, "emotion_fp32.onnx"))
+    parser.add_argument("--output", default=os.path.join(MODEL_DIR, "emotion_int8.onnx"))
+    parser.add_argument("--from-onnx", metavar="PATH", help="Quantize an existing float ONNX model instead of exporting FER's")
+    args = parser.parse_args(argv)
+
+    for path in (args.output, args.float_output):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    float_path = args.from_onnx or export_float(args.float_output)
+    crops = collect_face_crops(args.calibrate, args.max_crops) if args.calibrate else None
+    quantize(float_path, args.output, crops)
+    print(f"Use it with: python main.py <email> <password> --emotion-backend onnx --emotion-model {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,110 @@
-from fer import FER
+import os
 import cv2
 import numpy as np
+import threading
+import time
+from pipeline import DropOldestQueue
+
+# Emotion classification behind a small backend interface:
+# backend.classify(crops) -> [(label, score)] for face crops (BGR or
+# grayscale) cut from the MediaPipe face box. Every backend gets the same
+# preprocessing: grayscale, resized to the model input, scaled to [-1, 1]
+# like FER's preprocess_input(v2=True).
+#
+#   fer   FER's Keras mini-Xception on TensorFlow (default)
+#   onnx  the same network exported to ONNX and int8-quantized by
+#         emotion_export.py, run on ONNX Runtime; no TensorFlow in the process
+
+LABELS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral") # FER's output order
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+DEFAULT_ONNX_MODEL = os.path.join(MODEL_DIR, "emotion_int8.onnx")
+
+
+def preprocess(crops, size):
+    # size: model input (h, w). Returns float32 (N, h, w)
+    h, w = size
+    batch = np.empty((len(crops), h, w), np.float32)
+    for i, crop in enumerate(crops):
+        gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        batch[i] = cv2.resize(gray, (w, h))
+    batch /= 127.5 # (x / 255 - 0.5) * 2
+    batch -= 1.0
+    return batch
+
+
+def top_labels(probs):
+    return [(LABELS[int(p.argmax())], float(p.max())) for p in probs]
+
+
+class FerBackend:
+    name = "fer"
+
+    def __init__(self, model_path=None):
+        from fer import FER # Pulls in TensorFlow: imported on first use, not with this module
+        self.detector = FER(mtcnn=False) # OpenCV Haar cascade, only used without a face box
+        self.classifier = getattr(self.detector, "_FER__emotion_classifier", None)
+        self.input_size = tuple(self.classifier.input_shape[1:3]) if self.classifier is not None else None
+
+    def classify(self, crops):
+        if self.classifier is None:
+            # FER internals changed: go through its public API (runs Haar on each crop)
+            return [self.top_emotion(crop) for crop in crops]
+        probs = self.classifier.predict(preprocess(crops, self.input_size)[..., None], verbose=0)
+        return top_labels(probs)
+
+    def top_emotion(self, image):
+        # FER's own path: Haar face detection inside the image, then classification
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        emotion, score = self.detector.top_emotion(image)
+        return emotion if emotion else "neutral", score if score else 0.0
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_path=None, threads=1):
+        # One intra-op thread: emotion runs beside the fatigue path and must not take its cores
+        import onnxruntime as ort
+        model_path = model_path or DEFAULT_ONNX_MODEL
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found; create it with `python emotion_export.py --calibrate <clip>`")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape # NHWC from the Keras export, NCHW from other exporters
+        self.channels_first = shape[1] == 1
+        self.input_size = tuple(shape[2:4]) if self.channels_first else tuple(shape[1:3])
+
+    def classify(self, crops):
+        batch = preprocess(crops, self.input_size)
+        batch = batch[:, None] if self.channels_first else batch[..., None]
+        probs = self.session.run(None, {self.input_name: batch})[0]
+        return top_labels(probs)
+
+
+BACKENDS = {"fer": FerBackend, "onnx": OnnxBackend}
+
 
 class EmotionModel:
-    def __init__(self):
-        print("EmotionModel: Initializing FER...")
-        # Initialize FER with mtcnn=True for better face detection if needed, 
-        # or simplified. MTCNN is slower but accurate. 
-        # For real-time, maybe use default opencv cascade in FER or just pass face crop.
+    def __init__(self, backend="fer", model_path=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown emotion backend: {backend} (expected one of {', '.join(BACKENDS)})")
+        print(f"EmotionModel: Initializing {backend} backend...")
         try:
-            self.detector = FER(mtcnn=False) # Use OpenCV Haarcascade for speed
-            print("EmotionModel: FER Initialized.")
+            self.backend = BACKENDS[backend](model_path)
+            print(f"EmotionModel: {backend} backend initialized.")
         except Exception as e:
-            print(f"Warning: FER initialization failed: {e}")
-            self.detector = None
+            print(f"Warning: Emotion backend '{backend}' initialization failed: {e}")
+            self.backend = None
 
     def predict(self, frame, face_box=None):
-        if self.detector is None:
+        # face_box: MediaPipe face box in frame pixels; the crop goes straight to the classifier
+        if self.backend is None:
             return "neutral", 0.0
-
-        # FER expects full frame. If face_box provided, clearer.
-        # But FER has internal detection. 
-        # To speed up, if we already have face from MediaPipe, we should crop and pass.
-        # However, FER `detect_emotions` takes an image.
-        
         try:
             if face_box:
                 x, y, w, h = face_box
@@ -33,13 +114,110 @@ class EmotionModel:
                 w = min(W-x, w); h = min(H-y, h)
                 face_img = frame[y:y+h, x:x+w]
                 if face_img.size == 0: return "neutral", 0.0
-                
-                # FER top_emotion returns (emotion, score)
-                emotion, score = self.detector.top_emotion(face_img)
-            else:
-                emotion, score = self.detector.top_emotion(frame)
-                
-            return emotion if emotion else "neutral", score if score else 0.0
+                return self.backend.classify([face_img])[0]
+            if isinstance(self.backend, FerBackend):
+                return self.backend.top_emotion(frame)
+            return self.backend.classify([frame])[0]
         except Exception as e:
             print(f"Emotion prediction error: {e}")
             return "neutral", 0.0
+
+    def predict_batch(self, crops):
+        # One forward pass for many face crops (BGR or grayscale)
+        if self.backend is None or not crops:
+            return [("neutral", 0.0)] * len(crops)
+        try:
+            return self.backend.classify(crops)
+        except Exception as e:
+            print(f"Emotion batch prediction error: {e}")
+            return [("neutral", 0.0)] * len(crops)
+
+    def warm_up(self):
+        # The first forward pass sets up the runtime's kernels; pay for it at startup, not on the first face
+        if self.backend is not None:
+            self.predict_batch([np.zeros((64, 64), np.uint8)])
+
+
+class AsyncEmotionWorker:
+    # Runs EmotionModel.predict on a background thread at a decoupled cadence.
+    # Emotion changes over seconds, so the per-frame fatigue path only submits
+    # crops occasionally and reads the latest result without blocking.
+    # model may be None while FER is still loading; set it once ready.
+    CROP_SIZE = 64 # Classifier input; crops are downscaled once, at submit time
+
+    def __init__(self, model, every_n_frames=10, move_thresh=0.25, timer=None):
+        self.model = model
+        self.every_n_frames = every_n_frames
+        self.move_thresh = move_thresh # Fraction of face width
+        self.timer = timer
+
+        self.pending = DropOldestQueue(maxsize=1)
+        # One crop in flight at a time (busy), so a single buffer is enough
+        self.crop = np.empty((self.CROP_SIZE, self.CROP_SIZE, 3), np.uint8)
+        self.lock = threading.Lock()
+        self.result = ("neutral", 0.0)
+        self.busy = False
+        self.frames_since_submit = every_n_frames # Submit on first face
+        self.last_box = None
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.pending.close()
+        if self.thread.is_alive():
+            self.thread.join(timeout=1.0)
+
+    def _box_moved(self, face_box):
+        if self.last_box is None:
+            return True
+        x, y, w, h = face_box
+        px, py, pw, ph = self.last_box
+        scale = max(pw, 1)
+        shift = max(abs((x + w / 2) - (px + pw / 2)), abs((y + h / 2) - (py + ph / 2)))
+        return shift / scale > self.move_thresh or abs(w - pw) / scale > self.move_thresh
+
+    def submit(self, frame, face_box):
+        # Returns True if a new prediction was scheduled for this frame
+        self.frames_since_submit += 1
+        if self.busy or self.model is None:
+            return False
+        if self.frames_since_submit < self.every_n_frames and not self._box_moved(face_box):
+            return False
+
+        x, y, w, h = face_box
+        H, W, _ = frame.shape
+        x = max(0, x); y = max(0, y)
+        w = min(W-x, w); h = min(H-y, h)
+        if w <= 0 or h <= 0:
+            return False
+        # Downscale into our own buffer: the caller keeps drawing on / recycling the frame
+        face_img = cv2.resize(frame[y:y+h, x:x+w], (self.CROP_SIZE, self.CROP_SIZE), dst=self.crop)
+
+        self.busy = True
+        self.frames_since_submit = 0
+        self.last_box = face_box
+        self.pending.put(face_img)
+        return True
+
+    def latest(self):
+        with self.lock:
+            return self.result
+
+    def _loop(self):
+        while self.running:
+            face_img = self.pending.get(timeout=0.5)
+            if face_img is None:
+                continue
+            t0 = time.perf_counter()
+            h, w, _ = face_img.shape
+            result = self.model.predict(face_img, (0, 0, w, h))
+            if self.timer:
+                self.timer.record("emotion_async", time.perf_counter() - t0)
+            with self.lock:
+                self.result = result
+            self.busy = False
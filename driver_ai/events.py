@@ -0,0 +1,115 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+# Edge-side event detection on top of FatigueEngine output. Instead of a
+# sample every second, the driver reports state changes: an episode emits a
+# "start" event as soon as its condition turns on (alerts reach the backend
+# immediately) and an "end" event with its duration and peak value when it
+# turns off. A heartbeat log summarizes the quiet periods in between; its
+# `duration` tells the backend rollups how many seconds it stands for.
+#
+#   eye_closure  drowsy flag (eyes closed past EYE_CLOSED_SECONDS), peak = lowest EAR
+#   yawn         yawn flag, peak = highest MAR
+#   head_tilt    head_tilt flag, peak = largest |pitch| or |roll| in degrees
+#   alert        composite score over ALERT_THRESHOLD, peak = highest score
+
+EPISODES = {
+    "eye_closure": (lambda d, score, alert: d["drowsy"], lambda d, score: d["ear"], min),
+    "yawn": (lambda d, score, alert: d["yawn"], lambda d, score: d["mar"], max),
+    "head_tilt": (lambda d, score, alert: d["head_tilt"], lambda d, score: max(abs(d["pitch"]), abs(d["roll"])), max),
+    "alert": (lambda d, score, alert: alert, lambda d, score: score, max),
+}
+
+
+def iso_utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class EventDetector:
+    # timestamps are wall-clock seconds (time.time())
+    def __init__(self, heartbeat_interval=30.0, max_gap=1.0, face_lost_timeout=2.0):
+        self.heartbeat_interval = heartbeat_interval
+        self.max_gap = max_gap # Longer gaps between frames (face lost) count as this much time
+        self.face_lost_timeout = face_lost_timeout
+        self.open = {} # kind -> {"started_at", "peak", "score"}
+        self.last_heartbeat = None
+        self.last_update = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self.window_seconds = 0.0
+        self.window_drowsy_seconds = 0.0
+        self.window_score_sum = 0.0
+        self.window_frames = 0
+        self.window_drowsy = False
+        self.window_emotions = Counter()
+
+    def update(self, timestamp, fatigue_data, final_score, emotion, alert):
+        # Returns the events triggered by this frame (usually none)
+        if self.last_update is not None:
+            dt = min(max(0.0, timestamp - self.last_update), self.max_gap)
+            self.window_seconds += dt
+            if fatigue_data["drowsy"]:
+                self.window_drowsy_seconds += dt
+        self.last_update = timestamp
+        self.window_score_sum += final_score
+        self.window_frames += 1
+        self.window_drowsy = self.window_drowsy or fatigue_data["drowsy"]
+        self.window_emotions[emotion] += 1
+
+        events = []
+        for kind, (active, value, better) in EPISODES.items():
+            episode = self.open.get(kind)
+            if active(fatigue_data, final_score, alert):
+                v = float(value(fatigue_data, final_score))
+                if episode is None:
+                    # The drowsy flag only turns on after EYE_CLOSED_SECONDS; date the episode from eye closure
+                    started_at = timestamp - fatigue_data["eye_closed_time"] if kind == "eye_closure" else timestamp
+                    self.open[kind] = {"started_at": started_at, "peak": v, "score": float(final_score)}
+                    events.append({"kind": kind, "phase": "start", "timestamp": iso_utc(started_at),
+                                   "peak": v, "score": float(final_score)})
+                else:
+                    episode["peak"] = better(episode["peak"], v)
+                    episode["score"] = max(episode["score"], float(final_score))
+            elif episode is not None:
+                events.append(self._end(kind, timestamp))
+        return events
+
+    def _end(self, kind, timestamp):
+        episode = self.open.pop(kind)
+        return {"kind": kind, "phase": "end", "timestamp": iso_utc(timestamp),
+                "duration": timestamp - episode["started_at"], "peak": episode["peak"], "score": episode["score"]}
+
+    def no_face(self, timestamp):
+        # Frame without a face (head drop, looking away): once the face has been
+        # gone for face_lost_timeout, ends every open episode as of the last
+        # frame it was seen, so the backend is not left with open episodes
+        if not self.open or timestamp - self.last_update < self.face_lost_timeout:
+            return []
+        return [self._end(kind, self.last_update) for kind in list(self.open)]
+
+    def close(self, timestamp):
+        # Ends every open episode, e.g. on shutdown
+        return [self._end(kind, timestamp) for kind in list(self.open)]
+
+    def heartbeat(self, timestamp):
+        # Log sample summarizing the last interval (mean score, any drowsiness,
+        # most frequent emotion, seconds covered and drowsy seconds within
+        # them), or None if the interval has not elapsed. Peaks are carried by
+        # the alert events.
+        if self.last_heartbeat is None:
+            self.last_heartbeat = timestamp
+            return None
+        if timestamp - self.last_heartbeat < self.heartbeat_interval or not self.window_emotions:
+            return None
+        sample = {
+            "fatigue_score": self.window_score_sum / self.window_frames,
+            "emotion": self.window_emotions.most_common(1)[0][0],
+            "drowsy_status": bool(self.window_drowsy),
+            "duration": max(self.window_seconds, 1.0),
+            "drowsy_seconds": self.window_drowsy_seconds,
+            "timestamp": iso_utc(timestamp),
+        }
+        self.last_heartbeat = timestamp
+        self._reset_window()
+        return sample
@@ -0,0 +1,94 @@
+import time
+import cv2
+import numpy as np
+from pipeline import reuse_buffer
+
+def create_face_mesh():
+    import mediapipe as mp
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+
+class FaceRoiTracker:
+    # Runs Face Mesh on a small crop around the last known face instead of the
+    # full camera frame. Without a track (start-up, or the face was lost) it
+    # searches a downscaled full frame. Landmarks come back normalized to the
+    # processed region, which is returned in full-frame pixels.
+    def __init__(self, max_side=640, roi_size=256, margin=0.35, timer=None, stats=None):
+        self.max_side = max_side # Longest side for full-frame search
+        self.roi_size = roi_size # Crops are resized to roi_size x roi_size
+        self.margin = margin     # Padding around the face box, fraction of its size
+        self.timer = timer
+        self.stats = stats # Optional AllocationStats
+        self.buffers = {} # Resize/RGB scratch arrays, one set per graph
+        # Separate graphs: MediaPipe's internal tracking assumes a stable input geometry
+        self.search_mesh = create_face_mesh()
+        self.roi_mesh = create_face_mesh()
+        self.face_box = None
+        self.track_losses = 0
+
+    def _record(self, stage, seconds):
+        if self.timer:
+            self.timer.record(stage, seconds)
+
+    def _roi_region(self, frame_w, frame_h):
+        x, y, w, h = self.face_box
+        side = int(max(w, h) * (1 + 2 * self.margin))
+        side = min(side, frame_w, frame_h)
+        cx, cy = x + w / 2, y + h / 2
+        x0 = int(min(max(cx - side / 2, 0), frame_w - side))
+        y0 = int(min(max(cy - side / 2, 0), frame_h - side))
+        return (x0, y0, side, side)
+
+    def _run(self, mesh, image, region, size):
+        x0, y0, w, h = region
+        t0 = time.perf_counter()
+        name = "roi" if mesh is self.roi_mesh else "search"
+        crop = image[y0:y0+h, x0:x0+w] # View, no copy
+        if size != (w, h):
+            interpolation = cv2.INTER_AREA if size[0] < w else cv2.INTER_LINEAR
+            resized = reuse_buffer(self.buffers, f"{name}_resize", (size[1], size[0], 3), self.stats)
+            crop = cv2.resize(crop, size, dst=resized, interpolation=interpolation)
+        crop_rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB, dst=reuse_buffer(self.buffers, f"{name}_rgb", crop.shape, self.stats))
+        t1 = time.perf_counter()
+        results = mesh.process(crop_rgb)
+        self._record("color", t1 - t0)
+        self._record("face_mesh", time.perf_counter() - t1)
+        if results.multi_face_landmarks:
+            return results.multi_face_landmarks[0]
+        return None
+
+    def process(self, image):
+        # Returns (face_landmarks, region) or (None, None)
+        frame_h, frame_w, _ = image.shape
+        if self.face_box is not None:
+            region = self._roi_region(frame_w, frame_h)
+            face_landmarks = self._run(self.roi_mesh, image, region, (self.roi_size, self.roi_size))
+            if face_landmarks is not None:
+                return face_landmarks, region
+            # Track lost: fall back to a full-frame search on this same frame
+            self.face_box = None
+            self.track_losses += 1
+
+        scale = min(1.0, self.max_side / max(frame_w, frame_h))
+        size = (int(frame_w * scale), int(frame_h * scale))
+        region = (0, 0, frame_w, frame_h)
+        face_landmarks = self._run(self.search_mesh, image, region, size)
+        if face_landmarks is not None:
+            return face_landmarks, region
+        return None, None
+
+    def warm_up(self, shape=(480, 640, 3)):
+        # One pass through each graph on a blank frame (no face, so no track is started)
+        blank = np.zeros(shape, np.uint8)
+        self.search_mesh.process(blank)
+        self.roi_mesh.process(blank[:self.roi_size, :self.roi_size])
+
+    def update(self, face_box):
+        # Called with the face box computed from this frame's landmarks
+        x, y, w, h = face_box
+        self.face_box = face_box if w > 1 and h > 1 else None
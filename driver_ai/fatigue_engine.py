@@ -1,30 +1,92 @@
-from utils import calculate_ear, calculate_mar, get_head_pose
+from utils import calculate_ear, calculate_mar, get_head_pose, rotation_to_angles
 import time
+from collections import deque
 import numpy as np
-import cv2
+
+NEGATIVE_EMOTIONS = ["nervous", "fear", "sad", "angry"]
+ALERT_THRESHOLD = 80
+
+def composite_score(fatigue_data, emotion):
+    # Fatigue partial score plus a penalty for negative emotions, capped at 100
+    total_score = fatigue_data["fatigue_partial_score"]
+    if emotion in NEGATIVE_EMOTIONS:
+        total_score += 10
+    return min(100, total_score)
+
+class SlidingTimeWindow:
+    # Time-weighted mean of a 0/1 signal over the last window_seconds.
+    # Fixed-capacity ring with running sums: O(1) amortized per sample.
+    def __init__(self, window_seconds, capacity=4096):
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.times = [0.0] * capacity
+        self.weights = [0.0] * capacity
+        self.values = [0.0] * capacity
+        self.head = 0
+        self.size = 0
+        self.total = 0.0
+        self.weighted = 0.0
+
+    def _evict(self):
+        i = self.head
+        self.total -= self.weights[i]
+        self.weighted -= self.weights[i] * self.values[i]
+        self.head = (i + 1) % self.capacity
+        self.size -= 1
+
+    def add(self, timestamp, dt, value):
+        if self.size == self.capacity:
+            self._evict()
+        i = (self.head + self.size) % self.capacity
+        self.times[i] = timestamp
+        self.weights[i] = dt
+        self.values[i] = value
+        self.size += 1
+        self.total += dt
+        self.weighted += dt * value
+        cutoff = timestamp - self.window_seconds
+        while self.size and self.times[self.head] <= cutoff:
+            self._evict()
+
+    def mean(self):
+        if self.total <= 1e-9:
+            return 0.0
+        return min(1.0, max(0.0, self.weighted / self.total))
+
 class FatigueEngine:
     def __init__(self):
-        # Config Thresholds
+        # Config Thresholds (durations in seconds, so behavior does not depend on FPS;
+        # the defaults equal the previous 20-frame limits at 30 FPS)
         self.EYE_AR_THRESH = 0.20
-        self.EYE_AR_CONSEC_FRAMES = 20
+        self.EYE_CLOSED_SECONDS = 20 / 30
         self.MAR_THRESH = 0.60
-        self.YAWN_FRAMES = 20
+        self.YAWN_SECONDS = 20 / 30
+        self.PERCLOS_WINDOW = 60.0 # seconds
+        self.YAWN_RATE_WINDOW = 60.0 # seconds
+        self.MAX_SAMPLE_GAP = 0.5 # seconds; longer gaps (no face, stalls) are not counted
+        self.DEFAULT_DT = 1 / 30 # First sample
         
-        # Counters
-        self.counter_eyes = 0
-        self.counter_yawn = 0
+        # Durations of the current closure / yawn
+        self.eyes_closed_time = 0.0
+        self.yawn_time = 0.0
+        self.yawn_counted = False
         self.total_yawns = 0
+        self.last_timestamp = None
         
         self.start_time = time.time()
-        self.yawn_frequency = 0
+        self.perclos = SlidingTimeWindow(self.PERCLOS_WINDOW, capacity=int(self.PERCLOS_WINDOW * 120)) # Up to 120 FPS
+        self.yawn_times = deque()
         
-        # Tracking history for weighted score
-        self.eye_closed_duration = 0
+        # Tracking history for weighted score (seconds)
+        self.eye_closed_duration = 0.0
         
-    def process_landmarks(self, face_landmarks, frame_shape):
-        # MediaPipe landmarks to numpy array
+    def process_landmarks(self, face_landmarks, frame_shape, timestamp=None):
+        # MediaPipe landmarks to numpy array (or an already converted (N, 2) pixel array)
         h, w, c = frame_shape
-        landmarks = np.array([(lm.x * w, lm.y * h) for lm in face_landmarks.landmark])
+        if isinstance(face_landmarks, np.ndarray):
+            landmarks = face_landmarks
+        else:
+            landmarks = np.array([(lm.x * w, lm.y * h) for lm in face_landmarks.landmark])
         
         # EAR
         # Left Eye: 33 (P1), 160 (P2), 158 (P3), 133 (P4), 153 (P5), 144 (P6)
@@ -49,40 +111,56 @@ class FatigueEngine:
             landmarks[291]  # Right
         )
         
+        # Head Pose (Tilt)
+        rot_vec, trans_vec, cam_matrix, dist_coeffs = get_head_pose(landmarks, frame_shape)
+        pitch, yaw, roll = rotation_to_angles(rot_vec)
+
+        return self.update(avg_ear, mar, pitch, yaw, roll, timestamp)
+
+    def update(self, avg_ear, mar, pitch, yaw, roll, timestamp=None):
+        # State update from per-frame metrics; also used to replay cached
+        # metrics (threshold sweeps) without recomputing landmarks.
+        # timestamp: sample time in seconds (any monotonic clock); defaults to now
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.last_timestamp is None:
+            dt = self.DEFAULT_DT
+        else:
+            dt = min(max(timestamp - self.last_timestamp, 0.0), self.MAX_SAMPLE_GAP)
+        self.last_timestamp = timestamp
+
         # Fatigue Logic
         drowsy = False
         yawn = False
+        eyes_closed = avg_ear < self.EYE_AR_THRESH
         
         # Eyes
-        if avg_ear < self.EYE_AR_THRESH:
-            self.counter_eyes += 1
-            if self.counter_eyes >= self.EYE_AR_CONSEC_FRAMES:
+        if eyes_closed:
+            self.eyes_closed_time += dt
+            if self.eyes_closed_time >= self.EYE_CLOSED_SECONDS - 1e-9:
                 drowsy = True
-                self.eye_closed_duration += 1 # Frame count
+                self.eye_closed_duration += dt
         else:
-            self.counter_eyes = 0
-            self.eye_closed_duration = max(0, self.eye_closed_duration - 1)
+            self.eyes_closed_time = 0.0
+            self.eye_closed_duration = max(0.0, self.eye_closed_duration - dt)
+        self.perclos.add(timestamp, dt, 1.0 if eyes_closed else 0.0)
             
         # Yawn
         if mar > self.MAR_THRESH:
-            self.counter_yawn += 1
-            if self.counter_yawn >= self.YAWN_FRAMES:
+            self.yawn_time += dt
+            if self.yawn_time >= self.YAWN_SECONDS - 1e-9:
                 yawn = True
-                if self.counter_yawn == self.YAWN_FRAMES: # Count once per yawn
+                if not self.yawn_counted: # Count once per yawn
+                    self.yawn_counted = True
                     self.total_yawns += 1
+                    self.yawn_times.append(timestamp)
         else:
-            self.counter_yawn = 0
+            self.yawn_time = 0.0
+            self.yawn_counted = False
+        while self.yawn_times and self.yawn_times[0] <= timestamp - self.YAWN_RATE_WINDOW:
+            self.yawn_times.popleft()
             
-        # Head Pose (Tilt)
-        rot_vec, trans_vec, cam_matrix, dist_coeffs = get_head_pose(landmarks, frame_shape)
-        rmat, _ = cv2.Rodrigues(rot_vec)
-        angles, _, _, _, _, _ = cv2.RQDecomp3x3(rmat)
-        
-        # angles: pitch, yaw, roll
-        pitch = angles[0] * 360
-        yaw = angles[1] * 360
-        roll = angles[2] * 360
-        
+        # Head Tilt
         head_tilt = False
         if abs(pitch) > 20 or abs(roll) > 20: # Looking down or tilted
             head_tilt = True
@@ -106,5 +184,11 @@ class FatigueEngine:
             "head_tilt": head_tilt,
             "ear": avg_ear,
             "mar": mar,
+            "pitch": pitch,
+            "yaw": yaw,
+            "roll": roll,
+            "eye_closed_time": self.eyes_closed_time,
+            "perclos": self.perclos.mean(),
+            "yawn_rate": len(self.yawn_times) * 60.0 / self.YAWN_RATE_WINDOW, # per minute
             "fatigue_partial_score": min(100, partial_score) # Max 100
         }
@@ -0,0 +1,213 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+from fatigue_engine import FatigueEngine
+from utils import NUM_LANDMARKS, compute_metrics_batch
+
+# On-disk landmark cache for recorded sessions. Each session is a directory
+# named by its key (video hash, or live-<timestamp>) holding raw arrays that
+# np.memmap can open without reading them into memory:
+#
+#   meta.json       frame count, frame shape, landmark dtype, source
+#   timestamps.bin  float64 (N,)          seconds
+#   has_face.bin    uint8   (N,)
+#   landmarks.bin   float16/float32 (N, 478, 2) pixel coordinates, NaN if no face
+#   emotion.bin     uint8   (N,)          index into meta emotion_labels, 255 if
+#                                         none (only when recorded with emotions)
+#   metrics.npz     EAR/MAR/pitch/yaw/roll, computed on first use
+#
+# Threshold tuning then replays FatigueEngine.update over the cached metrics
+# instead of re-running Face Mesh on every clip.
+
+NO_EMOTION = 255 # emotion.bin value for frames without a face
+
+def video_key(path, chunk_size=1 << 20):
+    # Hash of size + first/last MiB: stable for a file, cheap for hours of footage
+    h = hashlib.sha1()
+    size = os.path.getsize(path)
+    h.update(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            h.update(f.read(chunk_size))
+    return h.hexdigest()[:16]
+
+def live_key():
+    return time.strftime("live-%Y%m%d-%H%M%S")
+
+
+class LandmarkCacheWriter:
+    # Appends one frame at a time, so it works for live runs of unknown length
+    def __init__(self, cache_dir, key, frame_shape, dtype="float16", source=None, emotions=False):
+        self.path = os.path.join(cache_dir, key)
+        os.makedirs(self.path, exist_ok=True)
+        self.frame_shape = tuple(int(v) for v in frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.source = source
+        self.count = 0
+        self.empty = np.full((NUM_LANDMARKS, 2), np.nan, dtype=self.dtype)
+        self.emotion_labels = [] if emotions else None
+        names = ("timestamps", "has_face", "landmarks") + (("emotion",) if emotions else ())
+        self.files = {name: open(os.path.join(self.path, f"{name}.bin"), "wb") for name in names}
+
+    def append(self, timestamp, landmarks, emotion=None):
+        # emotion: label the frame was scored with, so replays reproduce its final_score
+        has_face = landmarks is not None
+        self.files["timestamps"].write(np.float64(timestamp).tobytes())
+        self.files["has_face"].write(np.uint8(has_face).tobytes())
+        lms = self.empty if not has_face else np.asarray(landmarks, dtype=self.dtype)
+        self.files["landmarks"].write(lms.tobytes())
+        if self.emotion_labels is not None:
+            if emotion is None:
+                index = NO_EMOTION
+            else:
+                if emotion not in self.emotion_labels:
+                    self.emotion_labels.append(emotion)
+                index = self.emotion_labels.index(emotion)
+            self.files["emotion"].write(np.uint8(index).tobytes())
+        self.count += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        # meta.json is written last: a cache without it is incomplete
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({
+                "count": self.count,
+                "frame_shape": self.frame_shape,
+                "dtype": self.dtype.name,
+                "num_landmarks": NUM_LANDMARKS,
+                "source": self.source,
+                "emotion_labels": self.emotion_labels,
+            }, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LandmarkCache:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        n = self.meta["count"]
+        self.frame_shape = tuple(self.meta["frame_shape"])
+        self.timestamps = self._map("timestamps", np.float64, (n,))
+        self.has_face = self._map("has_face", np.uint8, (n,)).astype(bool)
+        self.landmarks = self._map("landmarks", self.meta["dtype"], (n, self.meta["num_landmarks"], 2))
+        # Per-frame emotion labels (None per frame without one), or None if the session had no emotion
+        self.emotions = None
+        labels = self.meta.get("emotion_labels")
+        if labels is not None:
+            indices = self._map("emotion", np.uint8, (n,)).tolist()
+            self.emotions = [None if i == NO_EMOTION else labels[i] for i in indices]
+
+    def _map(self, name, dtype, shape):
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=dtype, mode="r", shape=shape)
+
+    @staticmethod
+    def find(cache_dir, key):
+        path = os.path.join(cache_dir, key)
+        if os.path.exists(os.path.join(path, "meta.json")):
+            return LandmarkCache(path)
+        return None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def metrics(self, chunk=4096):
+        # Per-frame EAR/MAR/pitch/yaw/roll, persisted next to the landmarks
+        metrics_path = os.path.join(self.path, "metrics.npz")
+        if os.path.exists(metrics_path):
+            return dict(np.load(metrics_path))
+
+        names = ("ear", "mar", "pitch", "yaw", "roll")
+        metrics = {name: np.full(len(self), np.nan) for name in names}
+        face_idx = np.flatnonzero(self.has_face)
+        for start in range(0, len(face_idx), chunk):
+            idx = face_idx[start:start + chunk]
+            batch = compute_metrics_batch(self.landmarks[idx].astype(np.float32), self.frame_shape)
+            for name in names:
+                metrics[name][idx] = batch[name]
+        np.savez(metrics_path, **metrics)
+        return metrics
+
+    def replay(self, engine):
+        # Feeds FatigueEngine directly from cached metrics; yields None for frames without a face
+        metrics = self.metrics()
+        ear, mar = metrics["ear"].tolist(), metrics["mar"].tolist()
+        pitch, yaw, roll = metrics["pitch"].tolist(), metrics["yaw"].tolist(), metrics["roll"].tolist()
+        timestamps = self.timestamps.tolist()
+        for i, has_face in enumerate(self.has_face.tolist()):
+            if not has_face:
+                yield None
+                continue
+            yield engine.update(ear[i], mar[i], pitch[i], yaw[i], roll[i], timestamps[i])
+
+
+def sweep(cache, ear_thresholds, closed_seconds, mar_thresholds):
+    # One replay per threshold combination; metrics are computed once
+    cache.metrics()
+    results = []
+    for ear_thresh, closed, mar_thresh in itertools.product(ear_thresholds, closed_seconds, mar_thresholds):
+        engine = FatigueEngine()
+        engine.EYE_AR_THRESH = ear_thresh
+        engine.EYE_CLOSED_SECONDS = closed
+        engine.MAR_THRESH = mar_thresh
+        drowsy_frames = 0
+        max_perclos = 0.0
+        for data in cache.replay(engine):
+            if data:
+                drowsy_frames += data["drowsy"]
+                max_perclos = max(max_perclos, data["perclos"])
+        results.append({
+            "EYE_AR_THRESH": ear_thresh,
+            "EYE_CLOSED_SECONDS": closed,
+            "MAR_THRESH": mar_thresh,
+            "drowsy_frames": drowsy_frames,
+            "max_perclos": max_perclos,
+            "yawns": engine.total_yawns,
+        })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DriveBy.AI landmark cache tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("info", help="Describe a cached session")
+    p.add_argument("cache")
+
+    p = sub.add_parser("sweep", help="Replay FatigueEngine over a cache for a grid of thresholds")
+    p.add_argument("cache")
+    p.add_argument("--ear", type=float, nargs="+", default=[0.20])
+    p.add_argument("--closed-seconds", type=float, nargs="+", default=[20 / 30])
+    p.add_argument("--mar", type=float, nargs="+", default=[0.60])
+
+    args = parser.parse_args(argv)
+    cache = LandmarkCache(args.cache)
+    if args.command == "info":
+        print(json.dumps(dict(cache.meta, faces=int(cache.has_face.sum())), indent=2))
+        return
+
+    start = time.perf_counter()
+    results = sweep(cache, args.ear, args.closed_seconds, args.mar)
+    elapsed = time.perf_counter() - start
+    print(f"{'EAR':>6} {'CLOSED':>6} {'MAR':>6} {'DROWSY':>8} {'PERCLOS':>8} {'YAWNS':>6}")
+    for r in results:
+        print(f"{r['EYE_AR_THRESH']:6.2f} {r['EYE_CLOSED_SECONDS']:6.2f} {r['MAR_THRESH']:6.2f} "
+              f"{r['drowsy_frames']:8d} {r['max_perclos']:8.2f} {r['yawns']:6d}")
+    print(f"{len(results)} configurations over {len(cache)} frames in {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,19 +1,72 @@
-from detection import DriverMonitor
+import argparse
 import sys
 import cv2
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="DriveBy.AI Engine")
+    parser.add_argument("email", nargs="?")
+    parser.add_argument("password", nargs="?")
+    parser.add_argument("--camera", type=int, default=0, help="Camera index")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Run capture, inference and rendering on separate threads")
+    parser.add_argument("--emotion-every", type=int, default=10,
+                        help="Run emotion recognition in the background every N frames (0 = every frame, inline)")
+    parser.add_argument("--roi", action="store_true",
+                        help="Track the face and run Face Mesh on a downscaled crop instead of the full frame")
+    parser.add_argument("--record-landmarks", metavar="DIR",
+                        help="Record Face Mesh landmarks to a landmark cache under DIR")
+    parser.add_argument("--events", action="store_true",
+                        help="Upload fatigue events (start/end) and a 30s heartbeat instead of a log every second")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics (0 = off)")
+    parser.add_argument("--metrics-dump", metavar="PATH",
+                        help="Write a JSON metrics snapshot to PATH every --metrics-interval seconds")
+    parser.add_argument("--metrics-interval", type=float, default=10.0)
+    parser.add_argument("--emotion-backend", choices=["fer", "onnx"], default="fer",
+                        help="Emotion classifier: FER on TensorFlow, or the int8 ONNX export (see emotion_export.py)")
+    parser.add_argument("--emotion-model", metavar="PATH", help="ONNX model for --emotion-backend onnx")
+    parser.add_argument("--headless", action="store_true",
+                        help="No window and no HUD drawing (screenless units); stop with Ctrl+C")
+    parser.add_argument("--hud-fps", type=float, default=0,
+                        help="Redraw the HUD at most this often, independent of inference (0 = every frame)")
+    parser.add_argument("--stream-port", type=int, default=0,
+                        help="Serve the HUD as MJPEG on 127.0.0.1:PORT for debugging (0 = off)")
+    parser.add_argument("--stream-fps", type=float, default=10.0)
+    parser.add_argument("--telemetry-hz", type=float, default=0,
+                        help="Stream binary telemetry (EAR/MAR/pose/score) to the backend at this rate (0 = off)")
+    return parser.parse_args(argv)
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        # Headless replay of a recorded clip: python main.py replay <video> [-o scores.npz]
+        import replay
+        replay.main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        # Several cameras/clips on one machine: python main.py serve 0 1 clip.mp4 [--workers N]
+        import server
+        server.main(sys.argv[2:])
+        return
+
+    from detection import DriverMonitor
     print("Starting DriveBy.AI Engine...")
+    args = parse_args(sys.argv[1:])
     try:
-        monitor = DriverMonitor()
-        
-        if len(sys.argv) > 2:
-            email = sys.argv[1]
-            password = sys.argv[2]
-            monitor.login(email, password)
+        monitor = DriverMonitor(camera_index=args.camera, pipelined=args.pipelined,
+                                emotion_every=args.emotion_every, record_dir=args.record_landmarks,
+                                roi=args.roi, telemetry_hz=args.telemetry_hz,
+                                events=args.events, metrics_port=args.metrics_port,
+                                metrics_dump=args.metrics_dump, metrics_interval=args.metrics_interval,
+                                emotion_backend=args.emotion_backend, emotion_model_path=args.emotion_model,
+                                headless=args.headless, hud_fps=args.hud_fps, stream_port=args.stream_port,
+                                stream_fps=args.stream_fps)
+
+        if args.email and args.password:
+            monitor.login(args.email, args.password)
         else:
             print("No credentials provided. Running in offline/demo mode (logs won't upload).")
-            print("Usage: python main.py <email> <password>")
-            
+            print("Usage: python main.py <email> <password> [--pipelined]")
+
         monitor.run()
     except Exception as e:
         print(f"Critical Error: {e}")
@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pipeline import HISTOGRAM_BUCKETS_MS
+
+# Local metrics export for DriverMonitor: a Prometheus text endpoint
+# (http://127.0.0.1:<port>/metrics, JSON at /metrics.json) and an optional
+# periodic JSON dump. Both read the dict from DriverMonitor.collect_metrics().
+
+# Snapshot key -> (Prometheus name, type, label, help)
+SERIES = {
+    "fps": ("driveby_fps", "gauge", "stage", "Calls per second over the last 2s"),
+    "queue_depth": ("driveby_queue_depth", "gauge", "queue", "Items waiting in a pipeline queue"),
+    "dropped_frames": ("driveby_dropped_frames_total", "counter", "queue", "Frames discarded by drop-oldest queues"),
+    "upload_backlog": ("driveby_upload_backlog", "gauge", "channel", "Samples waiting to be uploaded (memory + spool)"),
+    "uploaded": ("driveby_uploaded_total", "counter", "channel", "Samples delivered to the backend"),
+    "upload_dropped": ("driveby_upload_dropped_total", "counter", "channel", "Samples dropped (rejected or buffer full)"),
+    "buffer_allocations": ("driveby_buffer_allocations_total", "counter", "buffer", "Image buffers allocated by the frame loop (flat once warm)"),
+    "gc_collections": ("driveby_gc_collections_total", "counter", "generation", "Python garbage collections"),
+    "allocations_per_frame": ("driveby_allocations_per_frame", "gauge", "kind", "Buffer allocations and GC collections per processed frame"),
+    "startup_seconds": ("driveby_startup_seconds", "gauge", "component", "Seconds from start until a model was ready or a milestone was reached"),
+}
+
+
+def prometheus_text(snapshot):
+    lines = []
+    for key, (name, kind, label, help_text) in SERIES.items():
+        values = snapshot.get(key)
+        if not values:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for label_value, value in values.items():
+            lines.append(f'{name}{{{label}="{label_value}"}} {value}')
+
+    histograms = snapshot.get("histograms", {})
+    if histograms:
+        name = "driveby_stage_latency_ms"
+        lines.append(f"# HELP {name} Per-stage latency in milliseconds")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, hist in histograms.items():
+            for bound, count in zip(HISTOGRAM_BUCKETS_MS, hist["buckets"]):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {hist["sum_ms"]}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {hist["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer(threading.Thread):
+    def __init__(self, collect, port, host="127.0.0.1"):
+        super().__init__(daemon=True)
+        collect_metrics = collect
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = prometheus_text(collect_metrics()).encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(collect_metrics()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass # Scraped every few seconds; keep the console quiet
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+
+    def run(self):
+        print(f"Metrics: Serving http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsDumper(threading.Thread):
+    # Rewrites `path` with the latest snapshot every `interval` seconds
+    # (atomically, so readers never see a partial file)
+    def __init__(self, collect, path, interval=10.0):
+        super().__init__(daemon=True)
+        self.collect = collect
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        snapshot = dict(self.collect(), time=time.time())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def stop(self):
+        self.stopped.set()
+        self.dump()
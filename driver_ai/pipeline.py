@@ -0,0 +1,248 @@
+import bisect
+import gc
+import itertools
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+class DropOldestQueue:
+    # Bounded queue that never blocks the producer: when full, the oldest
+    # item is discarded so consumers always see the freshest data.
+    # on_drop(item) is called for discarded items (e.g. to recycle frame buffers).
+    def __init__(self, maxsize=1, on_drop=None):
+        self.items = deque(maxlen=maxsize)
+        self.cond = threading.Condition()
+        self.on_drop = on_drop
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        discarded = None
+        with self.cond:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+                discarded = self.items[0]
+            self.items.append(item)
+            self.cond.notify()
+        if discarded is not None and self.on_drop:
+            self.on_drop(discarded)
+
+    def get(self, timeout=None):
+        # Returns None on timeout or once the queue is closed and drained
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class AllocationStats:
+    # Steady-state memory churn of the frame loop: image buffers allocated
+    # (should stop growing once FramePool and the stage buffers are warm) and
+    # garbage collections, whose pause times go to the timer's "gc_pause" stage.
+    def __init__(self, timer=None):
+        self.timer = timer
+        self.frames = 0
+        self.buffers = {} # source -> allocations
+        self.gc_collections = [0, 0, 0]
+        self.gc_started = None
+        gc.callbacks.append(self._on_gc)
+
+    def allocated(self, source, count=1):
+        self.buffers[source] = self.buffers.get(source, 0) + count
+
+    def frame(self):
+        self.frames += 1
+
+    def per_frame(self):
+        frames = max(self.frames, 1)
+        return {"buffers": sum(self.buffers.values()) / frames, "gc_collections": sum(self.gc_collections) / frames}
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self.gc_started = time.perf_counter()
+        elif self.gc_started is not None:
+            self.gc_collections[info["generation"]] += 1
+            if self.timer:
+                self.timer.record("gc_pause", time.perf_counter() - self.gc_started)
+            self.gc_started = None
+
+    def close(self):
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+
+class FramePool:
+    # Reused BGR buffers for cap.read(image). Capture takes a free buffer;
+    # the last stage to use a frame gives it back with release() (queues
+    # release the frames they drop). A frame in flight is never overwritten:
+    # when all buffers are busy a new one is allocated and counted.
+    def __init__(self, size=4, stats=None):
+        self.size = size
+        self.stats = stats
+        self.free = deque()
+        self.shape = None
+        self.lock = threading.Lock()
+
+    def read(self, cap):
+        # Returns (success, frame) like cap.read()
+        with self.lock:
+            buffer = self.free.popleft() if self.free else None
+        if buffer is None and self.shape is not None:
+            buffer = np.empty(self.shape, np.uint8)
+            self._allocated()
+        success, frame = cap.read(buffer) if buffer is not None else cap.read()
+        if not success:
+            if buffer is not None:
+                self.release(buffer)
+            return False, None
+        if frame is not buffer:
+            # First frame, or the camera changed resolution: OpenCV allocated it
+            self._allocated()
+            self.shape = frame.shape
+        return True, frame
+
+    def release(self, frame):
+        frame.flags.writeable = True
+        with self.lock:
+            if frame.shape == self.shape and len(self.free) < self.size:
+                self.free.append(frame)
+
+    def _allocated(self):
+        if self.stats:
+            self.stats.allocated("frame")
+
+
+def reuse_buffer(buffers, key, shape, stats=None):
+    # Per-stage scratch array from `buffers` (a dict owned by one thread),
+    # reallocated only when the frame geometry changes
+    buffer = buffers.get(key)
+    if buffer is None or buffer.shape != shape:
+        buffer = buffers[key] = np.empty(shape, np.uint8)
+        if stats:
+            stats.allocated(key)
+    return buffer
+
+
+# Upper bounds (ms) of the cumulative latency histograms exported to Prometheus
+HISTOGRAM_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class StageTimer:
+    # Rolling per-stage latency stats (milliseconds) shared between threads,
+    # plus cumulative histograms and per-stage rates (calls/s, i.e. FPS)
+    def __init__(self, window=120, rate_window=2.0):
+        # window=None keeps every sample (offline benchmarks)
+        self.window = window
+        self.rate_window = rate_window
+        self.samples = {}
+        self.times = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        ms = seconds * 1000.0
+        now = time.perf_counter()
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.window)
+                self.times[stage] = deque()
+                self.histograms[stage] = {"buckets": [0] * len(HISTOGRAM_BUCKETS_MS), "sum_ms": 0.0, "count": 0}
+            self.samples[stage].append(ms)
+            times = self.times[stage]
+            times.append(now)
+            while times[0] < now - self.rate_window:
+                times.popleft()
+            hist = self.histograms[stage]
+            i = bisect.bisect_left(HISTOGRAM_BUCKETS_MS, ms)
+            if i < len(HISTOGRAM_BUCKETS_MS):
+                hist["buckets"][i] += 1
+            hist["sum_ms"] += ms
+            hist["count"] += 1
+
+    def rate(self, stage):
+        # Calls per second over the last rate_window seconds
+        now = time.perf_counter()
+        with self.lock:
+            recent = [t for t in self.times.get(stage, ()) if t >= now - self.rate_window]
+        if len(recent) < 2:
+            return 0.0
+        # Over the time actually covered, so short runs are not underestimated
+        return (len(recent) - 1) / max(now - recent[0], 1e-6)
+
+    def histogram_snapshot(self):
+        # {stage: {"buckets": cumulative counts per HISTOGRAM_BUCKETS_MS bound, "sum_ms", "count"}}
+        with self.lock:
+            return {
+                stage: {"buckets": list(itertools.accumulate(h["buckets"])), "sum_ms": h["sum_ms"], "count": h["count"]}
+                for stage, h in self.histograms.items()
+            }
+
+    def percentiles(self, stage, ps=(50, 95, 99)):
+        with self.lock:
+            values = list(self.samples.get(stage, ()))
+        if not values:
+            return {}
+        return {f"p{p}_ms": float(v) for p, v in zip(ps, np.percentile(values, ps))}
+
+    def snapshot(self):
+        with self.lock:
+            stats = {}
+            for stage, values in self.samples.items():
+                if not values:
+                    continue
+                stats[stage] = {
+                    "last_ms": values[-1],
+                    "avg_ms": sum(values) / len(values),
+                    "max_ms": max(values),
+                    "count": len(values),
+                }
+            return stats
+
+
+class CaptureThread(threading.Thread):
+    # Reads the camera as fast as it delivers and keeps only the newest frame,
+    # so a slow inference stage never lets frames pile up in the driver buffer.
+    def __init__(self, cap, out_queue, timer=None, max_failures=10, pool=None):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.pool = pool # Optional FramePool to read into
+        self.out_queue = out_queue
+        self.timer = timer
+        self.max_failures = max_failures
+        self.running = True
+        self.frame_id = 0
+
+    def run(self):
+        consecutive_failures = 0
+        while self.running and self.cap.isOpened():
+            t0 = time.perf_counter()
+            success, image = self.pool.read(self.cap) if self.pool else self.cap.read()
+            if not success:
+                print("Ignoring empty camera frame.")
+                consecutive_failures += 1
+                if consecutive_failures > self.max_failures:
+                    print("Camera failure limit reached. Exiting.")
+                    break
+                continue
+            consecutive_failures = 0
+            captured_at = time.perf_counter()
+            if self.timer:
+                self.timer.record("capture", captured_at - t0)
+            self.frame_id += 1
+            self.out_queue.put((self.frame_id, captured_at, image))
+        self.out_queue.close()
+
+    def stop(self):
+        self.running = False
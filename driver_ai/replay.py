@@ -0,0 +1,276 @@
+import argparse
+import csv
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from fatigue_engine import FatigueEngine, composite_score, ALERT_THRESHOLD
+from face_tracker import create_face_mesh, FaceRoiTracker
+from landmark_cache import LandmarkCache, LandmarkCacheWriter, video_key
+from pipeline import StageTimer
+from utils import LandmarkBuffer, NUM_LANDMARKS
+
+# Headless replay of recorded clips: no window, no audio, no uploads.
+# Runs the same per-frame scoring as DriverMonitor as fast as possible and
+# reports throughput and per-stage latency percentiles.
+
+COLUMNS = ["frame", "timestamp", "face", "ear", "mar", "drowsy", "yawn", "head_tilt",
+           "perclos", "yawn_rate", "emotion", "fatigue_partial_score", "final_score", "alert"]
+
+STAGES = ["decode", "color", "face_mesh", "landmarks", "fatigue", "emotion", "frame"]
+
+
+class ReplayRunner:
+    def __init__(self, emotion=True, emotion_every=1, roi=False, emotion_backend="fer", emotion_model_path=None):
+        self.fatigue_engine = FatigueEngine()
+        self.landmark_buffer = LandmarkBuffer()
+        self.timer = StageTimer(window=None)
+        self.emotion_every = max(1, emotion_every) # 0 means every frame, as on the live monitor
+        self.emotion_model = None
+        if emotion:
+            from emotion_model import EmotionModel
+            self.emotion_model = EmotionModel(emotion_backend, emotion_model_path)
+        self.roi = roi
+        self.face_mesh = None
+        self.roi_tracker = None
+        self.emotion = ("neutral", 0.0)
+
+    def _detect(self, image):
+        # Returns (face_landmarks, region) like FaceRoiTracker.process
+        if self.roi:
+            if self.roi_tracker is None:
+                self.roi_tracker = FaceRoiTracker(timer=self.timer)
+            return self.roi_tracker.process(image)
+
+        if self.face_mesh is None:
+            self.face_mesh = create_face_mesh()
+        t0 = time.perf_counter()
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        t1 = time.perf_counter()
+        results = self.face_mesh.process(image_rgb)
+        self.timer.record("color", t1 - t0)
+        self.timer.record("face_mesh", time.perf_counter() - t1)
+        if results.multi_face_landmarks:
+            frame_h, frame_w, _ = image.shape
+            return results.multi_face_landmarks[0], (0, 0, frame_w, frame_h)
+        return None, None
+
+    def _score(self, frame_idx, timestamp, landmarks, frame_shape, image=None, face_box=None):
+        if landmarks is None:
+            return self._row(frame_idx, timestamp, None)
+
+        t0 = time.perf_counter()
+        fatigue_data = self.fatigue_engine.process_landmarks(landmarks, frame_shape, timestamp)
+        self.timer.record("fatigue", time.perf_counter() - t0)
+        return self._row(frame_idx, timestamp, fatigue_data, image, face_box)
+
+    def _row(self, frame_idx, timestamp, fatigue_data, image=None, face_box=None, emotion=None):
+        # emotion: label recorded in a landmark cache, used instead of running the model
+        row = {"frame": frame_idx, "timestamp": timestamp, "face": fatigue_data is not None}
+        if fatigue_data is None:
+            return row
+
+        t1 = time.perf_counter()
+        if self.emotion_model and image is not None and frame_idx % self.emotion_every == 0:
+            self.emotion = self.emotion_model.predict(image, face_box)
+            self.timer.record("emotion", time.perf_counter() - t1)
+        if emotion is None:
+            emotion = self.emotion[0]
+
+        final_score = composite_score(fatigue_data, emotion)
+        row.update({
+            "ear": float(fatigue_data["ear"]),
+            "mar": float(fatigue_data["mar"]),
+            "drowsy": fatigue_data["drowsy"],
+            "yawn": fatigue_data["yawn"],
+            "head_tilt": fatigue_data["head_tilt"],
+            "perclos": float(fatigue_data["perclos"]),
+            "yawn_rate": float(fatigue_data["yawn_rate"]),
+            "emotion": emotion,
+            "fatigue_partial_score": float(fatigue_data["fatigue_partial_score"]),
+            "final_score": float(final_score),
+            "alert": final_score > ALERT_THRESHOLD,
+        })
+        return row
+
+    def replay_video(self, path, max_frames=None, dump=None, cache_writer=None):
+        # dump: optional list collecting (timestamp, landmarks or None, frame_shape) per frame
+        # cache_writer: optional LandmarkCacheWriter recording the same landmarks
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video: {path}")
+
+        frame_idx = 0
+        try:
+            while max_frames is None or frame_idx < max_frames:
+                t_frame = time.perf_counter()
+                success, image = cap.read()
+                if not success:
+                    break
+                timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                t0 = time.perf_counter()
+                self.timer.record("decode", t0 - t_frame)
+
+                face_landmarks, region = self._detect(image)
+                t2 = time.perf_counter()
+
+                frame_h, frame_w, _ = image.shape
+                landmarks = face_box = None
+                if face_landmarks is not None:
+                    x0, y0, region_w, region_h = region
+                    landmarks = self.landmark_buffer.update(face_landmarks, region_w, region_h, (x0, y0))
+                    face_box = self.landmark_buffer.face_box(frame_w, frame_h)
+                    if self.roi_tracker:
+                        self.roi_tracker.update(face_box)
+                    self.timer.record("landmarks", time.perf_counter() - t2)
+                if dump is not None:
+                    dump.append((timestamp, None if landmarks is None else landmarks.copy(), image.shape))
+
+                row = self._score(frame_idx, timestamp, landmarks, image.shape, image, face_box)
+                if cache_writer is not None:
+                    cache_writer.append(timestamp, landmarks, row.get("emotion"))
+                yield row
+                self.timer.record("frame", time.perf_counter() - t_frame)
+                frame_idx += 1
+        finally:
+            cap.release()
+
+    def replay_landmarks(self, path, max_frames=None):
+        # Skips decode and Face Mesh entirely; emotion is unavailable (no pixels)
+        timestamps, landmarks, has_face, frame_shape = load_landmark_dump(path)
+        count = len(timestamps) if max_frames is None else min(max_frames, len(timestamps))
+        for frame_idx in range(count):
+            t_frame = time.perf_counter()
+            frame_landmarks = landmarks[frame_idx] if has_face[frame_idx] else None
+            yield self._score(frame_idx, float(timestamps[frame_idx]), frame_landmarks, frame_shape)
+            self.timer.record("frame", time.perf_counter() - t_frame)
+
+
+    def replay_cache(self, cache, max_frames=None, emotions=None):
+        # Cached metrics feed FatigueEngine.update directly: no decode, Face Mesh or pose solve
+        # emotions: per-frame labels recorded with the cache (LandmarkCache.emotions)
+        count = len(cache) if max_frames is None else min(max_frames, len(cache))
+        timestamps = cache.timestamps[:count].tolist()
+        frames = cache.replay(self.fatigue_engine)
+        for frame_idx in range(count):
+            t_frame = time.perf_counter()
+            fatigue_data = next(frames)
+            self.timer.record("fatigue", time.perf_counter() - t_frame)
+            emotion = emotions[frame_idx] if emotions else None
+            yield self._row(frame_idx, timestamps[frame_idx], fatigue_data, emotion=emotion)
+            self.timer.record("frame", time.perf_counter() - t_frame)
+
+
+def save_landmark_dump(path, dump):
+    # dump: list of (timestamp, (N, 2) landmarks or None, frame_shape)
+    frame_shape = dump[0][2] if dump else (0, 0, 3)
+    landmarks = np.full((len(dump), NUM_LANDMARKS, 2), np.nan, dtype=np.float32)
+    has_face = np.zeros(len(dump), dtype=bool)
+    for i, (_, lms, _) in enumerate(dump):
+        if lms is not None:
+            landmarks[i] = lms
+            has_face[i] = True
+    np.savez_compressed(path, timestamps=np.array([d[0] for d in dump], dtype=np.float64),
+                        landmarks=landmarks, has_face=has_face, frame_shape=np.array(frame_shape))
+
+def load_landmark_dump(path):
+    data = np.load(path)
+    return data["timestamps"], data["landmarks"], data["has_face"], tuple(int(v) for v in data["frame_shape"])
+
+def write_scores(path, rows):
+    # .npz stores one array per column; anything else is written as CSV
+    if path.endswith(".npz"):
+        columns = {}
+        for col in COLUMNS:
+            values = [row.get(col) for row in rows]
+            if col == "emotion":
+                columns[col] = np.array([v or "" for v in values])
+            elif col in ("face", "drowsy", "yawn", "head_tilt", "alert"):
+                columns[col] = np.array([bool(v) for v in values])
+            else:
+                columns[col] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        np.savez_compressed(path, **columns)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+def report(timer, frames, elapsed):
+    print(f"Replayed {frames} frames in {elapsed:.2f}s ({frames / elapsed if elapsed else 0.0:.1f} frames/s)")
+    print(f"  {'stage':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage in STAGES:
+        pct = timer.percentiles(stage)
+        if pct:
+            print(f"  {stage:<10} {pct['p50_ms']:8.2f} {pct['p95_ms']:8.2f} {pct['p99_ms']:8.2f}")
+
+def run(args):
+    cache = cache_writer = None
+    if os.path.isdir(args.input):
+        cache = LandmarkCache(args.input)
+    elif args.cache_dir and not args.input.endswith(".npz"):
+        key = video_key(args.input)
+        cache = LandmarkCache.find(args.cache_dir, key)
+        if cache:
+            print(f"Using landmark cache {cache.path}")
+        elif args.max_frames is None: # Only cache complete clips
+            cap = cv2.VideoCapture(args.input)
+            frame_shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+            cap.release()
+            # Emotion labels are recorded too, so replays from the cache score the same
+            cache_writer = LandmarkCacheWriter(args.cache_dir, key, frame_shape, source=os.path.abspath(args.input),
+                                               emotions=not args.no_emotion)
+
+    cached_emotions = None
+    if cache is not None and not args.no_emotion:
+        cached_emotions = cache.emotions
+        if cached_emotions is None:
+            print("Warning: landmark cache has no emotion labels; replaying without emotion "
+                  "(scores may differ from a video run)")
+    from_landmarks = cache is not None or args.input.endswith(".npz")
+    runner = ReplayRunner(emotion=not (args.no_emotion or from_landmarks), emotion_every=args.emotion_every,
+                          roi=args.roi, emotion_backend=args.emotion_backend, emotion_model_path=args.emotion_model)
+    dump = [] if args.dump_landmarks else None
+
+    start = time.perf_counter()
+    if cache is not None:
+        rows = list(runner.replay_cache(cache, args.max_frames, cached_emotions))
+    elif from_landmarks:
+        rows = list(runner.replay_landmarks(args.input, args.max_frames))
+    else:
+        rows = list(runner.replay_video(args.input, args.max_frames, dump, cache_writer))
+    elapsed = time.perf_counter() - start
+
+    if cache_writer is not None:
+        cache_writer.close()
+        print(f"Landmark cache written to {cache_writer.path}")
+
+    if args.output:
+        write_scores(args.output, rows)
+        print(f"Scores written to {args.output}")
+    if dump is not None:
+        save_landmark_dump(args.dump_landmarks, dump)
+        print(f"Landmarks written to {args.dump_landmarks}")
+    report(runner.timer, len(rows), elapsed)
+    return rows
+
+def add_arguments(parser):
+    parser.add_argument("input", help="Video file, .npz landmark dump or landmark cache directory")
+    parser.add_argument("--output", "-o", help="Per-frame scores (.npz columnar or .csv)")
+    parser.add_argument("--dump-landmarks", help="Save Face Mesh landmarks to this .npz for later replays")
+    parser.add_argument("--cache-dir", help="Landmark cache root: reuse a video's cached landmarks or record them")
+    parser.add_argument("--max-frames", type=int)
+    parser.add_argument("--roi", action="store_true", help="Track the face and run Face Mesh on a downscaled crop")
+    parser.add_argument("--no-emotion", action="store_true", help="Skip emotion recognition")
+    parser.add_argument("--emotion-every", type=int, default=1, help="Run emotion recognition every N frames (0 = every frame)")
+    parser.add_argument("--emotion-backend", choices=["fer", "onnx"], default="fer")
+    parser.add_argument("--emotion-model", help="ONNX model for --emotion-backend onnx")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DriveBy.AI headless replay")
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
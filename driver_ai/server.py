@@ -0,0 +1,284 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import cv2
+from fatigue_engine import FatigueEngine, composite_score, ALERT_THRESHOLD
+from face_tracker import create_face_mesh
+from pipeline import StageTimer
+from utils import LandmarkBuffer
+
+# Multi-stream server mode: one box serving several cabin cameras.
+#
+#   python main.py serve 0 1 2 rtsp://cam4/stream clip.mp4 --workers 4
+#
+# Streams are pinned to a pool of worker processes (stream i -> worker
+# i % workers). Each stream gets its own capture thread, Face Mesh graph,
+# LandmarkBuffer and FatigueEngine inside its worker, so fatigue state never
+# mixes between drivers. Workers send only small results back: fatigue
+# metrics for every frame and, every --emotion-every frames, a 64x64
+# grayscale face crop. The main process owns the single emotion model and runs
+# the crops of all streams through it in batches.
+
+CROP_SIZE = 64 # FER's classifier input
+
+
+def parse_source(source):
+    # Digits are camera indices; anything else is a video path or stream URL
+    return int(source) if source.isdigit() else source
+
+
+def face_crop(image, face_box, size=CROP_SIZE):
+    x, y, w, h = face_box
+    frame_h, frame_w = image.shape[:2]
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(frame_w, x + w), min(frame_h, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    gray = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (size, size))
+
+
+def run_stream(stream_id, source, out_queue, stop_event, emotion_every, max_frames):
+    cap = cv2.VideoCapture(parse_source(source))
+    if not cap.isOpened():
+        print(f"Stream {stream_id}: Could not open {source}")
+        out_queue.put(("done", stream_id, 0))
+        return
+    live = isinstance(parse_source(source), int)
+    face_mesh = None
+    fatigue_engine = FatigueEngine()
+    landmark_buffer = LandmarkBuffer()
+    frame_idx = 0
+    try:
+        face_mesh = create_face_mesh()
+        while not stop_event.is_set() and (max_frames is None or frame_idx < max_frames):
+            t0 = time.perf_counter()
+            success, image = cap.read()
+            if not success:
+                break
+            # Cameras: capture time; files: position in the clip, so replays are deterministic
+            timestamp = t0 if live else cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            frame_h, frame_w, _ = image.shape
+            image.flags.writeable = False
+            results = face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            image.flags.writeable = True
+
+            fatigue_data = crop = None
+            if results.multi_face_landmarks:
+                landmarks = landmark_buffer.update(results.multi_face_landmarks[0], frame_w, frame_h)
+                fatigue_data = fatigue_engine.process_landmarks(landmarks, image.shape, timestamp)
+                if emotion_every and frame_idx % emotion_every == 0:
+                    crop = face_crop(image, landmark_buffer.face_box(frame_w, frame_h))
+            out_queue.put(("frame", stream_id, frame_idx, timestamp, fatigue_data, crop, time.perf_counter() - t0))
+            frame_idx += 1
+    except Exception as e:
+        # Reported here, and the stream still posts "done" so the server does not wait on it
+        print(f"Stream {stream_id}: Stopped with error: {e}")
+    finally:
+        cap.release()
+        if face_mesh is not None:
+            face_mesh.close()
+        out_queue.put(("done", stream_id, frame_idx))
+
+
+def worker_main(streams, out_queue, stop_event, emotion_every, max_frames):
+    # streams: [(stream_id, source)] pinned to this process
+    cv2.setNumThreads(1) # Parallelism comes from the pool; avoid oversubscribing cores
+    threads = [threading.Thread(target=run_stream, daemon=True,
+                                args=(stream_id, source, out_queue, stop_event, emotion_every, max_frames))
+               for stream_id, source in streams]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class StreamState:
+    def __init__(self, source):
+        self.source = source
+        self.frames = 0
+        self.faces = 0
+        self.alerts = 0
+        self.emotion = ("neutral", 0.0)
+        self.final_score = 0.0
+        self.alert = False
+        self.done = False
+
+
+class InferenceServer:
+    def __init__(self, sources, workers=None, emotion=True, emotion_every=10, emotion_batch=16,
+                 batch_timeout=0.05, max_frames=None, output=None, report_every=5.0, emotion_backend="fer",
+                 emotion_model_path=None):
+        self.sources = list(sources)
+        # The main process runs the emotion model, so leave it a core
+        self.workers = max(1, min(workers or (os.cpu_count() or 2) - 1, len(self.sources)))
+        self.emotion_every = emotion_every if emotion else 0
+        self.emotion_batch = emotion_batch
+        self.batch_timeout = batch_timeout
+        self.max_frames = max_frames
+        self.output = output
+        self.report_every = report_every
+        self.timer = StageTimer(window=300)
+        self.streams = {i: StreamState(source) for i, source in enumerate(self.sources)}
+        self.emotion_model = None
+        if self.emotion_every:
+            from emotion_model import EmotionModel
+            self.emotion_model = EmotionModel(emotion_backend, emotion_model_path)
+        self.pending_crops = [] # [(stream_id, crop)]
+        self.oldest_crop = None
+
+    def start_workers(self, ctx, out_queue, stop_event):
+        processes = []
+        for w in range(self.workers):
+            assigned = [(i, source) for i, source in enumerate(self.sources) if i % self.workers == w]
+            process = ctx.Process(target=worker_main, daemon=True,
+                                  args=(assigned, out_queue, stop_event, self.emotion_every, self.max_frames))
+            process.start()
+            processes.append(process)
+        return processes
+
+    def flush_emotions(self):
+        if not self.pending_crops:
+            return
+        t0 = time.perf_counter()
+        predictions = self.emotion_model.predict_batch([crop for _, crop in self.pending_crops])
+        self.timer.record("emotion_batch", time.perf_counter() - t0)
+        for (stream_id, _), prediction in zip(self.pending_crops, predictions):
+            self.streams[stream_id].emotion = prediction
+        self.pending_crops = []
+        self.oldest_crop = None
+
+    def handle_frame(self, stream_id, frame_idx, timestamp, fatigue_data, crop, seconds):
+        state = self.streams[stream_id]
+        state.frames += 1
+        self.timer.record(f"stream-{stream_id}", seconds)
+        if crop is not None and self.emotion_model:
+            self.pending_crops.append((stream_id, crop))
+            if self.oldest_crop is None:
+                self.oldest_crop = time.perf_counter()
+            if len(self.pending_crops) >= self.emotion_batch:
+                self.flush_emotions()
+
+        row = {"stream": stream_id, "frame": frame_idx, "timestamp": timestamp, "face": fatigue_data is not None}
+        if fatigue_data is not None:
+            state.faces += 1
+            emotion = state.emotion[0]
+            state.final_score = float(composite_score(fatigue_data, emotion))
+            alert = state.final_score > ALERT_THRESHOLD
+            if alert and not state.alert:
+                state.alerts += 1
+            state.alert = alert
+            row.update({
+                "ear": float(fatigue_data["ear"]),
+                "mar": float(fatigue_data["mar"]),
+                "drowsy": bool(fatigue_data["drowsy"]),
+                "yawn": bool(fatigue_data["yawn"]),
+                "head_tilt": bool(fatigue_data["head_tilt"]),
+                "perclos": float(fatigue_data["perclos"]),
+                "emotion": emotion,
+                "final_score": state.final_score,
+                "alert": alert,
+            })
+        return row
+
+    def report(self):
+        print(f"{'stream':>6} {'fps':>6} {'p95 ms':>7} {'frames':>7} {'faces':>6} {'score':>6} {'emotion':<9} {'alerts':>6}  source")
+        for stream_id, state in self.streams.items():
+            stage = f"stream-{stream_id}"
+            p95 = self.timer.percentiles(stage).get("p95_ms", 0.0)
+            status = "done" if state.done else f"{self.timer.rate(stage):6.1f}"
+            print(f"{stream_id:>6} {status:>6} {p95:7.1f} {state.frames:>7} {state.faces:>6} "
+                  f"{state.final_score:6.2f} {state.emotion[0]:<9} {state.alerts:>6}  {state.source}")
+        batch = self.timer.percentiles("emotion_batch")
+        if batch:
+            print(f"  emotion batch p50 {batch['p50_ms']:.1f} ms, p95 {batch['p95_ms']:.1f} ms")
+
+    def run(self):
+        ctx = mp.get_context("spawn") # FaceMesh/TF state must not be forked
+        out_queue = ctx.Queue(maxsize=1024)
+        stop_event = ctx.Event()
+        print(f"Serving {len(self.sources)} streams on {self.workers} worker processes")
+        processes = self.start_workers(ctx, out_queue, stop_event)
+        output = open(self.output, "w") if self.output else None
+        start = last_report = time.perf_counter()
+        remaining = len(self.sources)
+        try:
+            while remaining:
+                try:
+                    message = out_queue.get(timeout=self.batch_timeout)
+                except queue.Empty:
+                    message = None
+                    if not any(p.is_alive() for p in processes):
+                        print("All workers exited")
+                        break
+
+                if message is not None and message[0] == "done":
+                    _, stream_id, frames = message
+                    self.streams[stream_id].done = True
+                    remaining -= 1
+                elif message is not None:
+                    row = self.handle_frame(*message[1:])
+                    if output:
+                        output.write(json.dumps(row) + "\n")
+
+                now = time.perf_counter()
+                if self.oldest_crop is not None and now - self.oldest_crop >= self.batch_timeout:
+                    self.flush_emotions()
+                if self.report_every and now - last_report >= self.report_every:
+                    self.report()
+                    last_report = now
+        except KeyboardInterrupt:
+            print("Stopping streams...")
+        finally:
+            stop_event.set()
+            self.flush_emotions()
+            # Drain so workers blocked on a full queue can exit
+            deadline = time.perf_counter() + 5.0
+            while any(p.is_alive() for p in processes) and time.perf_counter() < deadline:
+                try:
+                    out_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            for process in processes:
+                process.join(timeout=1.0)
+                if process.is_alive():
+                    process.terminate()
+            if output:
+                output.close()
+
+        elapsed = time.perf_counter() - start
+        frames = sum(state.frames for state in self.streams.values())
+        print(f"Processed {frames} frames from {len(self.sources)} streams in {elapsed:.2f}s "
+              f"({frames / elapsed if elapsed else 0.0:.1f} frames/s total)")
+        self.report()
+        return self.streams
+
+
+def add_arguments(parser):
+    parser.add_argument("sources", nargs="+", help="Camera indices, video files or stream URLs")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: cores - 1, at most one per stream)")
+    parser.add_argument("--emotion-every", type=int, default=10, help="Send a face crop for emotion every N frames")
+    parser.add_argument("--emotion-batch", type=int, default=16, help="Face crops per FER forward pass")
+    parser.add_argument("--no-emotion", action="store_true", help="Skip emotion recognition")
+    parser.add_argument("--emotion-backend", choices=["fer", "onnx"], default="fer")
+    parser.add_argument("--emotion-model", help="ONNX model for --emotion-backend onnx")
+    parser.add_argument("--max-frames", type=int, help="Stop each stream after N frames")
+    parser.add_argument("--output", "-o", help="Write per-frame results of every stream as JSON lines")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between per-stream reports (0 = off)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DriveBy.AI multi-stream server")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    server = InferenceServer(args.sources, workers=args.workers, emotion=not args.no_emotion,
+                             emotion_every=args.emotion_every, emotion_batch=args.emotion_batch,
+                             max_frames=args.max_frames, output=args.output, report_every=args.report_every,
+                             emotion_backend=args.emotion_backend, emotion_model_path=args.emotion_model)
+    server.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+
+# Debug video output: the HUD as an MJPEG stream over HTTP
+# (multipart/x-mixed-replace), viewable in a browser or VLC at
+# http://127.0.0.1:<port>/. Frames are only copied and encoded while a
+# client is connected, at most `fps` times per second, and JPEG encoding
+# runs on the streamer's own thread, never on the detection path.
+
+BOUNDARY = b"frame"
+
+
+class MjpegStreamer(threading.Thread):
+    def __init__(self, port, host="127.0.0.1", fps=10.0, quality=70, max_width=640):
+        super().__init__(daemon=True)
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.max_width = max_width
+        self.buffer = None # Downscaled copy of the last submitted frame
+        self.busy = False # Encoder owns self.buffer
+        self.wakeup = threading.Event()
+        self.cond = threading.Condition()
+        self.jpeg = None
+        self.seq = 0
+        self.clients = 0
+        self.last_submit = 0.0
+        self.running = False
+        self.sent = 0
+        streamer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/stream.mjpg"):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                with streamer.cond:
+                    streamer.clients += 1
+                try:
+                    seq = 0
+                    while streamer.running:
+                        jpeg, seq = streamer.next_jpeg(seq, timeout=1.0)
+                        if jpeg is None:
+                            continue
+                        self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+                                         + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with streamer.cond:
+                        streamer.clients -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def wants_frame(self):
+        # A viewer is connected, the encoder is idle and the stream rate allows another frame
+        return self.clients > 0 and not self.busy and time.perf_counter() - self.last_submit >= self.period
+
+    def submit(self, image):
+        # Called by the render stage with the HUD frame; returns True if it was taken
+        if not self.wants_frame():
+            return False
+        self.last_submit = time.perf_counter()
+        frame_h, frame_w = image.shape[:2]
+        scale = min(1.0, self.max_width / frame_w)
+        shape = (int(frame_h * scale), int(frame_w * scale), 3)
+        if self.buffer is None or self.buffer.shape != shape:
+            self.buffer = np.empty(shape, np.uint8)
+        # Copy out of the caller's frame, which is recycled after rendering
+        if scale < 1.0:
+            cv2.resize(image, (shape[1], shape[0]), dst=self.buffer, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(self.buffer, image)
+        self.busy = True
+        self.wakeup.set()
+        return True
+
+    def next_jpeg(self, seq, timeout=None):
+        # Blocks until a frame newer than `seq` is encoded; returns (jpeg, seq)
+        with self.cond:
+            if self.seq == seq:
+                self.cond.wait(timeout)
+            if self.seq == seq:
+                return None, seq
+            return self.jpeg, self.seq
+
+    def start(self):
+        self.running = True
+        super().start()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Stream: Serving MJPEG at http://{self.server.server_address[0]}:{self.server.server_address[1]}/")
+
+    def run(self):
+        while self.running:
+            if not self.wakeup.wait(0.5):
+                continue
+            self.wakeup.clear()
+            if not self.running:
+                break # Woken by stop()
+            if self.buffer is None:
+                continue
+            ok, jpeg = cv2.imencode(".jpg", self.buffer, self.params)
+            self.busy = False
+            if not ok:
+                continue
+            with self.cond:
+                self.jpeg = jpeg.tobytes()
+                self.seq += 1
+                self.sent += 1
+                self.cond.notify_all()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        with self.cond:
+            self.cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,132 @@
+import struct
+import threading
+import time
+from collections import deque
+
+# Binary telemetry uplink to the backend (/ws/telemetry). Each WebSocket
+# message is one frame: a header followed by `count` fixed-size samples,
+# little-endian. Keep in sync with backend/telemetry.py.
+#
+#   header  version u8, kind u8, count u16
+#   sample  timestamp f64 (unix seconds), ear, mar, pitch, yaw, roll,
+#           perclos, fatigue_score f32, flags u8, emotion u8
+#
+# 38 bytes per sample, versus a JSON body plus HTTP headers per log.
+
+VERSION = 1
+KIND_SAMPLES = 1
+HEADER = struct.Struct("<BBH")
+SAMPLE = struct.Struct("<d7fBB")
+EMOTIONS = ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral")
+EMOTION_CODES = {name: i for i, name in enumerate(EMOTIONS)}
+UNKNOWN_EMOTION = 255
+FLAG_DROWSY, FLAG_YAWN, FLAG_HEAD_TILT, FLAG_ALERT = 1, 2, 4, 8
+MAX_SAMPLES_PER_FRAME = 1000
+
+
+def pack_sample(timestamp, fatigue_data, final_score, emotion, alert):
+    flags = ((FLAG_DROWSY if fatigue_data["drowsy"] else 0) | (FLAG_YAWN if fatigue_data["yawn"] else 0)
+             | (FLAG_HEAD_TILT if fatigue_data["head_tilt"] else 0) | (FLAG_ALERT if alert else 0))
+    return SAMPLE.pack(timestamp, fatigue_data["ear"], fatigue_data["mar"], fatigue_data["pitch"],
+                       fatigue_data["yaw"], fatigue_data["roll"], fatigue_data["perclos"], final_score,
+                       flags, EMOTION_CODES.get(emotion, UNKNOWN_EMOTION))
+
+
+def pack_frame(samples):
+    # samples: bytes from pack_sample
+    return HEADER.pack(VERSION, KIND_SAMPLES, len(samples)) + b"".join(samples)
+
+
+def websocket_url(api_url, path="/ws/telemetry"):
+    if api_url.startswith("https://"):
+        return "wss://" + api_url[len("https://"):] + path
+    return "ws://" + api_url.split("://", 1)[-1] + path
+
+
+class TelemetryUplink(threading.Thread):
+    # Streams packed samples over one persistent, token-authenticated
+    # WebSocket, one frame per `interval`. Telemetry is lossy by design: while
+    # disconnected only the newest `max_pending` samples are kept; the 1 Hz
+    # logs from LogUploader remain the durable record.
+    def __init__(self, api_url, interval=0.1, max_pending=600, max_backoff=30.0, timeout=5.0):
+        super().__init__(daemon=True)
+        self.url = websocket_url(api_url)
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.token = None
+        self.pending = deque(maxlen=max_pending)
+        self.lock = threading.Lock()
+        self.running = False
+        self.ws = None
+        self.backoff = 0.0
+        self.sent = 0
+        self.dropped = 0
+
+    def set_token(self, token):
+        self.token = token
+
+    def submit(self, timestamp, fatigue_data, final_score, emotion, alert):
+        if not self.token:
+            return
+        sample = pack_sample(timestamp, fatigue_data, final_score, emotion, alert)
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append(sample)
+
+    def backlog(self):
+        return len(self.pending)
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join(timeout=self.timeout)
+        self._close()
+
+    def run(self):
+        import websocket # websocket-client
+        next_send = time.monotonic()
+        while self.running:
+            next_send += self.interval + self.backoff
+            time.sleep(max(0.0, next_send - time.monotonic()))
+            next_send = max(next_send, time.monotonic() - self.interval)
+            if not self.token or not self.pending:
+                continue
+            with self.lock:
+                samples = [self.pending.popleft() for _ in range(min(len(self.pending), MAX_SAMPLES_PER_FRAME))]
+            try:
+                if self.ws is None:
+                    self.ws = websocket.create_connection(
+                        self.url, timeout=self.timeout, header=[f"Authorization: Bearer {self.token}"])
+                    print(f"TelemetryUplink: Connected to {self.url}")
+                    self.backoff = 0.0
+                self.ws.send_binary(pack_frame(samples))
+                self.sent += len(samples)
+            except Exception as e:
+                if self.backoff == 0.0:
+                    print(f"TelemetryUplink: Connection lost ({e}); retrying")
+                self._close()
+                self.backoff = min(self.max_backoff, max(1.0, self.backoff * 2))
+                self._requeue(samples)
+
+    def _requeue(self, samples):
+        # Unsent samples go back in front, unless newer ones already filled the buffer
+        with self.lock:
+            for sample in reversed(samples):
+                if len(self.pending) == self.pending.maxlen:
+                    self.dropped += 1
+                else:
+                    self.pending.appendleft(sample)
+
+    def _close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class LogUploader(threading.Thread):
+    # Single background uploader for DriverMonitor logs.
+    # Samples are batched into one request per interval over a pooled
+    # requests.Session. While the backend is unreachable, batches are appended
+    # to a local spool file (JSON lines) and replayed in order on reconnect.
+    # path/key/single_path select the endpoint, so the same uploader also
+    # carries fatigue events (POST /events/batch {"events": [...]}).
+    # reauth(stale_token) is called on HTTP 401 and returns a fresh token or
+    # None; without one, uploads pause until set_token is called again.
+    def __init__(self, api_url, interval=1.0, spool_path="upload_spool.jsonl",
+                 max_batch=500, max_pending=10000, max_backoff=60.0, timeout=5.0,
+                 path="/logs/upload/batch", key="logs", single_path="/logs/upload",
+                 timer=None, stage="upload", reauth=None):
+        super().__init__(daemon=True)
+        self.api_url = api_url
+        self.timer = timer # Optional StageTimer: records each upload request
+        self.stage = stage
+        self.path = path
+        self.key = key
+        self.single_path = single_path
+        self.interval = interval
+        self.spool_path = spool_path
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.reauth = reauth
+
+        self.token = None
+        self.session = None # Opened on the first send, off the startup path
+
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.spool_lock = threading.Lock()
+        self.spool_size = self._count_spool()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.online = True
+        self.backoff = 0.0
+        self.batch_supported = True # Falls back to single_path on older backends
+
+        self.sent = 0
+        self.spooled = 0
+        self.dropped = 0
+
+    def set_token(self, token):
+        self.token = token
+
+    def submit(self, sample, urgent=False):
+        # urgent: send now instead of on the next interval (while online)
+        if not self.token:
+            return
+        sample = dict(sample)
+        sample.setdefault("timestamp", datetime.utcnow().isoformat())
+        overflow = None
+        with self.lock:
+            self.pending.append(sample)
+            if len(self.pending) > self.max_pending:
+                overflow = [self.pending.popleft() for _ in range(len(self.pending) - self.max_pending)]
+        if overflow:
+            self._spool(overflow)
+        if urgent and self.online:
+            self.wakeup.set()
+
+    def backlog(self):
+        # Samples waiting in memory + lines waiting in the spool file
+        with self.lock:
+            in_memory = len(self.pending)
+        return in_memory + self.spool_size
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def stop(self, flush=True):
+        self.running = False
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(timeout=self.timeout * 2)
+        if flush:
+            # Whatever could not be sent survives in the spool for the next run
+            self._spool(self._take(len(self.pending)))
+        if self.session is not None:
+            self.session.close()
+
+    def _open_session(self):
+        import requests
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(self.interval + self.backoff)
+            self.wakeup.clear()
+            if not self.token:
+                continue
+            if self.session is None:
+                self.session = self._open_session()
+            if self._has_spool() and not self._replay_spool():
+                # Still offline: new samples go behind the spooled ones
+                self._spool(self._take(len(self.pending)))
+                continue
+            while True:
+                batch = self._take(self.max_batch)
+                if not batch:
+                    break
+                t0 = time.perf_counter()
+                unsent = self._send(batch)
+                if self.timer:
+                    self.timer.record(self.stage, time.perf_counter() - t0)
+                if unsent:
+                    self._spool(unsent + self._take(len(self.pending)))
+                    break
+
+    def _has_spool(self):
+        return os.path.exists(self.spool_path) or os.path.exists(self.spool_path + ".replay")
+
+    def _take(self, n):
+        with self.lock:
+            return [self.pending.popleft() for _ in range(min(n, len(self.pending)))]
+
+    def _send(self, batch):
+        # Returns the samples that still need sending (empty on success;
+        # samples the backend rejects as invalid are dropped, not retried)
+        import requests
+        headers = {"Authorization": f"Bearer {self.token}"}
+        done = 0
+        try:
+            if self.batch_supported:
+                res = self.session.post(f"{self.api_url}{self.path}", json={self.key: batch},
+                                        headers=headers, timeout=self.timeout)
+                if res.status_code in (404, 405) and self.single_path:
+                    print("LogUploader: Batch endpoint unavailable, sending logs one by one.")
+                    self.batch_supported = False
+                else:
+                    return self._handle_response(res, batch)
+            for sample in batch:
+                res = self.session.post(f"{self.api_url}{self.single_path}", json=sample,
+                                        headers=headers, timeout=self.timeout)
+                unsent = self._handle_response(res, [sample])
+                if unsent:
+                    return batch[done:]
+                done += 1
+            return []
+        except requests.RequestException as e:
+            self._failed(e)
+            return batch[done:]
+
+    def _handle_response(self, res, batch):
+        if res.status_code == 401:
+            self._unauthorized()
+            return batch
+        if res.status_code >= 500:
+            self._failed(f"HTTP {res.status_code}")
+            return batch
+        if res.status_code >= 400:
+            print(f"LogUploader: Dropping {len(batch)} rejected logs: {res.status_code} {res.text[:200]}")
+            self.dropped += len(batch)
+        else:
+            self.sent += len(batch)
+        if not self.online:
+            print("LogUploader: Backend reachable again.")
+        self.online = True
+        self.backoff = 0.0
+        return []
+
+    def _unauthorized(self):
+        # The access token expired or was revoked: retrying with it never succeeds
+        stale = self.token
+        token = self.reauth(stale) if self.reauth else None
+        if token and token != stale:
+            print("LogUploader: Access token renewed; resending.")
+            self.token = token
+            return
+        print("LogUploader: Error: access token expired or rejected (HTTP 401); "
+              f"uploads paused until the next login, unsent logs kept in {self.spool_path}")
+        self.token = None
+
+    def _failed(self, reason):
+        if self.online:
+            print(f"LogUploader: Upload failed ({reason}); spooling to {self.spool_path}")
+        self.online = False
+        self.backoff = min(self.max_backoff, max(1.0, self.backoff * 2))
+
+    def _spool(self, batch):
+        if not batch:
+            return
+        with self.spool_lock:
+            with open(self.spool_path, "a") as f:
+                for sample in batch:
+                    f.write(json.dumps(sample) + "\n")
+            self.spooled += len(batch)
+            self.spool_size += len(batch)
+
+    def _count_spool(self):
+        count = 0
+        for path in (self.spool_path, self.spool_path + ".replay"):
+            if os.path.exists(path):
+                with open(path) as f:
+                    count += sum(1 for line in f if line.strip())
+        return count
+
+    def _replay_spool(self):
+        # Sends spooled samples oldest first; keeps whatever is left on failure.
+        # Only the uploader thread replays; submit() may still append overflow
+        # meanwhile, so the file is swapped out under the lock first.
+        replay_path = self.spool_path + ".replay"
+        with self.spool_lock:
+            if not os.path.exists(replay_path):
+                os.replace(self.spool_path, replay_path)
+        with open(replay_path) as f:
+            samples = [json.loads(line) for line in f if line.strip()]
+        for start in range(0, len(samples), self.max_batch):
+            unsent = self._send(samples[start:start + self.max_batch])
+            if unsent:
+                remaining = unsent + samples[start + self.max_batch:]
+                with self.spool_lock:
+                    # Put the remainder back in front of anything spooled meanwhile
+                    newer = []
+                    if os.path.exists(self.spool_path):
+                        with open(self.spool_path) as f:
+                            newer = [line for line in f if line.strip()]
+                    with open(self.spool_path, "w") as f:
+                        for sample in remaining:
+                            f.write(json.dumps(sample) + "\n")
+                        f.writelines(newer)
+                    os.remove(replay_path)
+                    self.spool_size = len(remaining) + len(newer)
+                return False
+        with self.spool_lock:
+            os.remove(replay_path)
+            self.spool_size = self._count_spool()
+        if samples:
+            print(f"LogUploader: Replayed {len(samples)} spooled logs.")
+        return True
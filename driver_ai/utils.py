@@ -1,6 +1,38 @@
 import numpy as np
 import cv2
 
+NUM_LANDMARKS = 478 # Face Mesh with refine_landmarks=True
+
+class LandmarkBuffer:
+    # Converts MediaPipe landmarks to pixel coordinates once per frame into a
+    # preallocated float32 array that the face box, EAR/MAR and head pose share.
+    def __init__(self, num_landmarks=NUM_LANDMARKS):
+        self.array = np.zeros((num_landmarks, 2), dtype=np.float32)
+        self.flat = self.array.reshape(-1)
+        self.scale = np.ones(2, dtype=np.float32)
+
+    def update(self, face_landmarks, frame_w, frame_h, offset=None):
+        # frame_w/frame_h: size of the region the landmarks are normalized to;
+        # offset: that region's top-left corner in the full frame (ROI crops)
+        lms = face_landmarks.landmark
+        if len(lms) != len(self.array):
+            self.__init__(len(lms))
+        self.flat[:] = np.fromiter((c for lm in lms for c in (lm.x, lm.y)), dtype=np.float32, count=self.flat.size)
+        self.scale[0] = frame_w
+        self.scale[1] = frame_h
+        np.multiply(self.array, self.scale, out=self.array)
+        if offset is not None:
+            self.array += np.asarray(offset, dtype=np.float32)
+        return self.array
+
+    def face_box(self, frame_w, frame_h):
+        # Same truncation/clamping as the per-landmark loop it replaces
+        x_min, y_min = self.array.min(axis=0)
+        x_max, y_max = self.array.max(axis=0)
+        x_min = min(int(x_min), frame_w); y_min = min(int(y_min), frame_h)
+        x_max = max(int(x_max), 0); y_max = max(int(y_max), 0)
+        return (x_min, y_min, x_max - x_min, y_max - y_min)
+
 def calculate_ear(eye_landmarks):
     # Euclidean distance between vertical eye landmarks
     A = np.linalg.norm(eye_landmarks[1] - eye_landmarks[5])
@@ -27,38 +59,104 @@ def calculate_mar(top, bottom, left, right):
     mar = h / w
     return max(0.0, min(mar, 1.5)) # Clamp to 0.0 - 1.5
 
+# Landmark indices (MediaPipe Face Mesh)
+LEFT_EYE_INDICES = [33, 160, 158, 133, 153, 144]
+RIGHT_EYE_INDICES = [362, 385, 387, 263, 373, 380]
+MOUTH_INDICES = (13, 14, 61, 291) # Top, Bottom, Left, Right
+HEAD_POSE_INDICES = [1, 152, 226, 446, 57, 287]
+
+# 3D model points (constant, shared by every call)
+MODEL_POINTS = np.array([
+    (0.0, 0.0, 0.0),             # Nose tip
+    (0.0, -330.0, -65.0),        # Chin
+    (-225.0, 170.0, -135.0),     # Left eye left corner
+    (225.0, 170.0, -135.0),      # Right eye right corner
+    (-150.0, -150.0, -125.0),    # Left Mouth corner
+    (150.0, -150.0, -125.0)      # Right mouth corner
+])
+MODEL_POINTS.flags.writeable = False
+
+DIST_COEFFS = np.zeros((4,1)) # Assuming no lens distortion
+DIST_COEFFS.flags.writeable = False
+
+_camera_matrices = {}
+
+def get_camera_matrix(frame_h, frame_w):
+    # Camera internals, cached per resolution
+    key = (frame_h, frame_w)
+    camera_matrix = _camera_matrices.get(key)
+    if camera_matrix is None:
+        focal_length = frame_w
+        center = (frame_w/2, frame_h/2)
+        camera_matrix = np.array(
+            [[focal_length, 0, center[0]],
+            [0, focal_length, center[1]],
+            [0, 0, 1]], dtype = "double"
+        )
+        camera_matrix.flags.writeable = False
+        _camera_matrices[key] = camera_matrix
+    return camera_matrix
+
 def get_head_pose(shape, size):
     # 2D image points. If you change the image, you need to change the vector
-    image_points = np.array([
-        shape[1],     # Nose tip
-        shape[152],   # Chin
-        shape[226],   # Left eye left corner
-        shape[446],   # Right eye right corner
-        shape[57],    # Left Mouth corner
-        shape[287]    # Right mouth corner
-    ], dtype="double")
-
-    # 3D model points.
-    model_points = np.array([
-        (0.0, 0.0, 0.0),             # Nose tip
-        (0.0, -330.0, -65.0),        # Chin
-        (-225.0, 170.0, -135.0),     # Left eye left corner
-        (225.0, 170.0, -135.0),      # Right eye right corner
-        (-150.0, -150.0, -125.0),    # Left Mouth corner
-        (150.0, -150.0, -125.0)      # Right mouth corner
-    ])
-
-    # Camera internals
-    focal_length = size[1]
-    center = (size[1]/2, size[0]/2)
-    camera_matrix = np.array(
-        [[focal_length, 0, center[0]],
-        [0, focal_length, center[1]],
-        [0, 0, 1]], dtype = "double"
-    )
-
-    dist_coeffs = np.zeros((4,1)) # Assuming no lens distortion
+    image_points = np.asarray(shape[HEAD_POSE_INDICES], dtype="double")
+
+    camera_matrix = get_camera_matrix(size[0], size[1])
+    dist_coeffs = DIST_COEFFS
     
-    (success, rotation_vector, translation_vector) = cv2.solvePnP(model_points, image_points, camera_matrix, dist_coeffs, flags=cv2.SOLVEPNP_ITERATIVE)
+    (success, rotation_vector, translation_vector) = cv2.solvePnP(MODEL_POINTS, image_points, camera_matrix, dist_coeffs, flags=cv2.SOLVEPNP_ITERATIVE)
 
     return rotation_vector, translation_vector, camera_matrix, dist_coeffs
+
+def rotation_to_angles(rotation_vector):
+    # Pitch, yaw, roll in the same units FatigueEngine thresholds on
+    rmat, _ = cv2.Rodrigues(rotation_vector)
+    angles, _, _, _, _, _ = cv2.RQDecomp3x3(rmat)
+    return angles[0] * 360, angles[1] * 360, angles[2] * 360
+
+# Batched kernels: landmarks is an (N, 478, 2) pixel array, one face per row.
+# Used for offline re-scoring of recorded trips where N is thousands of frames.
+
+def calculate_ear_batch(eye_landmarks):
+    # eye_landmarks: (N, 6, 2) -> (N,)
+    A = np.linalg.norm(eye_landmarks[:, 1] - eye_landmarks[:, 5], axis=-1)
+    B = np.linalg.norm(eye_landmarks[:, 2] - eye_landmarks[:, 4], axis=-1)
+    C = np.linalg.norm(eye_landmarks[:, 0] - eye_landmarks[:, 3], axis=-1)
+
+    valid = C >= 1e-6
+    ear = np.zeros(len(eye_landmarks), dtype=np.float64)
+    np.divide(A + B, 2.0 * C, out=ear, where=valid)
+    return np.clip(ear, 0.0, 0.5)
+
+def calculate_mar_batch(top, bottom, left, right):
+    # Each argument: (N, 2) -> (N,)
+    h = np.linalg.norm(top - bottom, axis=-1)
+    w = np.linalg.norm(left - right, axis=-1)
+
+    valid = w >= 1e-6
+    mar = np.zeros(len(top), dtype=np.float64)
+    np.divide(h, w, out=mar, where=valid)
+    return np.clip(mar, 0.0, 1.5)
+
+def get_head_pose_batch(landmarks, size):
+    # solvePnP has no batched form; the per-frame work left is the solve itself
+    camera_matrix = get_camera_matrix(size[0], size[1])
+    image_points = np.ascontiguousarray(landmarks[:, HEAD_POSE_INDICES], dtype="double")
+    angles = np.empty((len(landmarks), 3), dtype=np.float64)
+    for i in range(len(landmarks)):
+        _, rotation_vector, _ = cv2.solvePnP(MODEL_POINTS, image_points[i], camera_matrix, DIST_COEFFS, flags=cv2.SOLVEPNP_ITERATIVE)
+        angles[i] = rotation_to_angles(rotation_vector)
+    return angles[:, 0], angles[:, 1], angles[:, 2] # pitch, yaw, roll
+
+def compute_metrics_batch(landmarks, size, head_pose=True):
+    landmarks = np.asarray(landmarks)
+    left_ear = calculate_ear_batch(landmarks[:, LEFT_EYE_INDICES])
+    right_ear = calculate_ear_batch(landmarks[:, RIGHT_EYE_INDICES])
+    top, bottom, left, right = MOUTH_INDICES
+    metrics = {
+        "ear": (left_ear + right_ear) / 2.0,
+        "mar": calculate_mar_batch(landmarks[:, top], landmarks[:, bottom], landmarks[:, left], landmarks[:, right]),
+    }
+    if head_pose:
+        metrics["pitch"], metrics["yaw"], metrics["roll"] = get_head_pose_batch(landmarks, size)
+    return metrics
@@ -0,0 +1,104 @@
+import threading
+import time
+import numpy as np
+
+# Startup model loading. MediaPipe, FER (TensorFlow/Keras) and pygame are
+# imported and initialized here, off the import path of detection.py, each on
+# its own thread so the camera opens while they load. Each model also runs one
+# dummy inference, so the first real frame does not pay for graph setup.
+# DriverMonitor serves frames through the fatigue path as soon as Face Mesh
+# is ready; emotion reads "neutral" until FER finishes loading.
+
+
+class ModelLoader:
+    # Named background loads. ready/peek never block; get waits.
+    # parallel=False loads inline, one after another (startup benchmark baseline).
+    def __init__(self, parallel=True):
+        self.parallel = parallel
+        self.started_at = time.perf_counter()
+        self.events = {}
+        self.results = {}
+        self.errors = {}
+        self.times = {} # name -> seconds from loader start until ready (or marked)
+
+    def load(self, name, factory, on_ready=None):
+        event = threading.Event()
+        self.events[name] = event
+
+        def _run():
+            try:
+                value = factory()
+                self.results[name] = value
+                if on_ready:
+                    on_ready(value)
+            except Exception as e:
+                print(f"Warning: {name} initialization failed: {e}")
+                self.errors[name] = e
+            self.times[name] = time.perf_counter() - self.started_at
+            event.set()
+
+        if self.parallel:
+            threading.Thread(target=_run, name=f"load-{name}", daemon=True).start()
+        else:
+            _run()
+
+    def mark(self, name):
+        # Records a milestone (e.g. first frame) once
+        self.times.setdefault(name, time.perf_counter() - self.started_at)
+
+    def ready(self, name):
+        event = self.events.get(name)
+        return event is not None and event.is_set()
+
+    def peek(self, name):
+        return self.results.get(name) if self.ready(name) else None
+
+    def get(self, name, timeout=None):
+        if not self.events[name].wait(timeout):
+            return None
+        return self.results.get(name)
+
+    def wait_all(self, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for event in list(self.events.values()):
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not event.wait(remaining):
+                return False
+        return True
+
+
+def load_face_mesh(roi=False, timer=None, stats=None):
+    # Returns a FaceMesh, or a FaceRoiTracker when roi=True
+    from face_tracker import create_face_mesh, FaceRoiTracker
+    if roi:
+        tracker = FaceRoiTracker(timer=timer, stats=stats)
+        tracker.warm_up()
+        return tracker
+    face_mesh = create_face_mesh()
+    face_mesh.process(np.zeros((480, 640, 3), np.uint8))
+    return face_mesh
+
+
+def load_emotion_model(backend="fer", model_path=None):
+    from emotion_model import EmotionModel
+    model = EmotionModel(backend, model_path)
+    model.warm_up()
+    return model
+
+
+def load_alert_sound():
+    import pygame
+    pygame.mixer.init()
+    sample_rate = 44100
+    duration = 1.0
+    frequency = 440.0
+
+    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    # Generate sine wave
+    tone = np.sin(frequency * t * 2 * np.pi)
+    # Normalize to 16-bit range
+    audio = (tone * 32767).astype(np.int16)
+    # Stereo
+    audio = np.column_stack((audio, audio))
+
+    return pygame.sndarray.make_sound(audio)
@@ -19,11 +19,12 @@ export const Dashboard: React.FC = () => {
     const [data, setData] = useState<LogData | null>(null);
     const [history, setHistory] = useState<any[]>([]);
     const ws = useRef<WebSocket | null>(null);
+    const scoreBeforeAlert = useRef(0); // Latest logged score, restored when an alert ends
 
     useEffect(() => {
         // Fetch initial history
-        axios.get(`${API_URL}/logs/history`).then(res => {
-            setHistory(res.data.slice(-20)); // Limit for chart
+        axios.get(`${API_URL}/logs/history`, { params: { order: "desc", limit: 20 } }).then(res => {
+            setHistory(res.data.reverse()); // Latest 20, oldest first for the chart
         });
 
         // Connect WebSocket
@@ -32,6 +33,16 @@ export const Dashboard: React.FC = () => {
         ws.current.onmessage = (event) => {
             try {
                 const message = JSON.parse(event.data);
+                if (message.type === "event") {
+                    // Fatigue events (start/end) arrive as soon as they happen; only alerts change the live view
+                    if (message.kind === "alert") {
+                        // An alert end clears the alert now rather than at the next heartbeat (up to 30 s later)
+                        const score = message.phase === "start" ? message.score : Math.min(scoreBeforeAlert.current, 80);
+                        setData(prev => ({ emotion: "neutral", drowsy_status: false, ...prev, fatigue_score: score }));
+                    }
+                    return;
+                }
+                scoreBeforeAlert.current = message.fatigue_score ?? 0;
                 // If the message is from the driver (AI Engine), it might be raw or formatted.
                 // Assuming simple structure match
                 setData(message);
@@ -18,17 +18,28 @@ export const FamilyMonitor: React.FC = () => {
     const [liveData, setLiveData] = useState<LogData | null>(null);
     const [history, setHistory] = useState<any[]>([]);
     const ws = useRef<WebSocket | null>(null);
+    const scoreBeforeAlert = useRef(0); // Latest logged score, restored when an alert ends
 
     useEffect(() => {
         // Fetch history
-        axios.get(`${API_URL}/logs/history`).then(res => {
-            setHistory(res.data.slice(-50));
+        axios.get(`${API_URL}/logs/history`, { params: { order: "desc", limit: 50 } }).then(res => {
+            setHistory(res.data.reverse()); // Latest 50, oldest first for the chart
         });
 
         ws.current = new WebSocket(WS_URL);
         ws.current.onmessage = (event) => {
             try {
                 const message = JSON.parse(event.data);
+                if (message.type === "event") {
+                    // Fatigue events (start/end) arrive as soon as they happen; only alerts change the live view
+                    if (message.kind === "alert") {
+                        // An alert end clears the alert now rather than at the next heartbeat (up to 30 s later)
+                        const score = message.phase === "start" ? message.score : Math.min(scoreBeforeAlert.current, 80);
+                        setLiveData(prev => ({ emotion: "neutral", drowsy_status: false, ...prev, fatigue_score: score }));
+                    }
+                    return;
+                }
+                scoreBeforeAlert.current = message.fatigue_score ?? 0;
                 setLiveData(message);
                 setHistory(prev => [...prev.slice(-49), { timestamp: new Date().toLocaleTimeString(), ...message }]);
             } catch (e) { console.error("WS Parse Error", e); }